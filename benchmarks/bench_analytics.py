@@ -0,0 +1,63 @@
+"""
+Benchmark streak reconstruction and rolling adherence over a synthetic multi-million-row history: the per-habit loop
+over get_history that the streak checks used to run, against the columnar analytics engine with NumPy (if installed)
+and with the array fallback.  Loading the columns is timed separately, since one load serves several reports.
+
+Run from the root directory of the project:  python -m benchmarks.bench_analytics [rows]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_indexes import build_database
+from resources import analytics
+from resources.streaks import current_streak, period_key, replay
+
+ROWS = 2_000_000
+
+
+def per_habit_loop(db):
+    """Replay the history of every habit, one get_history query per habit."""
+
+    streaks = {}
+    for name, in db.get_habit_names():
+        interval = db.get_interval(name)
+        checkpoint = replay(sorted(period_key(day, interval) for day in db.get_history(name).dates), interval)
+        streaks[name] = (current_streak(checkpoint, interval), checkpoint[2])
+    return streaks
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(rows: int = ROWS):
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Building a history of {rows} completions...")
+        db = build_database(os.path.join(tmp, "bench.db"), rows)
+
+        expected, seconds = timed(per_habit_loop, db)
+        print(f"{'per-habit loop, streaks':>32} {seconds:>8.2f} s")
+
+        engines = [True, False] if analytics.np is not None else [False]
+        for use_numpy in engines:
+            name = "numpy" if use_numpy else "array"
+            columns, load = timed(analytics.load_columns, db.cursor, use_numpy)
+            streaks, streak_time = timed(analytics.compute_streaks, columns)
+            _, adherence_time = timed(analytics.rolling_adherence, columns, 30, 52)
+
+            assert {habit: streak[:2] for habit, streak in streaks.items()} == expected
+            print(f"{name + ', load columns':>32} {load:>8.2f} s")
+            print(f"{name + ', streaks':>32} {streak_time:>8.2f} s")
+            print(f"{name + ', 52 weeks of adherence':>32} {adherence_time:>8.2f} s")
+
+        if analytics.np is None:
+            print("NumPy is not installed, only the array fallback was measured.")
+        db.close()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
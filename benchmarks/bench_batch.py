@@ -0,0 +1,56 @@
+"""
+Benchmark the throughput of the non-interactive CLI: a batch script completes habits one process at a time with
+complete-task --habit, the way a cron job or shell loop would.  The same completions are then loaded with a single
+import-history call for comparison.
+
+Run from the root directory of the project:  python -m benchmarks.bench_batch [completions]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+TRACKER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tracker.py")
+HABITS = ["Drink Water", "Read", "Exercise", "Meditate", "Walk in Nature"]
+
+
+def tracker(*args, cwd: str, stdin: str = None):
+    subprocess.run([sys.executable, TRACKER, *args], cwd=cwd, input=stdin, text=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+
+def completions(count: int):
+    """(habit name, timestamp) pairs going back in time, one per habit per day."""
+
+    start = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
+    for i in range(count):
+        yield HABITS[i % len(HABITS)], start - timedelta(days=i // len(HABITS))
+
+
+def main(count: int = 100):
+    rows = list(completions(count))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The first run creates the database with the starter habits, which is not part of the benchmark
+        tracker("show-today", cwd=tmp)
+
+        start = time.perf_counter()
+        for habit, timestamp in rows:
+            tracker("complete-task", "--habit", habit, "--at", timestamp.strftime("%Y-%m-%d %H:%M"), cwd=tmp)
+        batch = time.perf_counter() - start
+
+        lines = ["habit_name,completed_date,completed_time"]
+        lines += [f"{habit},{timestamp:%Y-%m-%d},{timestamp:%H:%M}" for habit, timestamp in rows]
+        start = time.perf_counter()
+        tracker("import-history", "-", "--format", "csv", cwd=tmp, stdin="\n".join(lines) + "\n")
+        bulk = time.perf_counter() - start
+
+    print(f"{'method':>24} {'completions':>12} {'seconds':>9} {'completions/s':>14}")
+    print(f"{'complete-task --habit':>24} {count:>12} {batch:>9.2f} {count / batch:>14.1f}")
+    print(f"{'import-history':>24} {count:>12} {bulk:>9.2f} {count / bulk:>14.1f}")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
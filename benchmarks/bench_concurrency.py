@@ -0,0 +1,86 @@
+"""
+Benchmark concurrent complete-task writers against concurrent show-today readers sharing one database file, for each
+of the database durability/performance profiles.
+
+Run from the root directory of the project:  python -m benchmarks.bench_concurrency [writers] [readers] [seconds]
+"""
+import contextlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+from resources.database import PROFILES, DBConn
+from resources.habit import Habit
+
+HABITS = 20
+
+
+def writer(path: str, profile: str, seconds: float):
+    """Complete tasks in a loop; returns the number of completions and the number of 'database is locked' errors."""
+
+    done = errors = 0
+    with DBConn(path, profile=profile) as db, contextlib.redirect_stdout(io.StringIO()):
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            try:
+                db.complete_task(f"Habit {done % HABITS}")
+                done += 1
+            except sqlite3.OperationalError:
+                db.conn.rollback()
+                errors += 1
+    return done, errors, 0.0
+
+
+def reader(path: str, profile: str, seconds: float):
+    """Run the show-today queries in a loop; returns the number of reads, errors and the slowest read in ms."""
+
+    done = errors = 0
+    slowest = 0.0
+    with DBConn(path, profile=profile) as db:
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                db.get_all()
+                db.check_streaks()
+                done += 1
+            except sqlite3.OperationalError:
+                db.conn.rollback()
+                errors += 1
+            slowest = max(slowest, time.perf_counter() - start)
+    return done, errors, slowest * 1000
+
+
+def run(profile: str, writers: int, readers: int, seconds: float):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        with DBConn(path, profile=profile) as db:
+            for i in range(HABITS):
+                db.add_record(Habit(f"Habit {i}", "--", "Daily").details)
+
+        with Pool(writers + readers) as pool:
+            jobs = [pool.apply_async(writer, (path, profile, seconds)) for _ in range(writers)]
+            jobs += [pool.apply_async(reader, (path, profile, seconds)) for _ in range(readers)]
+            results = [job.get() for job in jobs]
+
+    writes = results[:writers]
+    reads = results[writers:]
+    print(f"{profile:>8} {sum(r[0] for r in writes) / seconds:>12.0f} {sum(r[1] for r in writes):>13} "
+          f"{sum(r[0] for r in reads) / seconds:>11.0f} {sum(r[1] for r in reads):>12} "
+          f"{max(r[2] for r in reads):>15.1f}")
+
+
+def main(writers: int = 4, readers: int = 4, seconds: float = 5):
+    print(f"{writers} complete-task writers, {readers} show-today readers, {seconds} seconds per profile")
+    print(f"{'profile':>8} {'writes/sec':>12} {'write errors':>13} {'reads/sec':>11} {'read errors':>12} "
+          f"{'max read (ms)':>15}")
+    for profile in PROFILES:
+        run(profile, writers, readers, seconds)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]), *(float(arg) for arg in sys.argv[3:4]))
@@ -0,0 +1,41 @@
+"""
+Benchmark the per-action cost of opening a new DBConn in every function against using the shared connection from the
+connection manager.  One action mirrors the 'Show Daily' option of analyze-habits, which used to open three
+connections.
+
+Run from the root directory of the project:  python -m benchmarks.bench_connections
+"""
+import os
+import tempfile
+from timeit import timeit
+
+from resources.database import ConnectionManager, DBConn
+from resources.starter import starter_habits
+
+ACTIONS = 500
+
+
+def action(open_db):
+    """Run the queries of one analyze-habits action, asking open_db for a connection the way each function does."""
+
+    open_db().get_interval_habits("Daily")
+    open_db().check_streaks(interval="Daily")
+    open_db().get_longest_streak()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        starter_habits(db_name=path)
+
+        per_function = timeit(lambda: action(lambda: DBConn(path)), number=ACTIONS) / ACTIONS * 1000
+
+        with ConnectionManager() as manager:
+            shared = timeit(lambda: action(lambda: manager.get(path)), number=ACTIONS) / ACTIONS * 1000
+
+    print(f"new connection per function: {per_function:.3f} ms/action")
+    print(f"shared connection:           {shared:.3f} ms/action")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark polling show-today the way a status bar widget does: the tracker command on its own, the tracker command
+with the daemon running, and a widget that sends its requests to the daemon socket itself.
+
+Run from the root directory of the project:  python -m benchmarks.bench_daemon [runs]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from resources.daemon import connect
+
+TRACKER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tracker.py")
+
+
+def tracker(*args, cwd: str):
+    subprocess.run([sys.executable, TRACKER, *args], cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                   check=True)
+
+
+def best_time(function, runs: int):
+    """Best wall-clock time of several runs, in milliseconds."""
+
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(runs: int = 10):
+    with tempfile.TemporaryDirectory() as tmp:
+        # The first run creates the database with the starter habits, which is not part of the benchmark
+        tracker("show-today", cwd=tmp)
+        command = best_time(lambda: tracker("show-today", "--format", "json", cwd=tmp), runs)
+
+        daemon = subprocess.Popen([sys.executable, TRACKER, "serve"], cwd=tmp, stderr=subprocess.DEVNULL)
+        try:
+            socket_path = os.path.join(tmp, "tracker.sock")
+            while not os.path.exists(socket_path):
+                time.sleep(0.05)
+
+            with_daemon = best_time(lambda: tracker("show-today", "--format", "json", cwd=tmp), runs)
+
+            def request():
+                client = connect(socket_path)
+                client.get_all()
+                client.check_streaks()
+                client.close()
+
+            socket_only = best_time(request, runs * 10)
+            connect(socket_path).shutdown()
+            daemon.wait(timeout=10)
+        finally:
+            daemon.kill()
+
+    print(f"{'show-today':>28} {'ms':>8}")
+    print(f"{'tracker command':>28} {command:>8.1f}")
+    print(f"{'tracker command + daemon':>28} {with_daemon:>8.1f}")
+    print(f"{'socket request to daemon':>28} {socket_only:>8.2f}")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,49 @@
+"""
+Benchmark finding the habits that are still due as the number of habits grows: reading every habit and checking every
+streak (get_all and check_streaks, what show-today does) against get_pending, which only reads the pending habits from
+the due index.  A quarter of the habits is pending.
+
+Run from the root directory of the project:  python -m benchmarks.bench_due
+"""
+import os
+import tempfile
+import time
+from datetime import date
+
+from resources.database import DBConn
+
+HABIT_COUNTS = [100, 1_000, 10_000]
+RUNS = 20
+
+
+def measure(db, function):
+    """Best time of a function call in milliseconds, with the habit cache cleared before every run."""
+
+    times = []
+    for _ in range(RUNS):
+        db.habit_cache.invalidate()
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times)
+
+
+def main():
+    today = date.today().toordinal()
+    print(f"{'habits':>8} {'pending':>8} {'get_all + check_streaks (ms)':>29} {'get_pending (ms)':>17}")
+    for habits in HABIT_COUNTS:
+        with tempfile.TemporaryDirectory() as tmp, DBConn(name=os.path.join(tmp, "bench.db")) as db:
+            with db.conn:
+                # Every fourth habit was last completed yesterday, the others today
+                db.conn.executemany("INSERT INTO habits (name, description, interval, created_date, streak_count, "
+                                    "max_streak, last_period) VALUES (?, '--', 'Daily', '2020-01-01 00:00', 1, 1, ?)",
+                                    ((f"Habit {i}", today - (i % 4 == 0)) for i in range(habits)))
+            db.optimize()
+
+            full = measure(db, lambda: (db.get_all(), db.check_streaks()))
+            due = measure(db, db.get_pending)
+            print(f"{habits:>8} {len(db.get_pending()):>8} {full:>29.2f} {due:>17.2f}")
+
+
+if __name__ == '__main__':
+    main()
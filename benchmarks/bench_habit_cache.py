@@ -0,0 +1,54 @@
+"""
+Benchmark the habit metadata reads a command makes (the habit names, the interval and streak of the selected habit and
+all habits), served from the habit cache against reading the habits table every time, as the number of habits grows.
+
+Run from the root directory of the project:  python -m benchmarks.bench_habit_cache
+"""
+import os
+import tempfile
+import time
+
+from resources.cache import HabitCache
+from resources.database import DBConn
+
+HABIT_COUNTS = [10, 100, 1_000]
+COMMANDS = 200
+
+
+def command(db, habit_name: str):
+    """The metadata reads of a complete-task followed by a show-today."""
+
+    db.get_habit_names()
+    db.get_interval(habit_name)
+    db.get_longest_streak(habit_name)
+    db.get_all()
+
+
+def measure(db, habit_name: str, cached: bool):
+    """Average time of one command in microseconds."""
+
+    start = time.perf_counter()
+    for _ in range(COMMANDS):
+        command(db, habit_name)
+        if not cached:
+            db.habit_cache.invalidate()
+    return (time.perf_counter() - start) / COMMANDS * 1_000_000
+
+
+def main():
+    print(f"{'habits':>8} {'uncached (us)':>14} {'cached (us)':>12} {'hit rate':>9}")
+    for habits in HABIT_COUNTS:
+        with tempfile.TemporaryDirectory() as tmp, DBConn(name=os.path.join(tmp, "bench.db")) as db:
+            with db.conn:
+                db.conn.executemany("INSERT INTO habits (name, description, interval, created_date, streak_count, "
+                                    "max_streak) VALUES (?, '--', 'Daily', '2020-01-01 00:00', 0, 0)",
+                                    ((f"Habit {i}",) for i in range(habits)))
+            uncached = measure(db, "Habit 0", cached=False)
+            db.habit_cache = HabitCache()
+            cached = measure(db, "Habit 0", cached=True)
+            info = db.habit_cache.cache_info()
+            print(f"{habits:>8} {uncached:>14.1f} {cached:>12.1f} {info.hits / (info.hits + info.misses):>9.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark show-history on a growing completion history: the time until the first page is on screen with keyset
+pagination, the time to reach the last page, and the time and peak memory of loading and rendering the whole history
+into one table the way show-history used to.
+
+Run from the root directory of the project:  python -m benchmarks.bench_history_pages [rows ...]
+"""
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from rich.console import Console
+
+from benchmarks.bench_indexes import build_database
+from resources.table import create_history_table
+
+SIZES = [10_000, 100_000, 1_000_000]
+PAGE_SIZE = 50
+# Rendering the whole history takes minutes beyond this many rows, so the full table is only measured up to here
+FULL_TABLE_ROWS = 10_000
+
+
+def render(rows: list):
+    """Render a history table to an in-memory console, the same way it is printed to the terminal."""
+
+    Console(file=io.StringIO(), width=100).print(create_history_table(rows=[[str(v) for v in row] for row in rows]))
+
+
+def first_page(db):
+    rows, _ = db.get_history_page(limit=PAGE_SIZE)
+    render(rows)
+
+
+def last_page(db):
+    """Walk through all page keys without rendering; only the final page is rendered."""
+
+    rows, after = db.get_history_page(limit=PAGE_SIZE)
+    while after is not None:
+        rows, after = db.get_history_page(after=after, limit=PAGE_SIZE)
+    render(rows)
+
+
+def full_table(db):
+    render(db.get_all(table_name="tracker"))
+
+
+def measure_time(function, db):
+    """Wall time in milliseconds of a function."""
+
+    start = time.perf_counter()
+    function(db)
+    return (time.perf_counter() - start) * 1000
+
+
+def measure(function, db):
+    """
+    Wall time in milliseconds and peak Python memory in MB of a function.  Tracing memory allocations slows Python
+    down a lot, so the memory is measured in a second, separate run.
+    """
+
+    elapsed = measure_time(function, db)
+
+    tracemalloc.start()
+    function(db)
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(sizes: list):
+    # Render once so the one-off setup of Rich is not counted in the first measurement
+    render([])
+
+    print(f"{'rows':>10} {'first page (ms)':>16} {'MB':>6} {'all pages (ms)':>15} {'full table (ms)':>16} {'MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            db = build_database(os.path.join(tmp, f"bench_{rows}.db"), rows)
+            first, first_memory = measure(first_page, db)
+            line = f"{rows:>10} {first:>16.2f} {first_memory:>6.2f} {measure_time(last_page, db):>15.1f}"
+            if rows <= FULL_TABLE_ROWS:
+                full, full_memory = measure(full_table, db)
+                line += f" {full:>16.1f} {full_memory:>8.1f}"
+            print(line)
+            db.close()
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
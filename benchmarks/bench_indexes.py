@@ -0,0 +1,65 @@
+"""
+Benchmark history lookups on the tracker table as the completion history grows, with and without the composite
+indexes created by the schema migrations.
+
+Run from the root directory of the project:  python -m benchmarks.bench_indexes
+"""
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+from timeit import timeit
+
+from resources.database import DBConn
+
+HABITS = 50
+SIZES = [10_000, 100_000, 1_000_000]
+LOOKUPS = 50
+
+
+def build_database(path: str, rows: int):
+    """Create a database at the given path with the specified number of completions spread over the habits."""
+
+    db = DBConn(path)
+    for i in range(HABITS):
+        db.add_record([f"Habit {i}", "--", "Daily", "2020-01-01 00:00", 0, 0])
+
+    # Every habit is completed once a day, going back in time from today
+    today = date.today()
+    db.bulk_add_history((f"Habit {n % HABITS}", str(today - timedelta(days=n // HABITS)), "12:00",
+                         str((today - timedelta(days=n // HABITS)).isocalendar()[1])) for n in range(rows))
+    return db
+
+
+def time_lookups(db: DBConn):
+    """
+    Average time in milliseconds of the show-today streak check over all habits, and of a single habit's history
+    lookup.  The history lookup returns every completion of the habit, so it grows with the number of rows returned
+    rather than with the size of the table.
+    """
+
+    streaks = timeit(db.check_streaks, number=LOOKUPS) / LOOKUPS * 1000
+    history = timeit(lambda: db.get_history("Habit 0"), number=LOOKUPS) / LOOKUPS * 1000
+    return streaks, history
+
+
+def main(sizes: list):
+    print(f"{'rows':>10} {'streaks indexed':>16} {'streaks scan':>13} {'history indexed':>16} {'history scan':>13}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            path = os.path.join(tmp, f"bench_{rows}.db")
+            db = build_database(path, rows)
+            streaks_indexed, history_indexed = time_lookups(db)
+
+            # Drop the indexes to compare against the original, unindexed schema
+            db.cursor.execute("DROP INDEX idx_tracker_habit_date")
+            db.cursor.execute("DROP INDEX idx_tracker_habit_period")
+            streaks_scan, history_scan = time_lookups(db)
+
+            print(f"{rows:>10} {streaks_indexed:>16.3f} {streaks_scan:>13.3f} "
+                  f"{history_indexed:>16.3f} {history_scan:>13.3f}")
+            del db
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,61 @@
+"""
+Benchmark the maintain command on a synthetic data set (see resources.starter.synthetic_habits): the size of the
+database file and the time of the queries maintain reports, before and after archiving the completions older than a
+year and compacting the database, and how long every step takes.
+
+Run from the root directory of the project:  python -m benchmarks.bench_maintain [habits] [years]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from resources.database import DBConn
+from resources.starter import synthetic_habits
+from tracker import time_queries
+
+KEEP_DAYS = 365
+
+
+def timed(function):
+    """Result and time of a function call, in seconds."""
+
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main(habits: int = 200, years: float = 5):
+    # The cutoff is moved back to a Monday (see DBConn.archive_cutoff), so the history has to reach a week further back
+    if round(years * 365) <= KEEP_DAYS + 6:
+        raise SystemExit(f"A history of {years:g} year(s) doesn't reach past the archive cutoff of {KEEP_DAYS} days; "
+                         f"use more than {(KEEP_DAYS + 6) / 365:.2f} years")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "main.db")
+        completions = synthetic_habits(habits, years, path)
+
+        with DBConn(path) as db:
+            db.optimize()
+            size, before = db.file_size(), time_queries(db)
+
+            archive = os.path.join(tmp, "main.archive.jsonl.gz")
+            cutoff = DBConn.archive_cutoff((date.today() - timedelta(days=KEEP_DAYS)).isoformat())
+            archived, archive_s = timed(lambda: db.archive_history(cutoff, archive))
+            _, optimize_s = timed(db.optimize)
+            after = time_queries(db)
+
+            print(f"{habits} habits, {years:g} years, {completions} completions; archived {archived} from before "
+                  f"{cutoff} in {archive_s:.2f} s, optimized in {optimize_s:.2f} s")
+            print(f"{'':>18} {'before':>12} {'after':>12}")
+            print(f"{'database (KiB)':>18} {size / 1024:>12.0f} {db.file_size() / 1024:>12.0f}")
+            # No archive file is written when nothing was archived
+            archive_size = os.path.getsize(archive) if archived else 0
+            print(f"{'archive (KiB)':>18} {'':>12} {archive_size / 1024:>12.0f}")
+            for name, ms in after.items():
+                print(f"{name + ' (ms)':>18} {before[name]:>12.2f} {ms:>12.2f}")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]), *(float(arg) for arg in sys.argv[2:3]))
@@ -0,0 +1,45 @@
+"""
+Benchmark the analyze-habits reports that read the completion rollups, as the completion history grows.  The time of
+each report should stay about the same, because it only reads the rollups of the periods it shows.  For comparison,
+the last column computes the weekday counts by grouping the tracker table itself.
+
+Run from the root directory of the project:  python -m benchmarks.bench_rollups [rows ...]
+"""
+import os
+import sys
+import tempfile
+from timeit import timeit
+
+from benchmarks.bench_indexes import build_database
+
+SIZES = [10_000, 100_000, 1_000_000]
+RUNS = 20
+
+
+def scan_weekdays(db):
+    db.cursor.execute("SELECT habit_id, strftime('%w', completed_date), count(*) FROM tracker "
+                      "GROUP BY habit_id, strftime('%w', completed_date)")
+    return db.cursor.fetchall()
+
+
+REPORTS = [
+    ("rates by week", lambda db: db.get_completion_rates("week", 8)),
+    ("rates by month", lambda db: db.get_completion_rates("month", 12)),
+    ("weekdays", lambda db: db.get_weekday_counts()),
+    ("streaks", lambda db: db.get_streak_distribution()),
+    ("weekdays (scan)", scan_weekdays),
+]
+
+
+def main(sizes: list):
+    print(f"{'rows':>10} " + " ".join(f"{name + ' (ms)':>20}" for name, _ in REPORTS))
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            db = build_database(os.path.join(tmp, f"bench_{rows}.db"), rows)
+            times = [timeit(lambda: report(db), number=RUNS) / RUNS * 1000 for _, report in REPORTS]
+            print(f"{rows:>10} " + " ".join(f"{ms:>20.2f}" for ms in times))
+            db.close()
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,78 @@
+"""
+Benchmark get_all over a large habits table and a large completion history: the typed rows built by the sqlite3 row
+factories, against the nested lists of strings that get_all used to build with _convert_to_lists.  Reports the time
+and the peak memory allocated by Python for one call.
+
+Run from the root directory of the project:  python -m benchmarks.bench_rows [rows]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.bench_indexes import HABITS, build_database
+
+ROWS = 100_000
+RUNS = 5
+
+
+def convert_to_lists(tuple_list: list):
+    """The string conversion get_all used before the typed rows."""
+
+    return [[str(item) for item in tup] for tup in tuple_list]
+
+
+def lists_habits(db):
+    db.cursor.execute("SELECT name, description, interval, created_date, streak_count, max_streak FROM habits")
+    return convert_to_lists(db.cursor.fetchall())
+
+
+def lists_tracker(db):
+    db.cursor.execute("SELECT t.completed_date, t.completed_time, t.completed_week, h.name FROM tracker t "
+                      "JOIN habits h USING (habit_id) ORDER BY t.completed_date ASC")
+    return convert_to_lists(db.cursor.fetchall())
+
+
+def measure(function, db):
+    """Best time in milliseconds over several runs, and peak Python memory in MB of a separate, traced run."""
+
+    best = float("inf")
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        function(db)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    function(db)
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return best * 1000, peak
+
+
+def main(rows: int = ROWS):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = build_database(os.path.join(tmp, "bench.db"), rows)
+        # Add habits until the habits table has as many rows as the history
+        with db.conn:
+            db.conn.executemany("INSERT INTO habits (name, description, interval, created_date, streak_count, "
+                                "max_streak) VALUES (?, '--', 'Daily', '2020-01-01 00:00', ?, ?)",
+                                ((f"Extra habit {i}", i % 30, i % 60) for i in range(rows - HABITS)))
+
+        benchmarks = [
+            ("habits", lists_habits, lambda db: db.get_all()),
+            ("tracker", lists_tracker, lambda db: db.get_all(table_name="tracker")),
+        ]
+
+        print(f"{'table':>8} {'rows':>8} {'lists (ms)':>11} {'MB':>7} {'typed (ms)':>11} {'MB':>7}")
+        for table, before, after in benchmarks:
+            count = len(after(db))
+            before_time, before_memory = measure(before, db)
+            after_time, after_memory = measure(after, db)
+            print(f"{table:>8} {count:>8} {before_time:>11.1f} {before_memory:>7.1f} "
+                  f"{after_time:>11.1f} {after_memory:>7.1f}")
+        db.close()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,83 @@
+"""
+Benchmark the cold-start time of non-interactive tracker commands, using python -X importtime to see where the import
+time goes.  Fails (exit code 1) if show-today goes over its import time budget or imports the interactive modules.
+
+Run from the root directory of the project:  python -m benchmarks.bench_startup [runs]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+TRACKER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tracker.py")
+COMMANDS = ["show-today", "verify-streaks", "export-history -"]
+
+# Cumulative import time budget for show-today, in milliseconds.  Before imports were made lazy, inquirer alone took
+# about 370 ms to import on every call.
+SHOW_TODAY_BUDGET_MS = 250
+# Modules that only the interactive prompts need
+INTERACTIVE_MODULES = ["inquirer", "resources.menus", "resources.starter"]
+
+
+def import_times(command: str, cwd: str):
+    """
+    Run a tracker command with -X importtime.
+
+    :return: dictionary of top-level module name -> cumulative import time in milliseconds
+    """
+
+    result = subprocess.run([sys.executable, "-X", "importtime", TRACKER, *command.split()], cwd=cwd,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # Top-level imports are not indented
+        if not name.startswith("  "):
+            times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+def wall_time(command: str, cwd: str, runs: int):
+    """Best wall-clock time of several runs of a tracker command, in milliseconds."""
+
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, TRACKER, *command.split()], cwd=cwd,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(runs: int = 5):
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        # The first run creates the database with the starter habits, which is not part of the benchmark
+        subprocess.run([sys.executable, TRACKER, "show-today"], cwd=tmp, stdout=subprocess.DEVNULL, check=True)
+
+        print(f"{'command':>18} {'wall (ms)':>10} {'imports (ms)':>13}  slowest imports")
+        for command in COMMANDS:
+            times = import_times(command, tmp)
+            total = sum(times.values())
+            slowest = ", ".join(f"{name} {ms:.1f}" for name, ms in sorted(times.items(), key=lambda t: -t[1])[:3])
+            print(f"{command:>18} {wall_time(command, tmp, runs):>10.1f} {total:>13.1f}  {slowest}")
+
+            if command == "show-today":
+                loaded = [name for name in INTERACTIVE_MODULES if name in times]
+                if loaded:
+                    print(f"FAIL: show-today imports interactive modules: {', '.join(loaded)}")
+                    failed = True
+                if total > SHOW_TODAY_BUDGET_MS:
+                    print(f"FAIL: show-today imports take {total:.1f} ms, budget is {SHOW_TODAY_BUDGET_MS} ms")
+                    failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:2])))
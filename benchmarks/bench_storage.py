@@ -0,0 +1,72 @@
+"""
+Benchmark the storage engines on the work of a test: set up the starter habits, then add, complete, rename and look up
+habits and page through the history.  Compares a database file (what the tests used to write), a SQLite database in
+memory and the in-memory engine.
+
+Run from the root directory of the project:  python -m benchmarks.bench_storage [runs]
+"""
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+from resources.database import DBConn
+from resources.memory import MemoryStorage
+from resources.starter import starter_habits
+
+
+def workload(db):
+    """The storage calls of a typical test."""
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        starter_habits(storage=db)
+    for i in range(20):
+        db.add_record([f"Habit {i}", "--", "Daily", "2022-01-01 08:00", 0, 0])
+        for day in range(10):
+            db.complete_task(f"Habit {i}", datetime.now() - timedelta(days=day))
+    db.update_record("Habit 0", "name", "Renamed")
+    db.check_streaks()
+    db.get_longest_streak()
+    db.get_interval_habits("Daily")
+    after = None
+    while True:
+        _, after = db.get_history_page(after=after, limit=20)
+        if after is None:
+            break
+    db.recompute_streaks(verify=True)
+
+
+def best_time(open_storage, runs: int):
+    """Best time of the workload on a new storage, in milliseconds."""
+
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        with open_storage() as db:
+            workload(db)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(runs: int = 10):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "test.db")
+
+        def database_file():
+            if os.path.exists(path):
+                os.remove(path)
+            return DBConn(name=path)
+
+        results = [("database file", best_time(database_file, runs)),
+                   ("sqlite :memory:", best_time(lambda: DBConn(name=":memory:"), runs)),
+                   ("memory storage", best_time(MemoryStorage, runs))]
+
+    print(f"{'storage':>16} {'ms':>8} {'speedup':>8}")
+    for name, ms in results:
+        print(f"{name:>16} {ms:>8.2f} {results[0][1] / ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,153 @@
+"""
+Benchmark suite: times the main tracker commands on a synthetic data set of N habits with M years of completions
+(see resources.starter.synthetic_habits) and writes the results as JSON, so runs of different commits can be compared.
+
+The commands run in this process through the click command line, like the tests do, so the times include opening the
+database and formatting the output but not the Python startup (see bench_startup for that).  Every benchmark runs
+several times and the best and median times are kept.
+
+Run from the root directory of the project:
+
+    python -m benchmarks.bench_suite --habits 100 --years 5 --output before.json
+    python -m benchmarks.bench_suite --habits 100 --years 5 --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from click.testing import CliRunner
+
+import tracker
+from resources.database import DBConn
+from resources.starter import synthetic_habits
+
+# Commands of the suite: name -> arguments of tracker.py; {habit} is replaced by the habit of the run
+COMMANDS = {
+    "show-today": ["show-today", "--format", "json"],
+    "show-today-table": ["show-today"],
+    "show-today-pending": ["show-today", "--pending-only", "--format", "json"],
+    "complete-task": ["complete-task", "--habit", "{habit}"],
+    "show-history-page": ["show-history", "--limit", "50", "--format", "json"],
+    "show-history-habit": ["show-history", "--habit", "{habit}", "--format", "csv"],
+    "analyze-longest": ["analyze-habits", "--report", "longest", "--format", "json"],
+    "analyze-rates": ["analyze-habits", "--report", "rates", "--format", "json"],
+    "analyze-weekdays": ["analyze-habits", "--report", "weekdays", "--format", "json"],
+    "analyze-streaks": ["analyze-habits", "--report", "streaks", "--format", "json"],
+    "analyze-adherence": ["analyze-habits", "--report", "adherence", "--format", "json"],
+    "analyze-runs": ["analyze-habits", "--report", "runs", "--format", "json"],
+}
+
+# A benchmark is reported as a regression when its median time grows by more than this factor
+THRESHOLD = 1.2
+
+
+def commit():
+    """Hash of the checked out commit, or None outside a git repository."""
+
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timed(function, runs: int):
+    """Best and median time of several runs of a function, in milliseconds."""
+
+    times = []
+    for run in range(runs):
+        start = time.perf_counter()
+        function(run)
+        times.append((time.perf_counter() - start) * 1000)
+    return {"runs": runs, "best_ms": round(min(times), 3), "median_ms": round(statistics.median(times), 3)}
+
+
+def run_suite(habits: int, years: float, runs: int):
+    """
+    Build the data set in a temporary directory and time every benchmark.
+
+    :return: dictionary of benchmark name -> timings
+    """
+
+    runner = CliRunner(mix_stderr=False)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            start = time.perf_counter()
+            completions = synthetic_habits(habits, years, "main.db")
+            setup = time.perf_counter() - start
+
+            with DBConn("main.db") as db:
+                names = [habit.name for habit in db.get_all()]
+
+            def command(args):
+                def run(number):
+                    # Every run completes another habit, so complete-task always records a new completion
+                    habit = names[number % len(names)]
+                    result = runner.invoke(tracker.cli, [arg.format(habit=habit) for arg in args])
+                    if result.exit_code != 0:
+                        raise RuntimeError(f"'{' '.join(args)}' failed: {result.stderr or result.exception}")
+                return run
+
+            results = {name: timed(command(args), runs) for name, args in COMMANDS.items()}
+
+            with DBConn("main.db") as db:
+                results["get_longest_streak"] = timed(lambda number: db.get_longest_streak(), runs * 10)
+                results["get_longest_streak-habit"] = timed(
+                    lambda number: db.get_longest_streak(names[number % len(names)]), runs * 10)
+        finally:
+            os.chdir(cwd)
+
+    return {"habits": habits, "years": years, "completions": completions, "setup_s": round(setup, 2),
+            "benchmarks": results}
+
+
+def compare(results: dict, baseline: dict):
+    """Print the median times next to the ones of a previous run, flagging regressions."""
+
+    print(f"{'benchmark':>26} {'before (ms)':>12} {'after (ms)':>11} {'change':>8}")
+    for name, timing in results["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            print(f"{name:>26} {'--':>12} {timing['median_ms']:>11.2f}")
+            continue
+        ratio = timing["median_ms"] / before["median_ms"]
+        flag = "  REGRESSION" if ratio > THRESHOLD else ""
+        print(f"{name:>26} {before['median_ms']:>12.2f} {timing['median_ms']:>11.2f} {ratio:>7.2f}x{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--habits", type=int, default=50, help="number of habits (default 50)")
+    parser.add_argument("--years", type=float, default=2, help="years of completions of every habit (default 2)")
+    parser.add_argument("--runs", type=int, default=10, help="runs of every command (default 10)")
+    parser.add_argument("--output", help="file to write the JSON results to; printed when left out")
+    parser.add_argument("--compare", metavar="FILE", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args(argv)
+
+    suite = run_suite(args.habits, args.years, args.runs)
+    results = {"commit": commit(), "date": datetime.now().isoformat(timespec="seconds"),
+               "python": platform.python_version(), "sqlite": sqlite3.sqlite_version, **suite}
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+    elif not args.output:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark printing the whole completion history as a table: time and peak memory of a Rich table over all rows loaded
+with get_all, the way long tables used to be printed, against the plain text table streamed from iter_history that
+show-history writes to a pipe or a file.  Both are written to os.devnull, so the output is not kept in memory.  The
+Rich table takes about a minute for 100k rows, and it is rendered twice per size (for the time and the memory).
+
+Run from the root directory of the project:  python -m benchmarks.bench_tables [rows ...]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import closing
+
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.bench_indexes import build_database
+from resources.table import HISTORY_COLUMNS, PlainTable
+
+SIZES = [10_000, 100_000]
+
+
+def rich_table(db, file):
+    table = Table(title="Task History")
+    for column in HISTORY_COLUMNS:
+        table.add_column(column)
+    for row in db.get_all(table_name="tracker"):
+        table.add_row(*(str(item) for item in row), style='bright_green')
+    Console(file=file, width=100).print(table)
+
+
+def plain_table(db, file):
+    with closing(db.iter_history()) as rows:
+        PlainTable("Task History", HISTORY_COLUMNS, rows).write(file)
+
+
+def measure(function, db, file):
+    """
+    Wall time in seconds and peak Python memory in MB of a function.  Tracing memory allocations slows Python down a
+    lot, so the memory is measured in a second, separate run.
+    """
+
+    start = time.perf_counter()
+    function(db, file)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    function(db, file)
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(sizes: list):
+    print(f"{'rows':>10} {'Rich (s)':>9} {'MB':>8} {'plain (s)':>10} {'MB':>6} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as file:
+        for rows in sizes:
+            db = build_database(os.path.join(tmp, f"bench_{rows}.db"), rows)
+            rich, rich_memory = measure(rich_table, db, file)
+            plain, plain_memory = measure(plain_table, db, file)
+            print(f"{rows:>10} {rich:>9.2f} {rich_memory:>8.1f} {plain:>10.3f} {plain_memory:>6.2f} "
+                  f"{rich / plain:>7.0f}x")
+            db.close()
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
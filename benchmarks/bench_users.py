@@ -0,0 +1,73 @@
+"""
+Benchmark per-user queries as the number of users sharing one database file grows: show-today, a page of history,
+completing a task and the weekly completion rates, each for a random user.  With the user as the first column of
+every key and index, the times should stay flat however many users there are.
+
+Run from the root directory of the project:  python -m benchmarks.bench_users [users ...]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from random import Random
+
+from resources.database import DBConn
+
+USERS = [1, 10, 100, 1_000, 5_000]
+HABITS = 10
+DAYS = 30
+SAMPLES = 200
+
+
+def add_users(db, first: int, last: int):
+    """Add users with HABITS habits each, completed every day of the last DAYS days."""
+
+    today = date.today()
+    for number in range(first, last):
+        db.user = f"user{number}"
+        for habit in range(HABITS):
+            db.add_record([f"Habit {habit}", "--", "Daily", "2020-01-01 00:00", 0, 0])
+        db.bulk_add_history((f"Habit {habit}", str(today - timedelta(days=day)), "08:00", "0")
+                            for day in range(1, DAYS + 1) for habit in range(HABITS))
+
+
+def time_per_user(db, users: int, operation):
+    """Average time in milliseconds of an operation for SAMPLES random users."""
+
+    random = Random(users)
+    total = 0.0
+    for _ in range(SAMPLES):
+        db.user = f"user{random.randrange(users)}"
+        start = time.perf_counter()
+        operation(db)
+        total += time.perf_counter() - start
+    return total / SAMPLES * 1000
+
+
+def show_today(db):
+    db.get_all()
+    db.check_streaks()
+
+
+def main(counts: list):
+    operations = [
+        ("show-today", show_today),
+        ("history page", lambda db: db.get_history_page(limit=20)),
+        ("complete task", lambda db: db.complete_task("Habit 0", datetime.now())),
+        ("weekly rates", lambda db: db.get_completion_rates("week", 4)),
+    ]
+
+    print(f"{'users':>8} {'rows':>10} " + " ".join(f"{name + ' (ms)':>18}" for name, _ in operations))
+    with tempfile.TemporaryDirectory() as tmp, DBConn(os.path.join(tmp, "bench.db"), profile="fast") as db:
+        users = 0
+        for count in sorted(counts):
+            add_users(db, users, count)
+            users = count
+            rows = db.cursor.execute("SELECT count(*) FROM tracker").fetchone()[0]
+            times = [time_per_user(db, users, operation) for _, operation in operations]
+            print(f"{users:>8} {rows:>10} " + " ".join(f"{ms:>18.3f}" for ms in times))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or USERS)
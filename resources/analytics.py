@@ -0,0 +1,338 @@
+from array import array
+from bisect import bisect_right
+from datetime import date, timedelta
+from operator import itemgetter
+from resources.recurrence import recurrence
+from resources.rows import DEFAULT_USER
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; the array fallback gives the same results, only slower
+    np = None
+
+"""
+Analytics engine for long-range reports over the full completion history.
+
+The tracker table is loaded once into columns: the day ordinal of every completion and the id of its habit, sorted by
+habit and date.  With NumPy the reports are computed with vectorized operations over the whole history at once;
+without it the same columns are kept in ``array`` objects and every report makes a single pass over them, which is
+still much faster than querying the history habit by habit.
+
+Streaks are computed on periods numbered by the recurrence rule of the habit (see Recurrence.index), e.g. the days
+since the start of the calendar for Daily habits and the weeks (counted in Mondays) for Weekly habits, so consecutive
+periods always differ by exactly one.  For rules like "3 times per week" only the completions that complete a period
+count.  Habits whose old history was archived continue their streaks from the checkpoint of the archived history.
+"""
+
+# Bits to shift the habit id by to combine it with a period into one sortable key
+KEY_SHIFT = 32
+
+
+def _rule(interval: str):
+    """Recurrence rule of a habit; habits with an interval that is not a rule are counted like Daily habits."""
+
+    return recurrence(interval) or recurrence("Daily")
+
+
+class HistoryColumns:
+    """
+    The completion history as columns, sorted by habit and date.
+
+    names, intervals:  name and interval of every habit, indexed by habit id
+    starts, ends:      the completions of habit id i are at positions starts[i] to ends[i] (exclusive) of the columns
+    habit_ids:         habit id of every completion
+    days:              day ordinal (date.toordinal) of every completion
+    periods:           period of every completion, see Recurrence.index
+    counted:           whether every completion counts for the streak (see resources.streaks), or None if they all do
+    checkpoints:       (last period, run length, longest run, number of runs) of the archived history of every habit,
+                       or None for habits without archived history
+    """
+
+    def __init__(self, names: list, intervals: list, counts: list, days, use_numpy: bool, checkpoints: list = None,
+                 counted=None):
+        self.names = names
+        self.intervals = intervals
+        self.rules = [_rule(interval) for interval in intervals]
+        self.use_numpy = use_numpy
+        self.checkpoints = checkpoints or [None] * len(names)
+
+        self.starts, self.ends = [], []
+        position = 0
+        for count in counts:
+            self.starts.append(position)
+            position += count
+            self.ends.append(position)
+
+        # Only the completions of rules like "3 times per week" can be left out of the streaks
+        if counted is not None and all(rule.target == 1 for rule in self.rules):
+            counted = None
+
+        if use_numpy:
+            self.days = np.asarray(days, dtype=np.int64)
+            self.habit_ids = np.repeat(np.arange(len(names), dtype=np.int64), counts)
+            self.periods = np.empty_like(self.days)
+            for interval in set(intervals):
+                rule = _rule(interval)
+                mask = np.asarray([habit == interval for habit in intervals], dtype=bool)[self.habit_ids]
+                if rule.length == 1:
+                    self.periods[mask] = self.days[mask]
+                elif rule.length:
+                    self.periods[mask] = (self.days[mask] - 1) // rule.length
+                else:
+                    # Periods of different lengths are computed once per distinct day
+                    unique, inverse = np.unique(self.days[mask], return_inverse=True)
+                    indexes = np.asarray([rule.index(day) for day in unique.tolist()], dtype=np.int64)
+                    self.periods[mask] = indexes[inverse]
+            self.counted = None if counted is None else (
+                np.asarray(counted, dtype=bool) | np.asarray([rule.target == 1 for rule in self.rules])[self.habit_ids])
+        else:
+            self.days = days
+            self.habit_ids = array("q")
+            self.periods = array("q")
+            for habit_id, count in enumerate(counts):
+                self.habit_ids.extend(array("q", [habit_id]) * count)
+                segment = days[self.starts[habit_id]:self.ends[habit_id]]
+                rule = self.rules[habit_id]
+                if rule.length == 1:
+                    self.periods.extend(segment)
+                else:
+                    # Recurrence.index of equally long periods, inlined as it is quicker to map
+                    index = (lambda ordinal, length=rule.length: (ordinal - 1) // length) if rule.length else rule.index
+                    self.periods.extend(array("q", map(index, segment)))
+            self.counted = counted
+
+    def __len__(self):
+        return len(self.days)
+
+    def period_of(self, habit_id: int, day: date):
+        """Period of a date for a habit."""
+
+        return self.rules[habit_id].index(day.toordinal())
+
+    def habit_periods(self, habit_id: int):
+        """Sorted periods of the completions of a habit that count for the streak."""
+
+        start, end = self.starts[habit_id], self.ends[habit_id]
+        if self.counted is None or self.rules[habit_id].target == 1:
+            return self.periods[start:end]
+        return [period for period, counted in zip(self.periods[start:end], self.counted[start:end]) if counted]
+
+
+def load_columns(cursor, use_numpy: bool = None, user: str = DEFAULT_USER):
+    """
+    Load the completion history of all habits of a user into columns.
+
+    :param cursor: sqlite3 cursor
+    :param use_numpy: set to False to use the array fallback even if NumPy is installed (optional)
+    :param user: user the habits belong to
+    :return: HistoryColumns
+    """
+
+    use_numpy = np is not None if use_numpy is None else use_numpy and np is not None
+
+    # Habits in the same order as the completions below, which are read in the order of the habit/date index
+    cursor.execute("SELECT h.name, h.interval, count(t.completed_date), c.last_period, c.run_length, c.max_run, c.runs "
+                   "FROM habits h "
+                   "LEFT JOIN history_checkpoints c ON c.habit_id = h.habit_id AND c.interval = h.interval "
+                   "LEFT JOIN tracker t ON t.habit_id = h.habit_id WHERE h.user = :user "
+                   "GROUP BY h.habit_id ORDER BY h.name", {'user': user})
+    habits = cursor.fetchall()
+    names, intervals, counts = ([habit[column] for habit in habits] for column in range(3))
+
+    # The archived streaks count in streak period keys (see resources.streaks), the columns in period numbers
+    checkpoints = [None if last_period is None else
+                   (_rule(interval).index(_rule(interval).start(last_period).toordinal()), *checkpoint)
+                   for _, interval, _, last_period, *checkpoint in habits]
+
+    # The dates are converted to day ordinals by SQLite; julianday('0001-01-01') is ordinal 1.  Only the completions
+    # that count for the streak have a period key, which is only read if a habit has a rule like "3 times per week":
+    # it isn't in the habit/date index, so reading it is slower
+    counts_days = any(_rule(interval).target > 1 for interval in intervals)
+    cursor.execute("SELECT CAST(julianday(t.completed_date) - 1721424.5 AS INTEGER)"
+                   f"{', t.period_key IS NOT NULL' if counts_days else ''} "
+                   "FROM tracker t JOIN habits h USING (habit_id) WHERE h.user = :user "
+                   "ORDER BY h.name, t.completed_date, t.rowid", {'user': user})
+    if counts_days:
+        rows = cursor.fetchall()
+        days, counted = array("q", map(itemgetter(0), rows)), array("b", map(itemgetter(1), rows))
+    else:
+        days, counted = array("q", (day for day, in cursor)), None
+
+    return HistoryColumns(names, intervals, counts, days, use_numpy, checkpoints, counted)
+
+
+def compute_streaks(columns: HistoryColumns, today: date = None):
+    """
+    Reconstruct the streaks of every habit from its full history.
+
+    :param columns: HistoryColumns
+    :param today: date to compute the current streak for (optional); defaults to today
+    :return: dictionary of habit name -> (current streak, longest streak, number of runs)
+    """
+
+    today = today or date.today()
+    current_periods = [columns.period_of(habit_id, today) for habit_id in range(len(columns.names))]
+
+    if columns.use_numpy:
+        current, longest, runs = _streaks_numpy(columns, np.asarray(current_periods, dtype=np.int64))
+    else:
+        current, longest, runs = _streaks_array(columns, current_periods)
+
+    streaks = {name: (int(current[i]), int(longest[i]), int(runs[i])) for i, name in enumerate(columns.names)}
+
+    # Only the recent history of habits with archived history is in the columns, so replay it from the checkpoint
+    for habit_id, checkpoint in enumerate(columns.checkpoints):
+        if checkpoint is not None:
+            streaks[columns.names[habit_id]] = tuple(map(int, _habit_streaks(columns.habit_periods(habit_id),
+                                                                             current_periods[habit_id], checkpoint)))
+
+    return streaks
+
+
+def _habit_streaks(periods, current_period: int, checkpoint: tuple = None):
+    """
+    Current streak, longest streak and number of runs of one habit.
+
+    :param periods: sorted periods of the completions of the habit
+    :param current_period: period of today
+    :param checkpoint: (last period, run length, longest run, number of runs) to continue from (optional)
+    :return: tuple of (current streak, longest streak, number of runs)
+    """
+
+    previous, run, longest, runs = checkpoint or (None, 0, 0, 0)
+    for period in periods:
+        if previous is not None and period <= previous:
+            continue
+        if previous is not None and period == previous + 1:
+            run += 1
+        else:
+            run = 1
+            runs += 1
+        longest = max(longest, run)
+        previous = period
+
+    current = run if previous is not None and previous >= current_period - 1 else 0
+    return current, longest, runs
+
+
+def _streaks_numpy(columns: HistoryColumns, current_periods):
+    habits = len(columns.names)
+    current, longest, runs = (np.zeros(habits, dtype=np.int64) for _ in range(3))
+    if not len(columns):
+        return current, longest, runs
+
+    ids, periods = columns.habit_ids, columns.periods
+    if columns.counted is not None:
+        ids, periods = ids[columns.counted], periods[columns.counted]
+        if not len(ids):
+            return current, longest, runs
+
+    # Only the first completion of a habit in a period counts
+    new_habit = np.ones(len(ids), dtype=bool)
+    new_habit[1:] = ids[1:] != ids[:-1]
+    first_in_period = new_habit.copy()
+    first_in_period[1:] |= periods[1:] != periods[:-1]
+    ids, periods, new_habit = ids[first_in_period], periods[first_in_period], new_habit[first_in_period]
+
+    # A run starts at every habit's first period and after every gap
+    new_run = new_habit.copy()
+    new_run[1:] |= periods[1:] - periods[:-1] != 1
+    run_lengths = np.bincount(np.cumsum(new_run) - 1)
+    run_habits = ids[new_run]
+
+    np.maximum.at(longest, run_habits, run_lengths)
+    runs += np.bincount(run_habits, minlength=habits)
+
+    # The last run of a habit is still going if it reached the current or the previous period
+    last = np.ones(len(run_habits), dtype=bool)
+    last[:-1] = run_habits[1:] != run_habits[:-1]
+    last_habits = run_habits[last]
+    last_periods = periods[np.append(ids[1:] != ids[:-1], True)]
+    going = last_periods >= current_periods[last_habits] - 1
+    current[last_habits] = np.where(going, run_lengths[last], 0)
+
+    return current, longest, runs
+
+
+def _streaks_array(columns: HistoryColumns, current_periods: list):
+    streaks = [_habit_streaks(columns.habit_periods(habit_id), current_period)
+               for habit_id, current_period in enumerate(current_periods)]
+    return tuple(zip(*streaks)) if streaks else ([], [], [])
+
+
+def rolling_adherence(columns: HistoryColumns, window: int = 30, samples: int = 8, today: date = None):
+    """
+    Compute the rolling adherence of every habit: the share of the periods of its rule (e.g. days for Daily habits,
+    weeks for Weekly habits) in the window before a date that the habit was completed in.  The adherence is sampled
+    once a week, ending today.
+
+    :param columns: HistoryColumns
+    :param window: length of the window in days; the whole number of periods (at least one) in it is used, see
+                   Recurrence.periods_in
+    :param samples: number of weeks to sample
+    :param today: last date to sample (optional); defaults to today
+    :return: tuple of (list of sample dates, dictionary of habit name -> list of adherence percentages per sample)
+    """
+
+    today = today or date.today()
+    dates = [today - timedelta(weeks=weeks_ago) for weeks_ago in range(samples - 1, -1, -1)]
+    habits = len(columns.names)
+    windows = [rule.periods_in(window) for rule in columns.rules]
+    ends = [[columns.period_of(habit_id, day) for day in dates] for habit_id in range(habits)]
+
+    if columns.use_numpy:
+        # Combine habit id and period into one key, so all windows are counted with two binary searches.  The columns
+        # are sorted by habit and period already, so duplicates are next to each other.
+        keys = (columns.habit_ids << KEY_SHIFT) + columns.periods
+        if columns.counted is not None:
+            keys = keys[columns.counted]
+        keys = keys[np.append(True, keys[1:] != keys[:-1])] if len(keys) else keys
+        upper = (np.arange(habits, dtype=np.int64)[:, None] << KEY_SHIFT) + np.asarray(ends, dtype=np.int64)
+        lower = upper - np.asarray(windows, dtype=np.int64)[:, None]
+        done = np.searchsorted(keys, upper, side="right") - np.searchsorted(keys, lower, side="right")
+        rates = np.rint(100 * done / np.asarray(windows)[:, None]).astype(np.int64).tolist() if habits else []
+    else:
+        rates = []
+        for habit_id in range(habits):
+            # Distinct periods of the habit, already sorted
+            periods = array("q", sorted(set(columns.habit_periods(habit_id))))
+            done = [bisect_right(periods, upper) - bisect_right(periods, upper - windows[habit_id])
+                    for upper in ends[habit_id]]
+            rates.append([round(100 * count / windows[habit_id]) for count in done])
+
+    return dates, dict(zip(columns.names, rates))
+
+
+def heatmap(columns: HistoryColumns, weeks: int = 12, habit_name: str = None, today: date = None):
+    """
+    Count the completions on every day of the last weeks.
+
+    :param columns: HistoryColumns
+    :param weeks: number of weeks, ending with the current one
+    :param habit_name: only count the completions of this habit (optional); all habits by default
+    :param today: last date to count (optional); defaults to today
+    :return: tuple of (list of the Mondays of the weeks, list of 7 completion counts per week, Monday first)
+    """
+
+    today = today or date.today()
+    first = today - timedelta(days=today.weekday(), weeks=weeks - 1)
+    start, end = first.toordinal(), today.toordinal()
+    habit_ids = range(len(columns.names)) if habit_name is None else [columns.names.index(habit_name)]
+
+    if columns.use_numpy:
+        days = columns.days
+        mask = (days >= start) & (days <= end)
+        if habit_name is not None:
+            mask &= columns.habit_ids == habit_ids[0]
+        counts = np.bincount(days[mask] - start, minlength=weeks * 7).reshape(weeks, 7).tolist()
+    else:
+        flat = [0] * (weeks * 7)
+        for habit_id in habit_ids:
+            # The days of a habit are sorted, so only the days in range are visited
+            position = bisect_right(columns.days, start - 1, columns.starts[habit_id], columns.ends[habit_id])
+            while position < columns.ends[habit_id] and columns.days[position] <= end:
+                flat[columns.days[position] - start] += 1
+                position += 1
+        counts = [flat[week * 7:week * 7 + 7] for week in range(weeks)]
+
+    return [first + timedelta(weeks=week) for week in range(weeks)], counts
@@ -0,0 +1,74 @@
+from typing import NamedTuple
+
+"""
+Read cache for the habits table.
+
+The habits table is small and read by almost every command, often several times, so the whole table is kept in memory
+by name after the first read, together with the habit ids the other tables refer to.  Every write to the table
+invalidates the cache, and DBConn also invalidates it when another connection (e.g. another tracker process) has
+committed changes to the database file in the meantime.
+"""
+
+
+class CacheInfo(NamedTuple):
+    """Cache statistics, like functools.lru_cache.cache_info."""
+
+    hits: int
+    misses: int
+    size: int
+
+
+class HabitCache:
+    """
+    Cache of the rows of the habits table, keyed by habit name.
+    """
+
+    def __init__(self):
+        self._rows = None
+        self._ids = None
+        self.hits = 0
+        self.misses = 0
+
+    def _fill(self, load):
+        if self._rows is None:
+            self.misses += 1
+            habits = load()
+            self._rows = {row.name: row for _, row in habits}
+            self._ids = {row.name: habit_id for habit_id, row in habits}
+        else:
+            self.hits += 1
+
+    def rows(self, load):
+        """
+        Get the cached habit rows, reading them from the database on a miss.
+
+        :param load: function that reads all (habit_id, HabitRow) pairs from the database, in the order they were added
+        :return: dictionary of habit name -> HabitRow, in the order the habits were added
+        """
+
+        self._fill(load)
+        return self._rows
+
+    def ids(self, load):
+        """
+        Get the cached habit ids, reading the habits from the database on a miss.
+
+        :param load: function that reads all (habit_id, HabitRow) pairs from the database, in the order they were added
+        :return: dictionary of habit name -> habit id
+        """
+
+        self._fill(load)
+        return self._ids
+
+    def invalidate(self):
+        """Drop the cached rows, so the next read goes to the database."""
+
+        self._rows = None
+        self._ids = None
+
+    def cache_info(self):
+        """
+        :return: CacheInfo with the number of hits, misses and cached habits
+        """
+
+        return CacheInfo(self.hits, self.misses, len(self._rows) if self._rows is not None else 0)
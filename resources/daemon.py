@@ -0,0 +1,240 @@
+import json
+import os
+import socket
+from datetime import datetime
+from resources.rows import DEFAULT_USER, CompletionRow, HabitRow
+
+"""
+Tracker daemon: a long-running process that keeps the database connection and the habit cache warm, and serves the
+commands that status bars and editor plugins call all the time (show-today, complete-task and show-history) over a
+Unix domain socket.
+
+The protocol is one JSON object per line.  A request names a DBConn method from METHODS, its keyword arguments and the
+user it is for (the default user if left out); the response holds either the result or an error message:
+
+    {"method": "get_habit_names", "args": {}, "user": "alice"}
+    {"result": [["Drink Water"], ["Read"]]}
+
+DaemonClient sends these requests with the same method signatures as DBConn, so the tracker commands work the same on
+a client as on a database connection.  Only this module's standard library imports are needed by the client; asyncio
+is only imported by the daemon itself.
+"""
+
+# Name of the socket file, next to the database in the working directory
+SOCKET_PATH = "tracker.sock"
+
+# DBConn methods the daemon serves
+METHODS = {"get_all", "get_habit_names", "check_streaks", "get_pending", "complete_task", "get_history_page"}
+
+# Seconds the client waits for a response before giving up
+TIMEOUT = 30
+
+# Client shared by all commands of the process, see get_client
+_client = None
+
+
+class DaemonError(Exception):
+    """Raised by the client when the daemon returns an error or goes away."""
+
+
+def _call(db, method: str, args: dict, user: str, shutdown):
+    """Run a request on the database connection; returns the result or raises an exception for errors."""
+
+    if method == "shutdown":
+        return shutdown()
+    if method not in METHODS:
+        raise ValueError(f"Unknown method '{method}'")
+    db.user = user
+    if method == "complete_task" and args.get("date") is not None:
+        args["date"] = datetime.fromisoformat(args["date"])
+    return getattr(db, method)(**args)
+
+
+def respond(db, line: bytes, shutdown=lambda: None):
+    """
+    Answer a single request line.
+
+    :param db: DBConn object
+    :param line: JSON request
+    :param shutdown: function that stops the daemon, called for a shutdown request
+    :return: JSON response line
+    """
+
+    try:
+        request = json.loads(line)
+        response = {"result": _call(db, request["method"], request.get("args", {}), request.get("user", DEFAULT_USER),
+                                    shutdown)}
+    except Exception as e:
+        response = {"error": str(e)}
+    # Named tuples are written as lists; anything else (e.g. an error returned by complete_task) as text
+    return (json.dumps(response, default=str) + "\n").encode()
+
+
+def serve(db, path: str = SOCKET_PATH):
+    """
+    Serve requests on a Unix domain socket until the daemon is stopped with a shutdown request, SIGTERM or Ctrl+C.
+    Requests are answered one at a time on the single database connection, so several clients can be connected at
+    once without sharing the connection between threads.
+
+    :param db: DBConn object
+    :param path: path of the socket file
+    """
+
+    import asyncio
+    import signal
+
+    running = connect(path)
+    if running is not None:
+        running.close()
+        raise DaemonError(f"A tracker daemon is already running on '{path}'.")
+    # A socket file left behind by a daemon that didn't exit cleanly
+    if os.path.exists(path):
+        os.remove(path)
+
+    async def handle(reader, writer):
+        try:
+            while not stop.is_set() and (line := await reader.readline()):
+                writer.write(respond(db, line, stop.set))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def main():
+        server = await asyncio.start_unix_server(handle, path=path)
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        async with server:
+            await stop.wait()
+
+    stop = asyncio.Event()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class DaemonClient:
+    """
+    Connection to a running daemon, with the methods of DBConn that the daemon serves.  Like DBConn, the client acts on
+    the habits of the selected user.
+    """
+
+    def __init__(self, sock: socket.socket, user: str = DEFAULT_USER):
+        self.sock = sock
+        self.file = sock.makefile("rw", encoding="utf-8")
+        self.user = user
+
+    def call(self, method: str, **args):
+        """
+        Send a request to the daemon and wait for the response.
+
+        :param method: name of the method
+        :param args: keyword arguments of the method
+        :return: result of the method, decoded from JSON
+        """
+
+        try:
+            self.file.write(json.dumps({"method": method, "args": args, "user": self.user}) + "\n")
+            self.file.flush()
+            line = self.file.readline()
+        except OSError as e:
+            raise DaemonError(f"Lost the connection to the tracker daemon: {e}") from e
+
+        if not line:
+            raise DaemonError("The tracker daemon closed the connection.")
+        response = json.loads(line)
+        if "error" in response:
+            raise DaemonError(response["error"])
+        return response["result"]
+
+    def get_all(self, table_name: str = "habits", habit_name: str = None):
+        row_type = HabitRow if table_name == "habits" else CompletionRow
+        return [row_type(*row) for row in self.call("get_all", table_name=table_name, habit_name=habit_name)]
+
+    def get_habit_names(self):
+        return [tuple(row) for row in self.call("get_habit_names")]
+
+    def check_streaks(self, interval: str = None):
+        return {name: tuple(status) for name, status in self.call("check_streaks", interval=interval).items()}
+
+    def get_pending(self):
+        return [HabitRow(*row) for row in self.call("get_pending")]
+
+    def complete_task(self, habit_name: str, date: datetime = None):
+        return self.call("complete_task", habit_name=habit_name, date=date and date.isoformat())
+
+    def get_history_page(self, habit_name: str = None, since: str = None, until: str = None, after: tuple = None,
+                         limit: int = 50):
+        rows, next_page = self.call("get_history_page", habit_name=habit_name, since=since, until=until, after=after,
+                                    limit=limit)
+        return [CompletionRow(*row) for row in rows], next_page and tuple(next_page)
+
+    def iter_history(self, habit_name: str = None, since: str = None, until: str = None, page_size: int = 1000):
+        """Iterate over the completions like DBConn.iter_history, fetching them from the daemon a page at a time."""
+
+        after = None
+        while True:
+            rows, after = self.get_history_page(habit_name, since, until, after, page_size)
+            yield from rows
+            if after is None:
+                return
+
+    def shutdown(self):
+        """Stop the daemon."""
+
+        self.call("shutdown")
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+def connect(path: str = SOCKET_PATH):
+    """
+    Connect to the daemon if one is running.
+
+    :param path: path of the socket file
+    :return: DaemonClient, or None if no daemon is running
+    """
+
+    if not os.path.exists(path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(TIMEOUT)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return DaemonClient(sock)
+
+
+def get_client(path: str = SOCKET_PATH, user: str = DEFAULT_USER):
+    """
+    Retrieve the process-wide client of the daemon, connecting on first use.
+
+    :param path: path of the socket file
+    :param user: user to select on the client
+    :return: DaemonClient, or None if no daemon is running
+    """
+
+    global _client
+    if _client is None:
+        _client = connect(path)
+    if _client is not None:
+        _client.user = user
+    return _client
+
+
+def close_client():
+    """Close the process-wide client, if it is connected.  Safe to call more than once."""
+
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
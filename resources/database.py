@@ -1,16 +1,71 @@
+import atexit
+import os
 import sqlite3
-from datetime import datetime
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from itertools import chain, groupby
+from operator import itemgetter
+from resources.cache import HabitCache
+from resources.history import History
+from resources.history_io import append_archive
+from resources.migrations import migrate
+from resources.recurrence import recurrence
+from resources.rollups import STREAK_BUCKETS, UPSERT, count_rollups, last_periods, period_label, rollup_keys
+from resources.rows import DEFAULT_USER, HABIT_FIELDS, CompletionRow, HabitRow, completion_row
+from resources.streaks import advance, count_run, counted_periods, current_streak, period_key, replay_log
+
+# Number of prepared statements kept by each sqlite connection, so repeated queries skip the SQL compile step
+STATEMENT_CACHE_SIZE = 256
+
+# Storage engines the connection manager can hand out, see resources.storage
+STORAGES = ("sqlite", "memory")
+
+# Columns of a CompletionRow, selected from the tracker table t joined with the habits table h
+COMPLETION_COLUMNS = "t.completed_date, t.completed_time, t.completed_week, h.name"
+
+# Durability/performance profiles, applied as sqlite pragmas when a connection is opened.
+#   safe     - rollback journal and a full fsync on every commit (the sqlite defaults)
+#   default  - WAL journal, so readers don't block writers, and an fsync only at checkpoints
+#   fast     - WAL journal without fsyncs; a power loss can lose the last commits, but never corrupts the database
+# cache_size is in KiB when negative, mmap_size is in bytes and busy_timeout is in milliseconds.
+PROFILES = {
+    "safe": {"journal_mode": "DELETE", "synchronous": "FULL", "cache_size": -2000, "mmap_size": 0,
+             "busy_timeout": 5000},
+    "default": {"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -8000, "mmap_size": 64 * 1024 * 1024,
+                "busy_timeout": 5000},
+    "fast": {"journal_mode": "WAL", "synchronous": "OFF", "cache_size": -64000, "mmap_size": 256 * 1024 * 1024,
+             "busy_timeout": 10000},
+}
 
 
 class DBConn:
     """
     This is the class for the Database Connection object that includes functions for all the CRUD operations for the
-    database.
+    database.  Many users can keep their habits in the same database file; all operations act on the habits of the
+    selected user only.
     """
 
-    def __init__(self, name="main.db"):
-        self.conn = sqlite3.connect(name)
+    def __init__(self, name="main.db", profile="default", user=DEFAULT_USER, **pragmas):
+        """
+        :param name: name of the database file
+        :param profile: name of the durability/performance profile from PROFILES
+        :param user: name of the user whose habits are read and changed
+        :param pragmas: individual pragma values overriding the ones from the profile, e.g. synchronous="FULL"
+        """
+
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown database profile '{profile}', expected one of: {', '.join(PROFILES)}")
+
+        self.name = name
+        self.conn = sqlite3.connect(name, cached_statements=STATEMENT_CACHE_SIZE)
         self.cursor = self.conn.cursor()
+        # Habits by name, see _habits; data_version tells when another connection has changed the database
+        self.habit_cache = HabitCache()
+        self._data_version = None
+        self._user = user
+        self._set_pragmas({**PROFILES[profile], **pragmas})
+
         self.cursor.execute("""CREATE TABLE IF NOT EXISTS habits (
                     name TEXT PRIMARY KEY,
                     description TEXT,
@@ -28,11 +83,112 @@ class DBConn:
 
         self.conn.commit()
 
+        # Bring older database files up to the current schema version
+        migrate(self.conn)
+
+        # The history, streaks and rollups of a habit are deleted together with it (see migrations._add_habit_ids).
+        # Foreign keys are only enforced when switched on for every connection, and not while migrating.
+        self.cursor.execute("PRAGMA foreign_keys = ON")
+
     def __del__(self):
         """Method that is automatically called to close the database connection."""
 
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the database connection.  Safe to call more than once."""
+
+        if getattr(self, "conn", None) is None:
+            return
+
         self.cursor.close()
         self.conn.close()
+        self.conn = None
+
+    def _set_pragmas(self, pragmas: dict):
+        """
+        Apply the pragmas of a durability/performance profile to the connection.
+
+        :param pragmas: dictionary of pragma name -> value
+        """
+
+        # The busy timeout goes first, so switching the journal mode waits for other processes instead of failing
+        if "busy_timeout" in pragmas:
+            self.cursor.execute(f"PRAGMA busy_timeout = {int(pragmas['busy_timeout'])}")
+
+        for pragma, value in pragmas.items():
+            if pragma not in ("journal_mode", "synchronous", "cache_size", "mmap_size", "busy_timeout"):
+                raise ValueError(f"Unsupported pragma '{pragma}'")
+            if pragma == "busy_timeout":
+                continue
+            if isinstance(value, str) and not value.isalpha():
+                raise ValueError(f"Invalid value '{value}' for pragma '{pragma}'")
+            if pragma == "journal_mode":
+                self._set_journal_mode(value, pragmas.get("busy_timeout", 0))
+            else:
+                self.cursor.execute(f"PRAGMA {pragma} = {value}")
+
+    def _set_journal_mode(self, mode: str, timeout: int):
+        """
+        Switch the journal mode.  SQLite fails at once instead of waiting for the busy timeout when another connection
+        holds a lock while the mode changes, e.g. when several processes open a new database file at the same time, so
+        the switch is retried until the busy timeout has passed.
+
+        :param mode: journal mode, e.g. WAL
+        :param timeout: busy timeout in milliseconds
+        """
+
+        deadline = time.monotonic() + timeout / 1000
+        while True:
+            try:
+                self.cursor.execute(f"PRAGMA journal_mode = {mode}")
+                return
+            except sqlite3.OperationalError as error:
+                if "locked" not in str(error) or time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.01)
+
+    @property
+    def closed(self):
+        """True once the database connection has been closed."""
+
+        return self.conn is None
+
+    @property
+    def user(self):
+        """Name of the selected user.  Can be changed to act on the habits of another user on the same connection."""
+
+        return self._user
+
+    @user.setter
+    def user(self, user: str):
+        if user != self._user:
+            self._user = user
+            self.habit_cache.invalidate()
+
+    def get_users(self):
+        """
+        Retrieve the names of all users with habits or completions in the database.
+
+        :return: sorted list of user names
+        """
+
+        self.cursor.execute("SELECT DISTINCT user FROM habits ORDER BY user")
+        return [user for user, in self.cursor.fetchall()]
+
+    def delete_user(self):
+        """Delete all habits, completions, streaks and rollups of the selected user."""
+
+        # The foreign keys delete the rest along with the habits
+        self.cursor.execute("DELETE FROM habits WHERE user = :user", {'user': self.user})
+        self.habit_cache.invalidate()
+        self.conn.commit()
 
     def add_record(self, habit_details: list):
         """
@@ -47,140 +203,585 @@ class DBConn:
 
         try:
             self.cursor.execute(
-                "INSERT INTO habits (name, description, interval, created_date, streak_count, max_streak) "
-                "VALUES (:name, :desc, :interval, :created_date, :streak_count, :max_streak)",
-                {'name': habit_name,
+                "INSERT INTO habits (user, name, description, interval, created_date, streak_count, max_streak) "
+                "VALUES (:user, :name, :desc, :interval, :created_date, :streak_count, :max_streak)",
+                {'user': self.user,
+                 'name': habit_name,
                  'desc': habit_desc,
                  'interval': interval,
                  'created_date': created_date,
                  'streak_count': streak_count,
                  'max_streak': max_streak})
+            # Start the streak checkpoint of the new habit
+            self._save_streaks({habit_name: (interval, (None, 0, 0))})
             self.conn.commit()
         except sqlite3.IntegrityError as e:
             return e, "ERROR: Habit already exists with that name!  Try again with a new name."
 
         return f"Habit '{habit_name}' added successfully."
 
-    def add_history(self, habit_name: str, completed_date: str, completed_time: str, completed_week: str):
-        self.cursor.execute("INSERT INTO tracker "
-                            "VALUES (:completed_date, :completed_time, :completed_week, :habit_name)",
-                            {'completed_date': completed_date,
+    def add_history(self, habit_name: str, completed_date: str, completed_time: str, completed_week: str,
+                    once_per_period: bool = False):
+        """
+        Add a completion of a habit to the tracker table and advance the streak of the habit.  The changes are not
+        committed, so several completions can be added in one transaction.
+
+        :param habit_name: name of the habit
+        :param completed_date: date of the completion in the format YYYY-MM-DD
+        :param completed_time: time of the completion in the format HH:MM
+        :param completed_week: ISO week number of the completion
+        :param once_per_period: set to True to skip the completion if the habit was already completed in its period
+        :return: number of rows inserted
+        """
+
+        # Get the id, interval and streak checkpoint of the habit, the history itself is not needed
+        self.cursor.execute("SELECT h.habit_id, h.interval, s.last_period, COALESCE(s.run_length, 0), "
+                            "COALESCE(s.max_run, 0) FROM habits h LEFT JOIN streak_state s USING (habit_id) "
+                            "WHERE h.user = :user AND h.name = :habit_name",
+                            {'habit_name': habit_name, 'user': self.user})
+        row = self.cursor.fetchone()
+        if row is None:
+            raise ValueError(f"Habit '{habit_name}' does not exist.")
+        habit_id, interval, *checkpoint = row
+        rule = recurrence(interval)
+        period = self._period_key(completed_date, interval)
+        rollups = count_rollups([(habit_id, completed_date, 1)])
+
+        if once_per_period and rule is not None and rule.claim is not None:
+            # The rollup of the unit the habit is completed in at most once (its period, or the day for rules like
+            # "3 times per week") is unique per habit, so it is only inserted for the first completion in the unit
+            claim = (habit_id, rule.claim, dict(rollup_keys(completed_date))[rule.claim])
+            self.cursor.execute("INSERT INTO completion_rollups (user, habit_id, kind, period, completions) "
+                                "VALUES (?, ?, ?, ?, 1) ON CONFLICT (user, kind, period, habit_id) DO NOTHING",
+                                (self.user, *claim))
+            if self.cursor.rowcount == 0:
+                return 0
+            del rollups[claim]
+        elif once_per_period and rule is not None:
+            # Periods without a rollup of their own; complete_task holds the write lock, so nobody can add one between
+            self.cursor.execute("SELECT 1 FROM tracker WHERE habit_id = ? AND period_key = ?", (habit_id, period))
+            if self.cursor.fetchone() is not None:
+                return 0
+
+        self.cursor.execute("INSERT INTO tracker (completed_date, completed_time, completed_week, habit_id, "
+                            "period_key, user) "
+                            "VALUES (:completed_date, :completed_time, :completed_week, :habit_id, :period_key, "
+                            ":user)",
+                            {'user': self.user,
+                             'completed_date': completed_date,
                              'completed_time': completed_time,
                              'completed_week': completed_week,
-                             'habit_name': habit_name})
+                             'habit_id': habit_id,
+                             'period_key': period if rule is None or rule.target == 1 else None})
+        inserted, rowid = self.cursor.rowcount, self.cursor.lastrowid
+        self._add_rollups(rollups)
+
+        if rule is not None and rule.target > 1:
+            # The period only counts once the habit was completed on enough different days, and only that completion
+            # gets the period key (see resources.streaks)
+            self.cursor.execute("SELECT count(DISTINCT completed_date), count(period_key) FROM tracker "
+                                "WHERE habit_id = ? AND completed_date BETWEEN ? AND ?",
+                                (habit_id, str(rule.start(period)), str(rule.end(period))))
+            days, counted = self.cursor.fetchone()
+            if days < rule.target or counted:
+                return inserted
+            self.cursor.execute("UPDATE tracker SET period_key = ? WHERE rowid = ?", (period, rowid))
+
+        if period is None:
+            return inserted
+
+        if checkpoint[0] is not None and period < checkpoint[0]:
+            # Completions older than the last one can change any run, so replay the history of the habit
+            self._save_streaks(replay_log(self.cursor, habit_name, self.user))
+        else:
+            self._save_streaks({habit_name: (interval, advance(tuple(checkpoint), period, interval))})
+
+        return inserted
+
+    def bulk_add_history(self, rows):
+        """
+        Add many completions to the tracker table at once, in a single transaction.  The rows are consumed lazily, so
+        a generator can be used to import histories that don't fit in memory.  If any row fails, e.g. because its habit
+        doesn't exist, none are added.
+
+        :param rows: iterable of (habit_name, completed_date, completed_time, completed_week) tuples
+        :return: number of rows inserted
+        """
+
+        # Read the habits before the transaction starts, so they come from the habit cache
+        habits, habit_ids = self._habits(), self._habit_ids()
+        imported = set()
+        dates = Counter()
+
+        def completions():
+            for habit_name, completed_date, completed_time, completed_week in rows:
+                if habit_name not in habits:
+                    raise ValueError(f"Habit '{habit_name}' does not exist.")
+                imported.add(habit_name)
+                habit_id = habit_ids[habit_name]
+                interval = habits[habit_name].interval
+                # Which completions count for rules like "3 times per week" depends on the others, see below
+                rule = recurrence(interval)
+                period = self._period_key(completed_date, interval) if rule is None or rule.target == 1 else None
+                dates[habit_id, completed_date] += 1
+                yield completed_date, completed_time, completed_week, habit_id, period, self.user
+
+        with self.conn:
+            self.cursor.executemany("INSERT INTO tracker (completed_date, completed_time, completed_week, habit_id, "
+                                    "period_key, user) VALUES (?, ?, ?, ?, ?, ?)", completions())
+            inserted = self.cursor.rowcount
+
+            # The rollups are counted per date while the rows are inserted, then added in one go
+            self._add_rollups(count_rollups((*key, count) for key, count in dates.items()))
+
+            # Imported completions can be in any order, so rebuild the streaks of the affected habits from history
+            for habit_name in imported:
+                rule = recurrence(habits[habit_name].interval)
+                if rule is not None and rule.target > 1:
+                    self._rekey_history(habit_name)
+                else:
+                    self._save_streaks(replay_log(self.cursor, habit_name, self.user))
+
+        return inserted
+
+    def _add_rollups(self, counts: dict):
+        """
+        Add completion counts of the selected user to the rollup tables.  The changes are not committed.
+
+        :param counts: dictionary of (habit_id, kind, period) -> number of completions, see rollups.count_rollups
+        """
 
-    def check_streak(self, habit_name: str, completed_date: str, completed_week: str):
+        self.cursor.executemany(UPSERT, [(self.user, *key, completions) for key, completions in counts.items()])
+
+    def _find_interval(self, habit_name: str):
         """
-        Check the streak of a habit and update if necessary.
+        Retrieve the interval of a habit without failing for unknown habits.
 
         :param habit_name: name of the habit
-        :return: None
+        :return: the interval of the habit, or None if the habit doesn't exist
         """
 
-        # Get interval of selected habit
-        habit_interval = self.get_interval(habit_name)
+        habit = self._habits().get(habit_name)
+        return habit.interval if habit is not None else None
 
-        # Check if task was already completed today/this week
-        history = self.get_history(habit_name)
+    @staticmethod
+    def _period_key(completed_date: str, interval: str):
+        """
+        Get the period key of a completion, or None if the interval of the habit has no periods (e.g. unknown habit).
 
-        if habit_interval == "Daily":
-            # Only update streak count if task has not already been completed today
-            if completed_date not in history:
-                print("Updating streak count...")
-                self.update_streak(habit_name)
-        elif habit_interval == "Weekly":
-            # Only update streak count if task has not already been completed this week
-            if completed_week not in history:
-                print("Updating streak count...")
-                self.update_streak(habit_name)
+        :param completed_date: date of the completion in the format YYYY-MM-DD
+        :param interval: interval of the habit
+        :return: period key as an integer or None
+        """
 
-        return
+        if recurrence(interval) is not None:
+            return period_key(completed_date, interval)
+        return None
+
+    def _rekey_history(self, habit_name: str):
+        """
+        Recalculate the period keys of all completions of a habit, e.g. after its interval was changed, and rebuild
+        its streak.  The changes are not committed.
+
+        :param habit_name: name of the habit
+        """
+
+        interval = self._find_interval(habit_name)
+        self.cursor.execute("SELECT rowid, completed_date FROM tracker WHERE habit_id = :habit_id "
+                            "ORDER BY completed_date, rowid", {'habit_id': self._habit_ids().get(habit_name)})
+        rows = self.cursor.fetchall()
+        keys = counted_periods((completed_date for _, completed_date in rows), interval) \
+            if recurrence(interval) is not None else [None] * len(rows)
+        self.cursor.executemany("UPDATE tracker SET period_key = ? WHERE rowid = ?",
+                                [(key, rowid) for key, (rowid, _) in zip(keys, rows)])
+        self._save_streaks(replay_log(self.cursor, habit_name, self.user))
+
+    def _save_streaks(self, states: dict):
+        """
+        Write streak checkpoints to the streak_state table and copy the current/max streak and the last period to the
+        habits table.  The changes are not committed.
+
+        :param states: dictionary of habit name -> (interval, (last_period, run_length, max_run))
+        """
+
+        self.cursor.executemany("INSERT OR REPLACE INTO streak_state (habit_id, last_period, run_length, max_run) "
+                                "SELECT habit_id, ?, ?, ? FROM habits WHERE user = ? AND name = ?",
+                                [(*checkpoint, self.user, name) for name, (_, checkpoint) in states.items()])
+        # The last period is copied to the habits table for the due index, see get_pending
+        self.cursor.executemany("UPDATE habits SET streak_count = ?, max_streak = ?, last_period = ? "
+                                "WHERE user = ? AND name = ?",
+                                [(current_streak(checkpoint, interval), checkpoint[2], checkpoint[0], self.user, name)
+                                 for name, (interval, checkpoint) in states.items()])
+        self.habit_cache.invalidate()
+
+    @staticmethod
+    def _periods(intervals, date: datetime):
+        """
+        Get the current and previous period of every interval.  They only depend on the rule, so they are computed once
+        per interval instead of once per habit.
+
+        :param intervals: iterable of intervals
+        :param date: date to get the periods of
+        :return: dictionary of interval -> (current period, previous period), or None if it is not a recurrence rule
+        """
+
+        periods = {}
+        for interval in intervals:
+            if interval not in periods:
+                rule = recurrence(interval)
+                current = rule.key(date.date()) if rule else None
+                periods[interval] = (current, rule.previous(current)) if rule else None
+        return periods
+
+    def _reset_streaks(self, resets: dict):
+        """
+        Reset the broken streaks in a single statement/transaction; it has one branch per interval, so the number of
+        queries doesn't grow with the number of habits.  A completion since the check keeps the streak.
+
+        :param resets: dictionary of interval -> previous period; the streak of a habit with that interval is broken if
+                       it was last completed before the previous period
+        """
+
+        if not resets:
+            return
+        branches, placeholders = " ".join("WHEN ? THEN ?" for _ in resets), ", ".join("?" * len(resets))
+        self.cursor.execute("UPDATE habits SET streak_count = 0 "
+                            f"WHERE user = ? AND streak_count != 0 AND interval IN ({placeholders}) "
+                            f"AND (last_period IS NULL OR last_period < CASE interval {branches} END)",
+                            (self.user, *resets, *chain.from_iterable(resets.items())))
+        self.habit_cache.invalidate()
+        self.conn.commit()
+
+    def check_streaks(self, interval: str = None, date: datetime = None):
+        """
+        Check the streak of every habit (or only habits of a specified interval) at once and reset the streaks that
+        have been broken.  The number of queries stays the same no matter how many habits are tracked.
+
+        :param interval: only check habits with this interval (optional)
+        :param date: date to check the streaks against (optional); defaults to now
+        :return: dictionary of habit name -> (completed in current period, streak was reset)
+        """
+
+        if date is None:
+            date = datetime.now()
+
+        # Fetch the last completed period of every habit in one query
+        self.cursor.execute("SELECT name, interval, streak_count, last_period FROM habits "
+                            "WHERE user = :user AND (:interval IS NULL OR interval = :interval)",
+                            {'interval': interval, 'user': self.user})
+        habits = self.cursor.fetchall()
+
+        # Set period information, so we can check if task was completed recently and if streak is still going
+        periods = self._periods((habit_interval for _, habit_interval, _, _ in habits), date)
+        status, resets = {}, {}
+        for name, habit_interval, streak_count, last_period in habits:
+            if periods[habit_interval] is None:
+                continue
+
+            current, previous = periods[habit_interval]
+            completed = last_period == current
+            # Streak is broken if the habit has a streak but was completed neither this period nor the last one
+            broken = bool(streak_count) and (last_period is None or last_period < previous)
+            status[name] = (completed, broken)
+            if broken:
+                resets[habit_interval] = previous
+
+        self._reset_streaks(resets)
+        return status
+
+    def get_pending(self, date: datetime = None):
+        """
+        Retrieve the habits that are still due, i.e. not completed in the current period of their interval yet.  They
+        are found with one range search of the due index (see migrations._add_due_index) per interval in a single
+        query, so only the rows of the pending habits are read.  Broken streaks are reset like check_streaks does; only
+        pending habits can have one.
+
+        :param date: date to check against (optional); defaults to now
+        :return: list of HabitRow of the pending habits, in the order they were added
+        """
 
-    def complete_task(self, habit_name: str):
+        if date is None:
+            date = datetime.now()
+
+        self.cursor.execute("SELECT DISTINCT interval FROM habits WHERE user = :user", {'user': self.user})
+        periods = self._periods((interval for interval, in self.cursor.fetchall()), date)
+        if not periods:
+            return []
+
+        # One range search per interval: never completed, or last completed before the current period.  SQLite only
+        # searches the index this way for the parts of a UNION ALL, not for the same terms joined with OR.  Habits whose
+        # interval is not a recurrence rule are never completed, so they are always due
+        select = f"SELECT habit_id, last_period, {HABIT_FIELDS} FROM habits WHERE user = ? AND interval = ?"
+        parts, params = [], []
+        for interval, period in periods.items():
+            if period is None:
+                parts.append(select)
+                params += [self.user, interval]
+            else:
+                parts += [f"{select} AND last_period IS NULL", f"{select} AND last_period < ?"]
+                params += [self.user, interval, self.user, interval, period[0]]
+        self.cursor.execute(" UNION ALL ".join(parts) + " ORDER BY habit_id", params)
+
+        pending, resets = [], {}
+        for _, last_period, *row in self.cursor.fetchall():
+            habit = HabitRow(*row)
+            period = periods[habit.interval]
+            if period is not None and habit.streak_count and (last_period is None or last_period < period[1]):
+                resets[habit.interval] = period[1]
+                habit = habit._replace(streak_count=0)
+            pending.append(habit)
+
+        self._reset_streaks(resets)
+        return pending
+
+    def complete_task(self, habit_name: str, date: datetime = None):
         """
-        Mark a task as complete in the database.
+        Mark a task as complete in the database.  A habit is completed at most once per period of its rule (or
+        once per day for rules like "3 times per week"), so completing it again, e.g. from a second process, changes
+        nothing.
 
         :param habit_name: name of the habit
+        :param date: date and time of the completion (optional); defaults to now
         :return: success/error message from the database operation
         """
 
         # Get current day and week
-        date = datetime.now()
+        if date is None:
+            date = datetime.now()
         completed_date = date.strftime("%Y-%m-%d")
         completed_time = date.strftime("%H:%M")
         completed_week = str(date.isocalendar().week)
 
-        # Check the streak
-        self.check_streak(habit_name, completed_date, completed_week)
-
-        # Add history of completion to the database
+        # Add history of completion to the database, this also updates the streak.  BEGIN IMMEDIATE takes the write
+        # lock before the streak checkpoint is read, so concurrent completions can't overwrite each other's streak.
         try:
-            self.add_history(habit_name, completed_date, completed_time, completed_week)
+            if not self.conn.in_transaction:
+                self.cursor.execute("BEGIN IMMEDIATE")
+            inserted = self.add_history(habit_name, completed_date, completed_time, completed_week,
+                                        once_per_period=True)
+            self.conn.commit()
 
         except Exception as e:
+            self.conn.rollback()
             return e
 
-        self.conn.commit()
-
-        return f"{self.cursor.rowcount} row(s) inserted successfully."
+        if inserted == 0:
+            return f"'{habit_name}' was already completed in this period."
+        return f"{inserted} row(s) inserted successfully."
 
     def delete_record(self, habit_name: str):
         """
-        Delete habit from the database.
+        Delete habit from the database, together with its history, streak and rollups.
 
         :param habit_name: name of habit
         """
 
-        self.cursor.execute("DELETE from habits where name=:habit_name", {'habit_name': habit_name})
+        self.cursor.execute("DELETE from habits where user=:user AND name=:habit_name",
+                            {'habit_name': habit_name, 'user': self.user})
+        self.habit_cache.invalidate()
         self.conn.commit()
 
+    def _load_habits(self):
+        """
+        Read all habits of the selected user from the habits table.
+
+        :return: list of (habit_id, HabitRow), in the order the habits were added
+        """
+
+        self.cursor.execute(f"SELECT habit_id, {HABIT_FIELDS} FROM habits WHERE user = :user ORDER BY habit_id",
+                            {'user': self.user})
+        return [(habit_id, HabitRow(*row)) for habit_id, *row in self.cursor.fetchall()]
+
+    def _cache(self):
+        """
+        Get the habit cache, or None inside a transaction: reads inside a transaction bypass the cache, since they can
+        see changes that are not committed yet and might be rolled back.
+        """
+
+        if self.conn.in_transaction:
+            return None
+
+        # The data version changes whenever another connection commits, e.g. a second tracker process
+        data_version = self.cursor.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self.habit_cache.invalidate()
+            self._data_version = data_version
+
+        return self.habit_cache
+
+    def _habits(self):
+        """
+        Retrieve all rows of the habits table, from the habit cache when possible.
+
+        :return: dictionary of habit name -> HabitRow, in the order the habits were added
+        """
+
+        cache = self._cache()
+        if cache is None:
+            return {row.name: row for _, row in self._load_habits()}
+        return cache.rows(self._load_habits)
+
+    def _habit_ids(self):
+        """
+        Retrieve the ids of all habits, from the habit cache when possible.
+
+        :return: dictionary of habit name -> habit id
+        """
+
+        cache = self._cache()
+        if cache is None:
+            return {row.name: habit_id for habit_id, row in self._load_habits()}
+        return cache.ids(self._load_habits)
+
+    def _fetch_rows(self, row_factory, query: str, params=()):
+        """
+        Run a query on a new cursor that builds typed rows, so the shared cursor keeps returning plain tuples.
+
+        :param row_factory: sqlite3 row factory, e.g. resources.rows.completion_row
+        :param query: SQL query selecting the fields of the row type
+        :param params: parameters of the query
+        :return: list of rows
+        """
+
+        cursor = self.conn.cursor()
+        cursor.row_factory = row_factory
+        try:
+            return cursor.execute(query, params).fetchall()
+        finally:
+            cursor.close()
+
     def get_all(self, table_name: str = "habits", habit_name: str = None):
         """
         Retrieve all habit records from the specified table.
 
-        :param table_name: name of the table from which to retrieve records
+        :param table_name: name of the table from which to retrieve records, habits or tracker
         :param habit_name: name of the habit (optional)
-        :return: nested list of habits/habit information
+        :return: list of HabitRow (habits) or CompletionRow (tracker)
         """
 
-        if habit_name is None:
-            if table_name == "habits":
-                self.cursor.execute("SELECT * FROM habits")
-            elif table_name == "tracker":
-                self.cursor.execute("SELECT * FROM tracker ORDER BY completed_date ASC")
+        if table_name == "habits":
+            habits = self._habits()
+            if habit_name is None:
+                return list(habits.values())
+            # If habit name was specified then only retrieve those records
+            return [habits[habit_name]] if habit_name in habits else []
+
+        elif table_name == "tracker":
+            conditions, params = self._history_filter(habit_name)
+            where = f"WHERE {' AND '.join(conditions)} "
+            return self._fetch_rows(completion_row, f"SELECT {COMPLETION_COLUMNS} FROM tracker t "
+                                                    f"JOIN habits h USING (habit_id) "
+                                                    f"{where}ORDER BY t.completed_date, t.rowid", params)
+
+        raise ValueError(f"Unknown table '{table_name}'")
+
+    def _history_filter(self, habit_name: str = None, since: str = None, until: str = None):
+        """
+        Build the WHERE clause for history queries of the selected user, on the tracker table t.  Only the filters that
+        are set are added to the query, so SQLite can use the tracker indexes for them.
+
+        :param habit_name: name of the habit (optional)
+        :param since: first completed date to include, in the format YYYY-MM-DD (optional)
+        :param until: last completed date to include, in the format YYYY-MM-DD (optional)
+        :return: tuple of (list of SQL conditions, dictionary of parameters)
+        """
+
+        conditions = ["t.user = :user"]
+        if habit_name is not None:
+            conditions.append("t.habit_id = :habit_id")
+        if since is not None:
+            conditions.append("t.completed_date >= :since")
+        if until is not None:
+            conditions.append("t.completed_date <= :until")
+
+        habit_id = self._habit_ids().get(habit_name) if habit_name is not None else None
+        return conditions, {'user': self.user, 'habit_id': habit_id, 'since': since, 'until': until}
 
-        elif habit_name is not None:
-            # If habit name was specified then only retrieve those records from specified table
-            if table_name == "habits":
-                self.cursor.execute("SELECT * FROM habits WHERE name=:habit_name", {'habit_name': habit_name})
-            elif table_name == "tracker":
-                self.cursor.execute("SELECT * FROM tracker WHERE habit_name=:habit_name ORDER BY completed_date ASC",
-                                    {'habit_name': habit_name})
+    def iter_history(self, habit_name: str = None, since: str = None, until: str = None):
+        """
+        Iterate over the completions in the tracker table (oldest first) without loading them all into memory.
+
+        :param habit_name: name of the habit (optional); all habits by default
+        :param since: first completed date to include, in the format YYYY-MM-DD (optional)
+        :param until: last completed date to include, in the format YYYY-MM-DD (optional)
+        :return: generator of CompletionRow
+        """
+
+        conditions, params = self._history_filter(habit_name, since, until)
+        where = f"WHERE {' AND '.join(conditions)} "
+
+        # Use a separate cursor, so other queries can run while the history is being consumed
+        cursor = self.conn.cursor()
+        cursor.row_factory = completion_row
+        try:
+            cursor.execute(f"SELECT {COMPLETION_COLUMNS} FROM tracker t JOIN habits h USING (habit_id) "
+                           f"{where}ORDER BY t.completed_date, t.rowid", params)
+            yield from cursor
+        finally:
+            cursor.close()
+
+    def get_history_page(self, habit_name: str = None, since: str = None, until: str = None, after: tuple = None,
+                         limit: int = 50):
+        """
+        Retrieve one page of completions (oldest first).  Pages are found by their position in the tracker index
+        (keyset pagination) instead of an OFFSET, so every page takes the same time to load, however far into the
+        history it is.
+
+        :param habit_name: name of the habit (optional); all habits by default
+        :param since: first completed date to include, in the format YYYY-MM-DD (optional)
+        :param until: last completed date to include, in the format YYYY-MM-DD (optional)
+        :param after: key returned with the previous page (optional); starts at the first page by default
+        :param limit: maximum number of completions on the page
+        :return: tuple of (list of CompletionRow, key of the next page or None if this is the last page)
+        """
+
+        conditions, params = self._history_filter(habit_name, since, until)
+        if after is not None:
+            # Completions on the same date are ordered by rowid, so the key (completed_date, rowid) is unique
+            conditions.append("(t.completed_date, t.rowid) > (:after_date, :after_rowid)")
+            params.update(after_date=after[0], after_rowid=after[1])
+        where = f"WHERE {' AND '.join(conditions)} "
+
+        # Fetch one extra row to find out if there is another page
+        params['limit'] = limit + 1
+        self.cursor.execute(f"SELECT {COMPLETION_COLUMNS}, t.rowid FROM tracker t JOIN habits h USING (habit_id) "
+                            f"{where}ORDER BY t.completed_date, t.rowid LIMIT :limit", params)
+        rows = self.cursor.fetchall()
+
+        next_page = (rows[limit - 1][0], rows[limit - 1][4]) if len(rows) > limit else None
+        return [CompletionRow(*row[:4]) for row in rows[:limit]], next_page
 
-        records = self._convert_to_lists(self.cursor.fetchall())
+    def get_streak_state(self, habit_name: str):
+        """
+        Retrieve the streak checkpoint of a habit.
+
+        :param habit_name: name of the habit
+        :return: tuple of (last completed period, length of the last run, longest run), or None if never completed
+        """
 
-        return records
+        self.cursor.execute("SELECT last_period, run_length, max_run FROM streak_state WHERE habit_id = :habit_id",
+                            {'habit_id': self._habit_ids().get(habit_name)})
+        return self.cursor.fetchone()
 
     def get_habit_names(self):
         """
         Simple function to retrieve habit names from the habits table.
 
-        :return: raw output of habit names from database
+        :return: list of (name,) tuples, sorted by name
         """
-        self.cursor.execute("SELECT name FROM habits")
-        return self.cursor.fetchall()
+        return [(name,) for name in sorted(self._habits())]
 
     def get_history(self, habit_name: str):
         """
         Retrieve the history of a specific habit.
 
         :param habit_name: name of the habit
-        :return: list of habit information
+        :return: History object with the completed dates and weeks of the habit
         """
 
-        self.cursor.execute("SELECT completed_date, completed_week FROM tracker WHERE habit_name = :habit_name",
-                            {'habit_name': habit_name})
-        return self._convert_to_lists(self.cursor.fetchall(), nested_list=False)
+        self.cursor.execute("SELECT completed_date, completed_week, period_key FROM tracker WHERE habit_id = :habit_id",
+                            {'habit_id': self._habit_ids().get(habit_name)})
+        return History(self.cursor.fetchall())
 
     def get_interval(self, habit_name: str):
         """
@@ -190,34 +791,161 @@ class DBConn:
         :return: the interval of the specified habit
         """
 
-        self.cursor.execute("SELECT interval FROM habits WHERE name = :habit_name", {'habit_name': habit_name})
-        return self._convert_to_lists(self.cursor.fetchall(), nested_list=False)[0]
+        return self._habits()[habit_name].interval
 
     def get_interval_habits(self, interval: str):
         """
         Retrieve only habits that match the specified interval.
 
-        :param interval: interval type, Daily or Weekly
-        :return: nested list of habits matching the specified interval
+        :param interval: interval of the habits, a recurrence rule
+        :return: list of HabitRow matching the specified interval
         """
 
-        self.cursor.execute("SELECT * FROM habits WHERE interval=:interval", {'interval': interval})
-        return self._convert_to_lists(self.cursor.fetchall())
+        return [habit for habit in self._habits().values() if habit.interval == interval]
 
     def get_longest_streak(self, habit_name: str = None):
         """
         Retrieve the habit with the longest streak (default) or the streak information for a habit if specified.
 
         :param habit_name: name of the habit
-        :return: list of habit/streak information
+        :return: HabitRow, or None if there are no habits/the habit doesn't exist
         """
+        habits = self._habits()
         if habit_name is None:
-            self.cursor.execute("SELECT *, max(max_streak) FROM habits")
+            # Ties go to the habit that was added first
+            return max(habits.values(), key=lambda habit: habit.max_streak or 0, default=None)
 
-        else:
-            self.cursor.execute("SELECT * FROM habits WHERE name = :habit_name", {'habit_name': habit_name})
+        return habits.get(habit_name)
+
+    def _read_rollups(self, kind: str, first: int, last: int):
+        """
+        Read one kind of rollup for a range of periods of all habits of the selected user.
+
+        :param kind: kind of rollup, see resources.rollups
+        :param first: first period to include
+        :param last: last period to include
+        :return: list of (habit_name, period, completions) tuples
+        """
+
+        # CROSS JOIN keeps the rollups as the outer loop, so they are read from one range of their primary key.  With
+        # the statistics from ANALYZE (see optimize), SQLite would otherwise read them habit by habit through
+        # idx_rollups_habit, which doesn't hold the completions.
+        self.cursor.execute("SELECT h.name, r.period, r.completions FROM completion_rollups r "
+                            "CROSS JOIN habits h USING (habit_id) "
+                            "WHERE r.user = :user AND r.kind = :kind AND r.period BETWEEN :first AND :last",
+                            {'user': self.user, 'kind': kind, 'first': first, 'last': last})
+        return self.cursor.fetchall()
+
+    def get_completion_rates(self, by: str = "week", periods: int = 8, today: date = None):
+        """
+        Retrieve the number of completions and the completion rate of every habit for each of the last weeks or
+        months, from the rollup tables only.  The rate is the share of the periods of the habit's rule (e.g. days for
+        Daily habits, weeks for Weekly habits) in the week/month that the habit was completed in; a week/month holds the
+        periods that start in it, and a period counts as completed once the habit was completed on as many different
+        days as the rule asks for.  Only the part of the current week/month up to today counts.
+
+        :param by: week or month
+        :param periods: number of weeks/months, ending with the current one
+        :param today: date to report up to (optional); defaults to today
+        :return: list of (habit name, interval, period label, completions, rate in percent) tuples; the rate is None
+                 if no period of the habit has started yet
+        """
+
+        window = last_periods(by, periods, today)
+        first_day, last_day = window[0][1], window[-1][2]
+        habits = self.cursor.execute("SELECT name, interval FROM habits WHERE user = :user ORDER BY habit_id",
+                                     {'user': self.user}).fetchall()
+        rules = {interval: rule for interval in set(dict(habits).values())
+                 if (rule := recurrence(interval)) is not None}
+
+        # Map the periods of every rule that start in the window to the week/month they start in, and count the periods
+        # in each week/month
+        index_of, expected = {}, {}
+        for interval, rule in rules.items():
+            index_of[interval] = {}
+            for index, (_, first, last) in enumerate(window):
+                key = rule.key(first)
+                if rule.start(key) < first:
+                    key = rule.next(key)
+                while rule.start(key) <= last:
+                    index_of[interval][key] = index
+                    key = rule.next(key)
+            expected[interval] = Counter(index_of[interval].values())
+
+        # The periods of Daily and Weekly habits are the day and week rollups themselves, so every rollup is a completed
+        # period.  The other rules count the days with a completion in every period, up to the end of the last period
+        # that starts in the window; the period of every day is computed once per rule
+        intervals = dict(habits)
+        by_day = {interval: rule for interval, rule in rules.items() if interval not in ("Daily", "Weekly")}
+        last_end = max([rule.end(rule.key(last_day)) for rule in by_day.values()] + [last_day])
+        ordinals = range(first_day.toordinal(), last_end.toordinal() + 1)
+        key_of = {interval: {ordinal: rule.key(date.fromordinal(ordinal)) for ordinal in ordinals}
+                  for interval, rule in by_day.items()}
+
+        done, days = Counter(), Counter()
+        index_of_day, index_of_week = index_of.get("Daily", {}), index_of.get("Weekly", {})
+        for habit_name, ordinal, _ in self._read_rollups("day", ordinals[0], ordinals[-1]):
+            interval = intervals.get(habit_name)
+            if interval == "Daily" and ordinal in index_of_day:
+                done[habit_name, index_of_day[ordinal]] += 1
+            elif interval in key_of:
+                days[habit_name, key_of[interval][ordinal]] += 1
+        if index_of_week:
+            for habit_name, week, _ in self._read_rollups("week", min(index_of_week), max(index_of_week)):
+                if intervals.get(habit_name) == "Weekly" and week in index_of_week:
+                    done[habit_name, index_of_week[week]] += 1
+
+        for (habit_name, key), count in days.items():
+            interval = intervals[habit_name]
+            if key in index_of[interval] and count >= rules[interval].target:
+                done[habit_name, index_of[interval][key]] += 1
+
+        completions = {(habit_name, period): count
+                       for habit_name, period, count in self._read_rollups(by, window[0][0], window[-1][0])}
+
+        rates = []
+        for name, interval in habits:
+            for index, (key, _, _) in enumerate(window):
+                total = expected.get(interval, {}).get(index, 0)
+                rate = round(100 * done[name, index] / total) if total else None
+                rates.append((name, interval, period_label(key, by), completions.get((name, key), 0), rate))
+
+        return rates
+
+    def get_weekday_counts(self):
+        """
+        Retrieve the number of completions of every habit on each day of the week, from the rollup tables only.
 
-        return self._convert_to_lists(self.cursor.fetchall(), nested_list=False)
+        :return: dictionary of habit name -> list of 7 completion counts, Monday first
+        """
+
+        self.cursor.execute("SELECT name FROM habits WHERE user = :user ORDER BY habit_id", {'user': self.user})
+        counts = {name: [0] * 7 for name, in self.cursor.fetchall()}
+        for habit_name, weekday, completions in self._read_rollups("weekday", 0, 6):
+            if habit_name in counts:
+                counts[habit_name][weekday] = completions
+
+        return counts
+
+    def get_streak_distribution(self):
+        """
+        Count how many habits have a current and longest streak of each length, grouped in STREAK_BUCKETS.  Reads the
+        streaks kept in the habits table, so call check_streaks first to reset broken streaks.
+
+        :return: list of (lowest streak, highest streak or None, habits with a current streak in the range, habits with
+                 a longest streak in the range) tuples
+        """
+
+        distribution = []
+        for low, high in STREAK_BUCKETS:
+            self.cursor.execute("SELECT "
+                                "sum(streak_count BETWEEN :low AND :high), sum(max_streak BETWEEN :low AND :high) "
+                                "FROM habits WHERE user = :user",
+                                {'user': self.user, 'low': low, 'high': high if high is not None else 2 ** 62})
+            current, longest = self.cursor.fetchone()
+            distribution.append((low, high, current or 0, longest or 0))
+
+        return distribution
 
     def update_record(self, habit_name: str, attr_to_update: str, update_value: str):
         """
@@ -227,25 +955,75 @@ class DBConn:
         :param attr_to_update: attribute of habit to update; 'name', 'description', 'interval' are supported options.
         :param update_value: new value to set on attribute
         :return: success/fail message from database operation
+        :raises ValueError: when renaming the habit to the name of another habit
         """
 
+        params = {'update_value': update_value, 'habit_name': habit_name, 'user': self.user}
+        updated = 0
+
         if attr_to_update == "name":
-            self.cursor.execute("UPDATE habits SET name= :update_value WHERE name =:habit_name",
-                                {'update_value': update_value, 'habit_name': habit_name})
+            try:
+                self.cursor.execute("UPDATE habits SET name= :update_value WHERE user = :user AND name =:habit_name",
+                                    params)
+            except sqlite3.IntegrityError as e:
+                # The same exception as the other storage engines, see resources.storage
+                self.conn.rollback()
+                raise ValueError(f"Habit '{update_value}' already exists.") from e
+            # The history, streak and rollups refer to the habit id, so they stay with the habit
+            updated = self.cursor.rowcount
 
         if attr_to_update == "description":
-            self.cursor.execute("UPDATE habits SET description= :update_value WHERE name =:habit_name",
-                                {'update_value': update_value, 'habit_name': habit_name})
+            self.cursor.execute("UPDATE habits SET description= :update_value WHERE user = :user AND name =:habit_name",
+                                params)
+            updated = self.cursor.rowcount
 
         if attr_to_update == "interval":
-            self.cursor.execute("UPDATE habits SET interval= :update_value WHERE name =:habit_name",
-                                {'update_value': update_value, 'habit_name': habit_name})
-
+            self.cursor.execute("UPDATE habits SET interval= :update_value WHERE user = :user AND name =:habit_name",
+                                params)
+            updated = self.cursor.rowcount
+            # Periods are different for the new interval, so the history and streak have to be rebuilt
+            if updated:
+                self._rekey_history(habit_name)
+
+        self.habit_cache.invalidate()
         self.conn.commit()
-        if self.cursor.rowcount == 0:
+        if updated == 0:
             return "No records updated.  Check for programming errors in SQL query."
         else:
-            return f"Updated {self.cursor.rowcount} record(s) successfully."
+            return f"Updated {updated} record(s) successfully."
+
+    def recompute_streaks(self, habit_name: str = None, verify: bool = False):
+        """
+        Rebuild the streaks of all habits (or a single habit) by replaying the full completion history.  In verify mode
+        nothing is written and the habits whose stored streak differs from the history are returned instead.
+
+        :param habit_name: name of the habit (optional)
+        :param verify: set to True to only compare the stored streaks with the history
+        :return: list of names of the habits whose stored streak was wrong
+        """
+
+        states = replay_log(self.cursor, habit_name, self.user)
+
+        self.cursor.execute("SELECT h.name, s.last_period, COALESCE(s.run_length, 0), COALESCE(s.max_run, 0), "
+                            "h.streak_count, h.max_streak "
+                            "FROM habits h LEFT JOIN streak_state s USING (habit_id) "
+                            "WHERE h.user = :user AND (:habit_name IS NULL OR h.name = :habit_name)",
+                            {'habit_name': habit_name, 'user': self.user})
+        stored = {row[0]: (tuple(row[1:4]), tuple(row[4:])) for row in self.cursor.fetchall()}
+
+        mismatches = []
+        for name, (interval, checkpoint) in states.items():
+            if recurrence(interval) is None:
+                continue
+            expected = (checkpoint, (current_streak(checkpoint, interval), checkpoint[2]))
+            if stored.get(name) != expected:
+                mismatches.append(name)
+
+        if not verify:
+            self._save_streaks(states)
+            self.conn.commit()
+
+        return mismatches
 
     def update_streak(self, habit_name: str, reset_streak: bool = False):
         """
@@ -257,34 +1035,213 @@ class DBConn:
         """
 
         if reset_streak:
-            self.cursor.execute("UPDATE habits SET streak_count = 0 WHERE name =:habit_name",
-                                {'habit_name': habit_name})
+            self.cursor.execute("UPDATE habits SET streak_count = 0 WHERE user = :user AND name =:habit_name",
+                                {'habit_name': habit_name, 'user': self.user})
+            self.habit_cache.invalidate()
             self.conn.commit()
             return f"Streak Count reset for habit: {habit_name} !"
 
-        self.cursor.execute("SELECT streak_count, max_streak FROM habits WHERE name = :habit_name",
-                            {'habit_name': habit_name})
-        streak_list = self._convert_to_lists(self.cursor.fetchall(), nested_list=False)
-        streak_count = streak_list[0] + 1
-        max_streak = streak_count if streak_count > streak_list[1] else streak_list[1]
+        self.cursor.execute("SELECT streak_count, max_streak FROM habits WHERE user = :user AND name = :habit_name",
+                            {'habit_name': habit_name, 'user': self.user})
+        streak_count, max_streak = self.cursor.fetchone()
+        streak_count += 1
+        max_streak = max(streak_count, max_streak)
         self.cursor.execute("UPDATE habits SET streak_count = :streak_count, max_streak = :max_streak "
-                            "WHERE name =:habit_name", {"streak_count": streak_count,
-                                                        "max_streak": max_streak,
-                                                        "habit_name": habit_name})
+                            "WHERE user = :user AND name =:habit_name", {"streak_count": streak_count,
+                                                                         "max_streak": max_streak,
+                                                                         "habit_name": habit_name,
+                                                                         "user": self.user})
+        self.habit_cache.invalidate()
         self.conn.commit()
         return
 
     @staticmethod
-    def _convert_to_lists(tuple_list: list, nested_list: bool = True):
+    def archive_cutoff(before: str):
         """
-        Static method used to convert the database output to an easier-to-use list format.
+        Get the date archive_history archives the completions before: the Monday of the week of a date, so no week is
+        split between the archive and the tracker table; the days of a week only count together for rules like "3 times
+        per week".
 
-        :param tuple_list: list of tuples (output from database fetch* operations)
-        :param nested_list: boolean set to True by default; set to False if a plain list is needed instead
-        :return: nested list(default) or list
+        :param before: date in the format YYYY-MM-DD
+        :return: date of the Monday in the format YYYY-MM-DD
         """
 
-        if nested_list:
-            return [[str(item) for item in tup] for tup in tuple_list]
-        else:
-            return [item for tup in tuple_list for item in tup]
+        day = date.fromisoformat(before)
+        return (day - timedelta(days=day.weekday())).isoformat()
+
+    def archive_history(self, before: str, filename: str):
+        """
+        Move the completions of all users before a date from the tracker table to a compressed archive file.  They are
+        folded into the history checkpoints of their habits first, so the streaks replayed from the rest of the history
+        (verify-streaks and the runs report) stay the same; the completion rollups are kept as they are.  The archive
+        is synced to disk before the completions are deleted, so a crash in between can leave a completion in both
+        places, but never in neither.
+
+        :param before: date in the format YYYY-MM-DD; the completions before the Monday of its week are archived (see
+                       archive_cutoff)
+        :param filename: name of the archive file, see history_io.append_archive
+        :return: number of archived completions
+        """
+
+        before = self.archive_cutoff(before)
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            # The checkpoints are kept for Daily, Weekly and the current rule of every habit, so they stay right when
+            # the interval of a habit is changed to one of them
+            self.cursor.execute("SELECT habit_id, interval, last_period, run_length, max_run, runs, completions "
+                                "FROM history_checkpoints")
+            checkpoints = {(habit_id, interval): (tuple(checkpoint), runs, completions)
+                           for habit_id, interval, *checkpoint, runs, completions in self.cursor.fetchall()}
+            intervals = dict(self.cursor.execute("SELECT habit_id, interval FROM habits").fetchall())
+            changed = set()
+
+            def archived(rows):
+                for habit_id, habit_rows in groupby(rows, key=itemgetter(1)):
+                    habit_rows = list(habit_rows)
+                    yield from habit_rows
+                    days = [date.fromisoformat(row[2]) for row in habit_rows]
+                    rules = {"Daily", "Weekly"} | ({intervals[habit_id]} if recurrence(intervals[habit_id]) else set())
+                    for interval in rules:
+                        checkpoint, runs, completions = checkpoints.get((habit_id, interval), ((None, 0, 0), 0, 0))
+                        for period in counted_periods(days, interval):
+                            if period is not None:
+                                checkpoint, runs = count_run(checkpoint, runs, period, interval)
+                        checkpoints[habit_id, interval] = (checkpoint, runs, completions + len(days))
+                        changed.add((habit_id, interval))
+
+            # In the order of the habit/date index, so the completions of every habit are folded in date order
+            rows = self.cursor.execute("SELECT t.user, t.habit_id, t.completed_date, t.completed_time, "
+                                       "t.completed_week, h.name FROM tracker t JOIN habits h USING (habit_id) "
+                                       "WHERE t.completed_date < :before ORDER BY t.habit_id, t.completed_date",
+                                       {'before': before})
+            first = rows.fetchone()
+            if first is None:
+                self.conn.commit()
+                return 0
+            count = append_archive(filename, archived(chain([first], rows)))
+
+            self.cursor.executemany("INSERT OR REPLACE INTO history_checkpoints (habit_id, interval, last_period, "
+                                    "run_length, max_run, runs, completions) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    [(*key, *checkpoints[key][0], *checkpoints[key][1:]) for key in changed])
+            self.cursor.execute("DELETE FROM tracker WHERE completed_date < :before "
+                                "AND habit_id IN (SELECT habit_id FROM habits)", {'before': before})
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        return count
+
+    def purge_orphans(self):
+        """
+        Delete the completions, streaks, rollups and history checkpoints of habits that no longer exist.  The foreign
+        keys delete them together with their habit, but not when the database was changed with foreign keys switched
+        off, e.g. from the sqlite3 shell.
+
+        :return: number of deleted rows
+        """
+
+        deleted = 0
+        with self.conn:
+            for table in ("tracker", "streak_state", "completion_rollups", "history_checkpoints"):
+                self.cursor.execute(f"DELETE FROM {table} WHERE habit_id NOT IN (SELECT habit_id FROM habits)")
+                deleted += self.cursor.rowcount
+        return deleted
+
+    def optimize(self):
+        """
+        Compact the database file and refresh the statistics of the query planner: VACUUM rebuilds the file without the
+        free pages that deleted rows leave behind, ANALYZE and PRAGMA optimize update the statistics the query planner
+        picks indexes with.  VACUUM rewrites the whole file, so it needs as much free disk space as the database.
+        """
+
+        self.conn.commit()
+        self.cursor.execute("VACUUM")
+        self.cursor.execute("ANALYZE")
+        self.cursor.execute("PRAGMA optimize")
+        # With a WAL journal the rebuilt pages are written to the WAL first, so copy them into the database file
+        self.cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def file_size(self):
+        """
+        Size of the database on disk.
+
+        :return: size of the database file and its WAL journal in bytes
+        """
+
+        return sum(os.path.getsize(name) for name in (self.name, self.name + "-wal") if os.path.exists(name))
+
+
+class ConnectionManager:
+    """
+    Hands out a single shared DBConn per database file for the whole process, so the connection, the schema checks
+    and the prepared statements are reused across commands.  Can be used as a context manager to close all
+    connections deterministically when leaving the block.  With the memory storage it hands out a MemoryStorage per
+    name instead, so nothing is read from or written to the database file.
+    """
+
+    def __init__(self, profile: str = "default", user: str = DEFAULT_USER, storage: str = "sqlite"):
+        """
+        :param profile: durability/performance profile used for the connections, see PROFILES
+        :param user: user selected on the connections
+        :param storage: storage engine of the connections, see STORAGES
+        """
+
+        self.profile = profile
+        self.user = user
+        self.storage = storage
+        self._connections = {}
+        self._pid = os.getpid()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, name: str = "main.db"):
+        """
+        Retrieve the shared connection to a database, opening it on first use.
+
+        :param name: name of the database file
+        :return: DBConn object, or MemoryStorage with the memory storage
+        """
+
+        # Connections must not be shared with a forked child process, so start over with a fresh pool
+        if self._pid != os.getpid():
+            self._connections = {}
+            self._pid = os.getpid()
+
+        db = self._connections.get(name)
+        if db is None or db.closed:
+            if self.storage == "memory":
+                # Only sessions with the memory storage load it, so it doesn't add to the startup of every command
+                from resources.memory import MemoryStorage
+                db = self._connections[name] = MemoryStorage(user=self.user)
+            else:
+                db = self._connections[name] = DBConn(name, profile=self.profile, user=self.user)
+        db.user = self.user
+
+        return db
+
+    def close(self):
+        """Close all the connections opened by this manager."""
+
+        while self._connections:
+            _, db = self._connections.popitem()
+            db.close()
+
+
+connections = ConnectionManager()
+atexit.register(connections.close)
+
+
+def get_connection(name: str = "main.db"):
+    """
+    Retrieve the process-wide shared connection to a database.
+
+    :param name: name of the database file
+    :return: DBConn object, or MemoryStorage with the memory storage
+    """
+
+    return connections.get(name)
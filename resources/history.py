@@ -0,0 +1,87 @@
+from bisect import bisect_left, bisect_right
+
+
+class History:
+    """
+    Completion history of a habit, as returned by DBConn.get_history.
+
+    The completed dates and weeks are kept in separate hashed indexes, so checking whether a habit was completed on a
+    date or in a week is O(1).  A sorted list of the dates is kept as well, so checking for a completion within a range
+    of dates is O(log n).  Period keys (see resources.streaks) are indexed too, when the database provides them.
+    Iterating over the history gives the same flat list of dates and weeks that get_history used to return, so it can
+    be used as a drop-in replacement for the old list.
+    """
+
+    def __init__(self, rows: list = None):
+        """
+        :param rows: list of (completed_date, completed_week) or (completed_date, completed_week, period_key) tuples
+                     (output from the database fetch* operations)
+        """
+
+        rows = rows or []
+        self.rows = [(str(row[0]), str(row[1])) for row in rows]
+        self.dates = {completed_date for completed_date, _ in self.rows}
+        self.weeks = {completed_week for _, completed_week in self.rows}
+        self.periods = {row[2] for row in rows if len(row) > 2 and row[2] is not None}
+        self.sorted_dates = sorted(self.dates)
+
+    def __contains__(self, value):
+        return str(value) in self.dates or str(value) in self.weeks
+
+    def __eq__(self, other):
+        if isinstance(other, History):
+            return self.rows == other.rows
+        return list(self) == other
+
+    def __iter__(self):
+        for completed_date, completed_week in self.rows:
+            yield completed_date
+            yield completed_week
+
+    def __len__(self):
+        return len(self.rows) * 2
+
+    def __repr__(self):
+        return f"History({self.rows!r})"
+
+    def has_date(self, completed_date):
+        """
+        Check if the habit was completed on a specific date.
+
+        :param completed_date: date as a string in the format YYYY-MM-DD, or a date object
+        :return: True if the habit was completed on that date
+        """
+
+        return str(completed_date) in self.dates
+
+    def has_week(self, completed_week):
+        """
+        Check if the habit was completed in a specific week.
+
+        :param completed_week: ISO week number
+        :return: True if the habit was completed in that week
+        """
+
+        return str(completed_week) in self.weeks
+
+    def has_period(self, key: int):
+        """
+        Check if the habit was completed in a specific period.  Unlike ISO week numbers, period keys are unique across
+        years.
+
+        :param key: period key, see resources.streaks.period_key
+        :return: True if the habit was completed in that period
+        """
+
+        return key in self.periods
+
+    def completed_between(self, start, end):
+        """
+        Check if the habit was completed between two dates (inclusive).
+
+        :param start: first date of the period as a string in the format YYYY-MM-DD, or a date object
+        :param end: last date of the period as a string in the format YYYY-MM-DD, or a date object
+        :return: True if the habit was completed at least once in the period
+        """
+
+        return bisect_right(self.sorted_dates, str(end)) > bisect_left(self.sorted_dates, str(start))
@@ -0,0 +1,107 @@
+import csv
+import gzip
+import io
+import json
+import os
+from datetime import datetime
+from resources.output import write_rows
+
+"""
+Functions to stream completion history in and out of the tracker in CSV or JSONL (one JSON object per line) format.
+Rows are read and written one at a time, so files with millions of completions are handled in constant memory.
+
+    Every row has the fields:  completed_date, completed_time, completed_week, habit_name
+    completed_time and completed_week are optional when importing, they default to 00:00 and the ISO week of the date.
+
+Archived completions (see DBConn.archive_history) are appended to a gzip-compressed JSONL file, which also has the
+user and habit_id fields, so it can be read with zcat or gzip.open.
+"""
+
+FIELDS = ["completed_date", "completed_time", "completed_week", "habit_name"]
+FORMATS = ["csv", "jsonl"]
+ARCHIVE_FIELDS = ["user", "habit_id"] + FIELDS
+
+
+def guess_format(filename: str, default: str = "csv"):
+    """
+    Guess the format of a history file from its extension.
+
+    :param filename: name of the file
+    :param default: format to use if the extension is not recognised
+    :return: 'csv' or 'jsonl'
+    """
+
+    extension = filename.rsplit(".", 1)[-1].lower()
+    if extension in ("jsonl", "ndjson", "json"):
+        return "jsonl"
+    if extension == "csv":
+        return "csv"
+    return default
+
+
+def read_history(file, fmt: str = "csv"):
+    """
+    Read completions from a CSV or JSONL file.
+
+    :param file: file object opened in text mode
+    :param fmt: 'csv' or 'jsonl'
+    :return: generator of (habit_name, completed_date, completed_time, completed_week) tuples
+    """
+
+    if fmt == "csv":
+        records = csv.DictReader(file)
+    elif fmt == "jsonl":
+        records = (json.loads(line) for line in file if line.strip())
+    else:
+        raise ValueError(f"Unsupported history format '{fmt}', expected one of: {', '.join(FORMATS)}")
+
+    for line_number, record in enumerate(records, start=1):
+        try:
+            habit_name = record["habit_name"]
+            completed_date = datetime.strptime(record["completed_date"], "%Y-%m-%d")
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid history record {line_number}: {record!r}") from e
+
+        completed_time = record.get("completed_time") or "00:00"
+        completed_week = record.get("completed_week") or completed_date.isocalendar()[1]
+
+        yield habit_name, completed_date.strftime("%Y-%m-%d"), completed_time, str(completed_week)
+
+
+def write_history(file, rows, fmt: str = "csv"):
+    """
+    Write completions to a CSV or JSONL file.
+
+    :param file: file object opened in text mode
+    :param rows: iterable of (completed_date, completed_time, completed_week, habit_name) tuples, e.g. the output of
+                 DBConn.iter_history
+    :param fmt: 'csv' or 'jsonl'
+    :return: number of rows written
+    """
+
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported history format '{fmt}', expected one of: {', '.join(FORMATS)}")
+
+    # JSONL is the same as the newline-delimited JSON output of the other commands
+    return write_rows(rows, FIELDS, "ndjson" if fmt == "jsonl" else fmt, file)
+
+
+def append_archive(filename: str, rows):
+    """
+    Append completions to a gzip-compressed JSONL archive file and sync it to disk.  Every call adds a gzip member to
+    the end of the file, which gzip readers read as one file.
+
+    :param filename: name of the archive file; created if it doesn't exist
+    :param rows: iterable of (user, habit_id, completed_date, completed_time, completed_week, habit_name) tuples
+    :return: number of rows written
+    """
+
+    with open(filename, "ab") as raw:
+        # Level 6 (the default of the gzip tool) is several times faster than 9 and only slightly larger
+        with gzip.GzipFile(fileobj=raw, mode="ab", compresslevel=6) as compressed, \
+                io.TextIOWrapper(compressed, "utf-8") as file:
+            count = write_rows(rows, ARCHIVE_FIELDS, "ndjson", file)
+        raw.flush()
+        os.fsync(raw.fileno())
+
+    return count
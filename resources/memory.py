@@ -0,0 +1,557 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from datetime import date, datetime
+from heapq import merge
+from itertools import count, islice
+from resources.history import History
+from resources.recurrence import recurrence
+from resources.rows import DEFAULT_USER, CompletionRow, HabitRow
+from resources.streaks import advance, counted_periods, current_streak, replay
+
+"""
+In-memory storage engine, implementing the Storage protocol (see resources.storage) without a database.
+
+Every user has a dictionary of habits in the order they were added, and the completions of every habit in a list
+sorted by (completed_date, sequence number), the same order as the tracker index of the database.  Date ranges are
+found with a binary search, the history of all habits is merged from the sorted lists of the habits, and the streak
+checkpoints are kept and advanced with the functions of the streak engine, just like DBConn does.
+
+Nothing is ever written to disk, so the engine is meant for tests and for ephemeral sessions; everything is gone once
+the storage is closed.
+"""
+
+
+class _Tables:
+    """The habits, completions and streak checkpoints of one user."""
+
+    def __init__(self):
+        # Habit name -> HabitRow, in the order the habits were added
+        self.habits = {}
+        # Habit name -> list of (completed_date, sequence number, CompletionRow), sorted
+        self.history = {}
+        # Habit name -> set of period keys that count for the streak, so a habit is completed at most once per period
+        self.periods = {}
+        # Habit name -> streak checkpoint (last_period, run_length, max_run)
+        self.streaks = {}
+
+
+class MemoryStorage:
+    """
+    Storage engine that keeps the habits and history of all users in memory.  Has the same methods and behaviour as
+    DBConn for everything in the Storage protocol.
+    """
+
+    def __init__(self, user: str = DEFAULT_USER):
+        """
+        :param user: name of the user whose habits are read and changed
+        """
+
+        self._tables = defaultdict(_Tables)
+        self._user = user
+        # Completions on the same date are kept in the order they were added, like the rowid does in the database
+        self._sequence = count()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Drop all the data.  Safe to call more than once."""
+
+        self._tables.clear()
+        self._closed = True
+
+    @property
+    def closed(self):
+        """True once the storage has been closed."""
+
+        return self._closed
+
+    @property
+    def user(self):
+        """Name of the selected user.  Can be changed to act on the habits of another user."""
+
+        return self._user
+
+    @user.setter
+    def user(self, user: str):
+        self._user = user
+
+    @property
+    def _data(self):
+        return self._tables[self._user]
+
+    def get_users(self):
+        """
+        Retrieve the names of all users with habits or completions.
+
+        :return: sorted list of user names
+        """
+
+        return sorted(user for user, data in self._tables.items() if data.habits)
+
+    def delete_user(self):
+        """Delete all habits, completions and streaks of the selected user."""
+
+        self._tables.pop(self._user, None)
+
+    def add_record(self, habit_details: list):
+        """
+        Add a habit.
+
+        :param habit_details: list containing the habit information; expecting a list of 6 items
+        :return: success/fail message
+        """
+
+        habit_name, habit_desc, interval, created_date, streak_count, max_streak = habit_details
+
+        if habit_name in self._data.habits:
+            return (ValueError(f"Habit '{habit_name}' already exists"),
+                    "ERROR: Habit already exists with that name!  Try again with a new name.")
+
+        self._data.habits[habit_name] = HabitRow(habit_name, habit_desc, interval, created_date, int(streak_count),
+                                                 int(max_streak))
+        self._data.history[habit_name] = []
+        self._data.periods[habit_name] = set()
+        self._save_streak(habit_name, (None, 0, 0))
+
+        return f"Habit '{habit_name}' added successfully."
+
+    def _insert(self, habit_name: str, completed_date: str, completed_time: str, completed_week: str):
+        """Add a completion to the sorted history of a habit, without touching the streak."""
+
+        row = CompletionRow(completed_date, completed_time, completed_week, habit_name)
+        insort(self._data.history[habit_name], (completed_date, next(self._sequence), row))
+
+    def _interval(self, habit_name: str):
+        """Interval of a habit if it is a recurrence rule, otherwise None."""
+
+        interval = self._data.habits[habit_name].interval
+        return interval if recurrence(interval) is not None else None
+
+    def _period_keys(self, habit_name: str):
+        """Period key of every completion of a habit in history order, None for the ones that don't count."""
+
+        interval = self._interval(habit_name)
+        history = self._data.history[habit_name]
+        if interval is None:
+            return [None] * len(history)
+        return list(counted_periods((completed_date for completed_date, _, _ in history), interval))
+
+    def _replay(self, habit_name: str, save: bool = True):
+        """
+        Recalculate the period keys of all completions of a habit and replay its streak from the history.
+
+        :param habit_name: name of the habit
+        :param save: set to False to only compute the streak, without keeping the recalculated period keys
+        :return: streak checkpoint tuple
+        """
+
+        periods = set(self._period_keys(habit_name)) - {None}
+        if save:
+            self._data.periods[habit_name] = periods
+
+        return replay(sorted(periods), self._interval(habit_name))
+
+    def _save_streak(self, habit_name: str, checkpoint: tuple):
+        """Keep the streak checkpoint of a habit and copy the current/max streak to the habit."""
+
+        self._data.streaks[habit_name] = checkpoint
+        habit = self._data.habits[habit_name]
+        self._data.habits[habit_name] = habit._replace(streak_count=current_streak(checkpoint, habit.interval),
+                                                       max_streak=checkpoint[2])
+
+    def add_history(self, habit_name: str, completed_date: str, completed_time: str, completed_week: str,
+                    once_per_period: bool = False):
+        """
+        Add a completion of a habit and advance the streak of the habit.
+
+        :param habit_name: name of the habit
+        :param completed_date: date of the completion in the format YYYY-MM-DD
+        :param completed_time: time of the completion in the format HH:MM
+        :param completed_week: ISO week number of the completion
+        :param once_per_period: set to True to skip the completion if the habit was already completed in its period
+        :return: number of completions added
+        """
+
+        if habit_name not in self._data.habits:
+            raise ValueError(f"Habit '{habit_name}' does not exist.")
+        interval = self._interval(habit_name)
+        rule = recurrence(interval) if interval else None
+        period = rule.key(date.fromisoformat(completed_date)) if rule else None
+        periods = self._data.periods[habit_name]
+        history = self._data.history[habit_name]
+
+        if once_per_period and rule is not None:
+            # Rules like "3 times per week" are completed at most once per day, the others once per period
+            if rule.target == 1 and period in periods:
+                return 0
+            same_day = bisect_left(history, (completed_date,))
+            if rule.target > 1 and same_day < len(history) and history[same_day][0] == completed_date:
+                return 0
+
+        self._insert(habit_name, completed_date, completed_time, completed_week)
+        if period is None:
+            return 1
+
+        if rule.target > 1:
+            # The period only counts once the habit was completed on enough different days
+            first = bisect_left(history, (str(rule.start(period)),))
+            last = bisect_right(history, (str(rule.end(period)), float("inf")))
+            days = {completed_date for completed_date, _, _ in history[first:last]}
+            if len(days) < rule.target or period in periods:
+                return 1
+
+        periods.add(period)
+        checkpoint = self._data.streaks.get(habit_name, (None, 0, 0))
+        if checkpoint[0] is not None and period < checkpoint[0]:
+            # Completions older than the last one can change any run, so replay the history of the habit
+            checkpoint = self._replay(habit_name)
+        else:
+            checkpoint = advance(checkpoint, period, interval)
+        self._save_streak(habit_name, checkpoint)
+
+        return 1
+
+    def bulk_add_history(self, rows):
+        """
+        Add many completions at once.  All rows are read before any is added, so if any row fails, e.g. because its
+        habit doesn't exist, none are added.
+
+        :param rows: iterable of (habit_name, completed_date, completed_time, completed_week) tuples
+        :return: number of completions added
+        """
+
+        rows = list(rows)
+        # Check all rows first, like the database does while it inserts and counts the rollups
+        for habit_name, completed_date, _, _ in rows:
+            if habit_name not in self._data.habits:
+                raise ValueError(f"Habit '{habit_name}' does not exist.")
+            date.fromisoformat(completed_date)
+
+        for row in rows:
+            self._insert(*row)
+
+        # Completions can be in any order, so rebuild the streaks of the affected habits from history
+        for habit_name in {habit_name for habit_name, *_ in rows}:
+            self._save_streak(habit_name, self._replay(habit_name))
+
+        return len(rows)
+
+    def check_streaks(self, interval: str = None, date: datetime = None):
+        """
+        Check the streak of every habit (or only habits of a specified interval) and reset the streaks that have been
+        broken.
+
+        :param interval: only check habits with this interval (optional)
+        :param date: date to check the streaks against (optional); defaults to now
+        :return: dictionary of habit name -> (completed in current period, streak was reset)
+        """
+
+        if date is None:
+            date = datetime.now()
+
+        status = {}
+        for name, habit in list(self._data.habits.items()):
+            rule = recurrence(habit.interval)
+            if rule is None or interval not in (None, habit.interval):
+                continue
+
+            current = rule.key(date.date())
+            last_period = self._data.streaks.get(name, (None,))[0]
+            completed = last_period == current
+            broken = bool(habit.streak_count) and (last_period is None or last_period < rule.previous(current))
+            if broken:
+                self._data.habits[name] = habit._replace(streak_count=0)
+            status[name] = (completed, broken)
+
+        return status
+
+    def get_pending(self, date: datetime = None):
+        """
+        Retrieve the habits that are still due, i.e. not completed in the current period of their interval yet, and
+        reset the broken streaks among them.
+
+        :param date: date to check against (optional); defaults to now
+        :return: list of HabitRow of the pending habits, in the order they were added
+        """
+
+        if date is None:
+            date = datetime.now()
+
+        pending = []
+        for name, habit in list(self._data.habits.items()):
+            rule = recurrence(habit.interval)
+            if rule is not None:
+                current = rule.key(date.date())
+                last_period = self._data.streaks.get(name, (None,))[0]
+                if last_period is not None and last_period >= current:
+                    continue
+                if habit.streak_count and (last_period is None or last_period < rule.previous(current)):
+                    habit = self._data.habits[name] = habit._replace(streak_count=0)
+            pending.append(habit)
+
+        return pending
+
+    def complete_task(self, habit_name: str, date: datetime = None):
+        """
+        Mark a task as complete.  A habit is completed at most once per period of its rule, or once per day for rules
+        like "3 times per week".
+
+        :param habit_name: name of the habit
+        :param date: date and time of the completion (optional); defaults to now
+        :return: success/error message
+        """
+
+        if date is None:
+            date = datetime.now()
+
+        try:
+            inserted = self.add_history(habit_name, date.strftime("%Y-%m-%d"), date.strftime("%H:%M"),
+                                        str(date.isocalendar().week), once_per_period=True)
+        except Exception as e:
+            return e
+
+        if inserted == 0:
+            return f"'{habit_name}' was already completed in this period."
+        return f"{inserted} row(s) inserted successfully."
+
+    def delete_record(self, habit_name: str):
+        """
+        Delete a habit, together with its history and streak.
+
+        :param habit_name: name of habit
+        """
+
+        for table in (self._data.habits, self._data.history, self._data.periods, self._data.streaks):
+            table.pop(habit_name, None)
+
+    def get_all(self, table_name: str = "habits", habit_name: str = None):
+        """
+        Retrieve all habits or completions.
+
+        :param table_name: habits or tracker
+        :param habit_name: name of the habit (optional)
+        :return: list of HabitRow (habits) or CompletionRow (tracker)
+        """
+
+        if table_name == "habits":
+            habits = self._data.habits
+            if habit_name is None:
+                return list(habits.values())
+            return [habits[habit_name]] if habit_name in habits else []
+
+        elif table_name == "tracker":
+            return list(self.iter_history(habit_name))
+
+        raise ValueError(f"Unknown table '{table_name}'")
+
+    def _entries(self, habit_name: str = None, since: str = None, until: str = None, after: tuple = None):
+        """
+        Iterate over the history entries in a range, in (completed_date, sequence number) order.
+
+        :param habit_name: name of the habit (optional); all habits by default
+        :param since: first completed date to include (optional)
+        :param until: last completed date to include (optional)
+        :param after: only include entries after this (completed_date, sequence number) key (optional)
+        :return: iterator of (completed_date, sequence number, CompletionRow)
+        """
+
+        if habit_name is not None:
+            histories = [self._data.history.get(habit_name, [])]
+        else:
+            histories = list(self._data.history.values())
+
+        ranges = []
+        for history in histories:
+            start = bisect_left(history, (since,)) if since is not None else 0
+            if after is not None:
+                start = max(start, bisect_left(history, (after[0], after[1] + 1)))
+            end = bisect_right(history, (until, float("inf"))) if until is not None else len(history)
+            ranges.append(map(history.__getitem__, range(start, end)))
+
+        return ranges[0] if len(ranges) == 1 else merge(*ranges)
+
+    def iter_history(self, habit_name: str = None, since: str = None, until: str = None):
+        """
+        Iterate over the completions (oldest first).
+
+        :param habit_name: name of the habit (optional); all habits by default
+        :param since: first completed date to include, in the format YYYY-MM-DD (optional)
+        :param until: last completed date to include, in the format YYYY-MM-DD (optional)
+        :return: generator of CompletionRow
+        """
+
+        for _, _, row in self._entries(habit_name, since, until):
+            yield row
+
+    def get_history_page(self, habit_name: str = None, since: str = None, until: str = None, after: tuple = None,
+                         limit: int = 50):
+        """
+        Retrieve one page of completions (oldest first).
+
+        :param habit_name: name of the habit (optional); all habits by default
+        :param since: first completed date to include, in the format YYYY-MM-DD (optional)
+        :param until: last completed date to include, in the format YYYY-MM-DD (optional)
+        :param after: key returned with the previous page (optional); starts at the first page by default
+        :param limit: maximum number of completions on the page
+        :return: tuple of (list of CompletionRow, key of the next page or None if this is the last page)
+        """
+
+        entries = list(islice(self._entries(habit_name, since, until, after), limit + 1))
+        next_page = entries[limit - 1][:2] if len(entries) > limit else None
+        return [row for _, _, row in entries[:limit]], next_page
+
+    def get_streak_state(self, habit_name: str):
+        """
+        Retrieve the streak checkpoint of a habit.
+
+        :param habit_name: name of the habit
+        :return: tuple of (last completed period, length of the last run, longest run), or None for unknown habits
+        """
+
+        return self._data.streaks.get(habit_name)
+
+    def get_habit_names(self):
+        """
+        :return: list of (name,) tuples, sorted by name
+        """
+
+        return [(name,) for name in sorted(self._data.habits)]
+
+    def get_history(self, habit_name: str):
+        """
+        Retrieve the history of a specific habit.
+
+        :param habit_name: name of the habit
+        :return: History object with the completed dates and weeks of the habit
+        """
+
+        if habit_name not in self._data.habits:
+            return History()
+        return History([(completed_date, row.completed_week, period)
+                        for (completed_date, _, row), period in zip(self._data.history[habit_name],
+                                                                    self._period_keys(habit_name))])
+
+    def get_interval(self, habit_name: str):
+        """
+        :param habit_name: name of the habit
+        :return: the interval of the specified habit
+        """
+
+        return self._data.habits[habit_name].interval
+
+    def get_interval_habits(self, interval: str):
+        """
+        :param interval: interval of the habits, a recurrence rule
+        :return: list of HabitRow matching the specified interval
+        """
+
+        return [habit for habit in self._data.habits.values() if habit.interval == interval]
+
+    def get_longest_streak(self, habit_name: str = None):
+        """
+        Retrieve the habit with the longest streak (default) or the streak information for a habit if specified.
+
+        :param habit_name: name of the habit
+        :return: HabitRow, or None if there are no habits/the habit doesn't exist
+        """
+
+        habits = self._data.habits
+        if habit_name is None:
+            # Ties go to the habit that was added first
+            return max(habits.values(), key=lambda habit: habit.max_streak or 0, default=None)
+
+        return habits.get(habit_name)
+
+    def update_record(self, habit_name: str, attr_to_update: str, update_value: str):
+        """
+        Update the name, description or interval of a habit.
+
+        :param habit_name: name of habit
+        :param attr_to_update: attribute of habit to update; 'name', 'description', 'interval' are supported options.
+        :param update_value: new value to set on attribute
+        :return: success/fail message
+        :raises ValueError: when renaming the habit to the name of another habit
+        """
+
+        data = self._data
+        habit = data.habits.get(habit_name)
+        updated = 0
+
+        if habit is not None and attr_to_update == "name":
+            if update_value in data.habits:
+                raise ValueError(f"Habit '{update_value}' already exists.")
+            # Rename in place, so the habit keeps its position
+            data.habits = {update_value if name == habit_name else name:
+                           row._replace(name=update_value) if name == habit_name else row
+                           for name, row in data.habits.items()}
+            # Move the history and streak over to the new name
+            data.history[update_value] = [(completed_date, sequence, row._replace(habit_name=update_value))
+                                          for completed_date, sequence, row in data.history.pop(habit_name)]
+            data.periods[update_value] = data.periods.pop(habit_name)
+            data.streaks[update_value] = data.streaks.pop(habit_name)
+            updated = 1
+
+        if habit is not None and attr_to_update == "description":
+            data.habits[habit_name] = habit._replace(description=update_value)
+            updated = 1
+
+        if habit is not None and attr_to_update == "interval":
+            data.habits[habit_name] = habit._replace(interval=update_value)
+            # Periods are different for the new interval, so the history and streak have to be rebuilt
+            self._save_streak(habit_name, self._replay(habit_name))
+            updated = 1
+
+        if updated == 0:
+            return "No records updated.  Check for programming errors in SQL query."
+        else:
+            return f"Updated {updated} record(s) successfully."
+
+    def recompute_streaks(self, habit_name: str = None, verify: bool = False):
+        """
+        Rebuild the streaks of all habits (or a single habit) by replaying the full completion history.  In verify mode
+        nothing is changed and the habits whose stored streak differs from the history are returned instead.
+
+        :param habit_name: name of the habit (optional)
+        :param verify: set to True to only compare the stored streaks with the history
+        :return: list of names of the habits whose stored streak was wrong
+        """
+
+        mismatches = []
+        for name in sorted(self._data.habits):
+            if habit_name not in (None, name):
+                continue
+            habit = self._data.habits[name]
+            checkpoint = self._replay(name, save=not verify)
+
+            stored = (self._data.streaks.get(name, (None, 0, 0)), (habit.streak_count, habit.max_streak))
+            expected = (checkpoint, (current_streak(checkpoint, habit.interval), checkpoint[2]))
+            if recurrence(habit.interval) is not None and stored != expected:
+                mismatches.append(name)
+            if not verify:
+                self._save_streak(name, checkpoint)
+
+        return mismatches
+
+    def update_streak(self, habit_name: str, reset_streak: bool = False):
+        """
+        Update the streak for a specified habit.  Can be used to add to streak or reset streak back to zero.
+
+        :param habit_name: name of habit
+        :param reset_streak: boolean value; set to True to reset the streak to zero
+        :return: None
+        """
+
+        habit = self._data.habits[habit_name]
+        if reset_streak:
+            self._data.habits[habit_name] = habit._replace(streak_count=0)
+            return f"Streak Count reset for habit: {habit_name} !"
+
+        streak_count = habit.streak_count + 1
+        self._data.habits[habit_name] = habit._replace(streak_count=streak_count,
+                                                       max_streak=max(streak_count, habit.max_streak))
+        return
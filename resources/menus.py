@@ -1,30 +1,78 @@
 import inquirer
+from resources.recurrence import RULE_CHOICES
 
-"""All of the different menus that can be displayed in the habit tracker."""
-
-analyze_menu = [
-    inquirer.List(
-        "selection",
-        message="What would you like to do?",
-        choices=["Show Daily", "Show Weekly", "Longest Streak Overall", "Longest Streak (select habit)"]
-    ),
-]
-
-interval_menu = [
-    inquirer.List(
-        "selection",
-        message="Which interval would you like this habit to be performed?",
-        choices=["Daily", "Weekly"]
-    ),
-]
-
-modify_menu = [
-    inquirer.List(
-        "selection",
-        message="What would you like to do?",
-        choices=["Change Name", "Change Description", "Change Interval", "CANCEL"]
-    ),
-]
+"""All of the different menus that can be displayed in the habit tracker.  Menus are only built when they are shown."""
+
+
+def create_main_menu():
+    """
+    Creates the main menu of the interactive mode.
+
+    :return: the menu to be displayed
+    """
+
+    main_menu = [
+        inquirer.List(
+            "selection",
+            message="What would you like to do?",
+            choices=["Add Habit", "Complete Task", "Delete Habit", "Analyze Habits",
+                     "Modify Habits", "Show Today", "Show History", "Exit App"],
+        ),
+    ]
+    return main_menu
+
+
+def create_analyze_menu():
+    """
+    Creates the menu for selecting the type of analysis.
+
+    :return: the menu to be displayed
+    """
+
+    analyze_menu = [
+        inquirer.List(
+            "selection",
+            message="What would you like to do?",
+            choices=["Show Daily", "Show Weekly", "Longest Streak Overall", "Longest Streak (select habit)",
+                     "Completion Rates (weekly)", "Completion Rates (monthly)", "Best Weekday", "Streak Distribution",
+                     "Rolling Adherence", "Completion Heatmap", "Streaks from History"]
+        ),
+    ]
+    return analyze_menu
+
+
+def create_interval_menu():
+    """
+    Creates the menu for selecting the interval of a habit.
+
+    :return: the menu to be displayed
+    """
+
+    interval_menu = [
+        inquirer.List(
+            "selection",
+            message="Which interval would you like this habit to be performed?",
+            choices=RULE_CHOICES
+        ),
+    ]
+    return interval_menu
+
+
+def create_modify_menu():
+    """
+    Creates the menu for selecting what to change about a habit.
+
+    :return: the menu to be displayed
+    """
+
+    modify_menu = [
+        inquirer.List(
+            "selection",
+            message="What would you like to do?",
+            choices=["Change Name", "Change Description", "Change Interval", "CANCEL"]
+        ),
+    ]
+    return modify_menu
 
 
 def create_delete_menu(choices: list):
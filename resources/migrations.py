@@ -0,0 +1,354 @@
+"""
+Versioned schema migrations for the habit tracker database.
+
+The schema version of a database file is stored in ``PRAGMA user_version``.  Each function in ``MIGRATIONS`` upgrades
+the schema by one version, so migration N (1-based) brings a database from version N-1 to version N.  New migrations
+must always be appended to the end of the list and existing ones must never be changed, otherwise databases that were
+already upgraded would end up with a different schema.  For the same reason, migrations only use the table layout of
+their own version and never the queries in DBConn, and the streak and rollup logic they need is frozen below as it was
+when they were added, instead of calling resources.streaks or resources.rollups, which may change later.
+"""
+from collections import Counter
+from datetime import date, timedelta
+
+
+def _period_key(day: date, interval: str):
+    """Period key of the Daily (day ordinal) and Weekly (ISO year * 100 + ISO week) habits of versions 2 and 3."""
+
+    if interval == "Daily":
+        return day.toordinal()
+    iso_year, iso_week, _ = day.isocalendar()
+    return iso_year * 100 + iso_week
+
+
+def _previous_period(key: int, interval: str):
+    """Key of the period before a Daily or Weekly period key."""
+
+    if interval == "Daily":
+        return key - 1
+    return _period_key(date.fromisocalendar(key // 100, key % 100, 1) - timedelta(weeks=1), interval)
+
+
+def _replay(periods, interval: str):
+    """Streak checkpoint (last_period, run_length, max_run) of the period keys of a habit, in ascending order."""
+
+    last_period, run_length, max_run = None, 0, 0
+    for period in periods:
+        if period == last_period:
+            continue
+        if last_period is not None and _previous_period(period, interval) == last_period:
+            run_length += 1
+        else:
+            run_length = 1
+        last_period, max_run = period, max(max_run, run_length)
+    return last_period, run_length, max_run
+
+
+def _current_streak(checkpoint: tuple, interval: str):
+    """Streak of a checkpoint that is still running today, i.e. last completed in this or the previous period."""
+
+    last_period, run_length, _ = checkpoint
+    if last_period is None or last_period < _previous_period(_period_key(date.today(), interval), interval):
+        return 0
+    return run_length
+
+
+def _count_rollups(completions):
+    """Counter of (habit_name, kind, period) -> completions of version 5, from (habit_name, date, count) rows."""
+
+    counts = Counter()
+    for habit_name, completed_date, completions_on_date in completions:
+        day = date.fromisoformat(completed_date[:10])
+        for kind, period in (("day", day.toordinal()), ("week", _period_key(day, "Weekly")),
+                             ("month", day.year * 100 + day.month), ("weekday", day.weekday())):
+            counts[habit_name, kind, period] += completions_on_date
+    return counts
+
+
+def _add_tracker_indexes(cursor):
+    """Version 1: composite indexes so history lookups by habit don't scan the whole tracker table."""
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracker_habit_date ON tracker (habit_name, completed_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracker_habit_week ON tracker (habit_name, completed_week)")
+
+
+def _add_streak_state(cursor):
+    """Version 2: per-habit streak checkpoints, rebuilt from the completion log."""
+
+    cursor.execute("""CREATE TABLE IF NOT EXISTS streak_state (
+                   habit_name TEXT PRIMARY KEY,
+                   last_period INTEGER,
+                   run_length INTEGER NOT NULL DEFAULT 0,
+                   max_run INTEGER NOT NULL DEFAULT 0)""")
+
+    cursor.execute("SELECT name, interval FROM habits WHERE interval IN ('Daily', 'Weekly')")
+    for name, interval in cursor.fetchall():
+        cursor.execute("SELECT completed_date FROM tracker WHERE habit_name = ? ORDER BY completed_date", (name,))
+        checkpoint = _replay((_period_key(date.fromisoformat(row[0][:10]), interval) for row in cursor.fetchall()),
+                             interval)
+        cursor.execute("INSERT OR REPLACE INTO streak_state VALUES (?, ?, ?, ?)", (name, *checkpoint))
+        cursor.execute("UPDATE habits SET streak_count = ?, max_streak = ? WHERE name = ?",
+                       (_current_streak(checkpoint, interval), checkpoint[2], name))
+
+
+def _add_period_keys(cursor):
+    """
+    Version 3: year-aware integer period key for every completion, replacing lookups by the bare ISO week number, which
+    collides between years.
+    """
+
+    cursor.execute("ALTER TABLE tracker ADD COLUMN period_key INTEGER")
+
+    cursor.execute("SELECT t.rowid, t.completed_date, h.interval FROM tracker t JOIN habits h ON h.name = t.habit_name "
+                   "WHERE h.interval IN ('Daily', 'Weekly')")
+    cursor.executemany("UPDATE tracker SET period_key = ? WHERE rowid = ?",
+                       [(_period_key(date.fromisoformat(completed_date[:10]), interval), rowid)
+                        for rowid, completed_date, interval in cursor.fetchall()])
+
+    cursor.execute("DROP INDEX IF EXISTS idx_tracker_habit_week")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracker_habit_period ON tracker (habit_name, period_key)")
+
+
+def _add_history_date_index(cursor):
+    """Version 4: index on the completed date, so history pages of all habits don't have to sort the tracker table."""
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracker_date ON tracker (completed_date)")
+
+
+def _add_completion_rollups(cursor):
+    """Version 5: per-habit completion counts per day, week, month and weekday for the analytics reports."""
+
+    # Reports read one kind of rollup for a range of periods across all habits, so that is the primary key order
+    cursor.execute("""CREATE TABLE IF NOT EXISTS completion_rollups (
+                   habit_name TEXT NOT NULL,
+                   kind TEXT NOT NULL,
+                   period INTEGER NOT NULL,
+                   completions INTEGER NOT NULL,
+                   PRIMARY KEY (kind, period, habit_name)) WITHOUT ROWID""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_rollups_habit ON completion_rollups (habit_name)")
+
+    counts = _count_rollups(cursor.execute("SELECT habit_name, completed_date, count(*) FROM tracker "
+                                          "GROUP BY habit_name, completed_date"))
+    cursor.executemany("INSERT INTO completion_rollups (habit_name, kind, period, completions) VALUES (?, ?, ?, ?)",
+                       [(*key, completions) for key, completions in counts.items()])
+
+
+def _add_users(cursor):
+    """
+    Version 6: user column in every table, so the habits of many people can be kept in one database file.  Existing
+    rows belong to the user 'default'.  SQLite can't change the primary key of a table, so every table is rebuilt with
+    the user as the first column of its keys and indexes, keeping the rowids.
+    """
+
+    cursor.execute("""CREATE TABLE habits_v6 (
+                   name TEXT NOT NULL,
+                   description TEXT,
+                   interval TEXT,
+                   created_date TEXT,
+                   streak_count INTEGER,
+                   max_streak INTEGER,
+                   user TEXT NOT NULL DEFAULT 'default',
+                   PRIMARY KEY (user, name))""")
+    cursor.execute("INSERT INTO habits_v6 (rowid, name, description, interval, created_date, streak_count, "
+                   "max_streak) SELECT rowid, name, description, interval, created_date, streak_count, max_streak "
+                   "FROM habits")
+    cursor.execute("DROP TABLE habits")
+    cursor.execute("ALTER TABLE habits_v6 RENAME TO habits")
+
+    cursor.execute("""CREATE TABLE tracker_v6 (
+                   completed_date TEXT,
+                   completed_time TEXT,
+                   completed_week TEXT,
+                   habit_name TEXT,
+                   period_key INTEGER,
+                   user TEXT NOT NULL DEFAULT 'default',
+                   FOREIGN KEY (user, habit_name) REFERENCES habits(user, name))""")
+    cursor.execute("INSERT INTO tracker_v6 (rowid, completed_date, completed_time, completed_week, habit_name, "
+                   "period_key) SELECT rowid, completed_date, completed_time, completed_week, habit_name, period_key "
+                   "FROM tracker")
+    cursor.execute("DROP TABLE tracker")
+    cursor.execute("ALTER TABLE tracker_v6 RENAME TO tracker")
+    cursor.execute("CREATE INDEX idx_tracker_habit_date ON tracker (user, habit_name, completed_date)")
+    cursor.execute("CREATE INDEX idx_tracker_habit_period ON tracker (user, habit_name, period_key)")
+    cursor.execute("CREATE INDEX idx_tracker_date ON tracker (user, completed_date)")
+
+    cursor.execute("""CREATE TABLE streak_state_v6 (
+                   habit_name TEXT NOT NULL,
+                   last_period INTEGER,
+                   run_length INTEGER NOT NULL DEFAULT 0,
+                   max_run INTEGER NOT NULL DEFAULT 0,
+                   user TEXT NOT NULL DEFAULT 'default',
+                   PRIMARY KEY (user, habit_name))""")
+    cursor.execute("INSERT INTO streak_state_v6 (habit_name, last_period, run_length, max_run) "
+                   "SELECT habit_name, last_period, run_length, max_run FROM streak_state")
+    cursor.execute("DROP TABLE streak_state")
+    cursor.execute("ALTER TABLE streak_state_v6 RENAME TO streak_state")
+
+    cursor.execute("""CREATE TABLE completion_rollups_v6 (
+                   habit_name TEXT NOT NULL,
+                   kind TEXT NOT NULL,
+                   period INTEGER NOT NULL,
+                   completions INTEGER NOT NULL,
+                   user TEXT NOT NULL DEFAULT 'default',
+                   PRIMARY KEY (user, kind, period, habit_name)) WITHOUT ROWID""")
+    cursor.execute("INSERT INTO completion_rollups_v6 (habit_name, kind, period, completions) "
+                   "SELECT habit_name, kind, period, completions FROM completion_rollups")
+    cursor.execute("DROP TABLE completion_rollups")
+    cursor.execute("ALTER TABLE completion_rollups_v6 RENAME TO completion_rollups")
+    cursor.execute("CREATE INDEX idx_rollups_habit ON completion_rollups (user, habit_name)")
+
+
+def _add_habit_ids(cursor):
+    """
+    Version 7: integer habit_id keys.  The history, streaks and rollups refer to their habit by its id, with foreign
+    keys that delete them together with the habit, instead of by the name, so renaming a habit only changes the habits
+    table.  The habit ids are the old rowids of the habits table, so the habits keep their order.  Completions, streaks
+    and rollups of habits that no longer exist are dropped.
+    """
+
+    cursor.execute("""CREATE TABLE habits_v7 (
+                   habit_id INTEGER PRIMARY KEY,
+                   name TEXT NOT NULL,
+                   description TEXT,
+                   interval TEXT,
+                   created_date TEXT,
+                   streak_count INTEGER,
+                   max_streak INTEGER,
+                   user TEXT NOT NULL DEFAULT 'default',
+                   UNIQUE (user, name))""")
+    cursor.execute("INSERT INTO habits_v7 (habit_id, name, description, interval, created_date, streak_count, "
+                   "max_streak, user) SELECT rowid, name, description, interval, created_date, streak_count, "
+                   "max_streak, user FROM habits")
+
+    cursor.execute("""CREATE TABLE tracker_v7 (
+                   completed_date TEXT,
+                   completed_time TEXT,
+                   completed_week TEXT,
+                   habit_id INTEGER NOT NULL REFERENCES habits (habit_id) ON UPDATE CASCADE ON DELETE CASCADE,
+                   period_key INTEGER,
+                   user TEXT NOT NULL DEFAULT 'default')""")
+    cursor.execute("INSERT INTO tracker_v7 (rowid, completed_date, completed_time, completed_week, habit_id, "
+                   "period_key, user) SELECT t.rowid, t.completed_date, t.completed_time, t.completed_week, "
+                   "h.habit_id, t.period_key, t.user FROM tracker t "
+                   "JOIN habits_v7 h ON h.user = t.user AND h.name = t.habit_name")
+
+    cursor.execute("""CREATE TABLE streak_state_v7 (
+                   habit_id INTEGER PRIMARY KEY REFERENCES habits (habit_id) ON UPDATE CASCADE ON DELETE CASCADE,
+                   last_period INTEGER,
+                   run_length INTEGER NOT NULL DEFAULT 0,
+                   max_run INTEGER NOT NULL DEFAULT 0)""")
+    cursor.execute("INSERT INTO streak_state_v7 (habit_id, last_period, run_length, max_run) "
+                   "SELECT h.habit_id, s.last_period, s.run_length, s.max_run FROM streak_state s "
+                   "JOIN habits_v7 h ON h.user = s.user AND h.name = s.habit_name")
+
+    cursor.execute("""CREATE TABLE completion_rollups_v7 (
+                   habit_id INTEGER NOT NULL REFERENCES habits (habit_id) ON UPDATE CASCADE ON DELETE CASCADE,
+                   kind TEXT NOT NULL,
+                   period INTEGER NOT NULL,
+                   completions INTEGER NOT NULL,
+                   user TEXT NOT NULL DEFAULT 'default',
+                   PRIMARY KEY (user, kind, period, habit_id)) WITHOUT ROWID""")
+    cursor.execute("INSERT INTO completion_rollups_v7 (habit_id, kind, period, completions, user) "
+                   "SELECT h.habit_id, r.kind, r.period, r.completions, r.user FROM completion_rollups r "
+                   "JOIN habits_v7 h ON h.user = r.user AND h.name = r.habit_name")
+
+    # The new tables refer to "habits", so the old tables are only dropped once all rows have been copied
+    for table in ("tracker", "streak_state", "completion_rollups", "habits"):
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(f"ALTER TABLE {table}_v7 RENAME TO {table}")
+
+    # The history of a habit is read by its id; the indexes on habit_id also make the cascading deletes fast
+    cursor.execute("CREATE INDEX idx_tracker_habit_date ON tracker (habit_id, completed_date)")
+    cursor.execute("CREATE INDEX idx_tracker_habit_period ON tracker (habit_id, period_key)")
+    cursor.execute("CREATE INDEX idx_tracker_date ON tracker (user, completed_date)")
+    cursor.execute("CREATE INDEX idx_rollups_habit ON completion_rollups (habit_id)")
+
+
+def _add_history_checkpoints(cursor):
+    """
+    Version 8: streak checkpoints of the archived history.  When old completions are moved out of the tracker table
+    (see DBConn.archive_history), their streak and number of runs are kept here, for both intervals so the interval of
+    the habit can still be changed, and replaying the rest of the history continues from them.
+    """
+
+    cursor.execute("""CREATE TABLE IF NOT EXISTS history_checkpoints (
+                   habit_id INTEGER NOT NULL REFERENCES habits (habit_id) ON UPDATE CASCADE ON DELETE CASCADE,
+                   interval TEXT NOT NULL,
+                   last_period INTEGER,
+                   run_length INTEGER NOT NULL DEFAULT 0,
+                   max_run INTEGER NOT NULL DEFAULT 0,
+                   runs INTEGER NOT NULL DEFAULT 0,
+                   completions INTEGER NOT NULL DEFAULT 0,
+                   PRIMARY KEY (habit_id, interval)) WITHOUT ROWID""")
+
+
+def _add_due_index(cursor):
+    """
+    Version 9: the last completed period of every habit, copied from its streak checkpoint to the habits table, with an
+    index on (user, interval, last_period).  The habits that are still due in the current period of their interval are
+    then found with a range search of the index, instead of checking every habit.
+    """
+
+    cursor.execute("ALTER TABLE habits ADD COLUMN last_period INTEGER")
+    cursor.execute("UPDATE habits SET last_period = (SELECT s.last_period FROM streak_state s "
+                   "WHERE s.habit_id = habits.habit_id)")
+    cursor.execute("CREATE INDEX idx_habits_due ON habits (user, interval, last_period)")
+
+
+MIGRATIONS = [
+    _add_tracker_indexes,
+    _add_streak_state,
+    _add_period_keys,
+    _add_history_date_index,
+    _add_completion_rollups,
+    _add_users,
+    _add_habit_ids,
+    _add_history_checkpoints,
+    _add_due_index,
+]
+
+
+def get_version(conn):
+    """
+    Retrieve the schema version of the database.
+
+    :param conn: sqlite3 connection to the database
+    :return: schema version as an integer
+    """
+
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Upgrade the database schema in place by running all migrations that have not been applied yet.  Every migration
+    runs in its own transaction together with the version bump, so an interrupted upgrade can safely be retried.
+
+    Several processes may open an old or new database file at the same time, so every transaction takes the write lock
+    (BEGIN IMMEDIATE) before it reads the version, and only runs the migration if no other process has applied it in
+    the meantime.
+
+    :param conn: sqlite3 connection to the database
+    :return: schema version after the upgrade
+    """
+
+    # The version only ever grows, so an up-to-date database doesn't need the write lock
+    version = get_version(conn)
+
+    while version < len(MIGRATIONS):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            version = get_version(conn)
+            if version < len(MIGRATIONS):
+                MIGRATIONS[version](cursor)
+                version += 1
+                cursor.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    return version
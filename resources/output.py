@@ -0,0 +1,53 @@
+import csv
+import json
+import sys
+
+"""
+Functions to write command output in machine-readable formats, for using the tracker in scripts and pipelines.  None of
+them use Rich, so the output is never wrapped, colored or truncated.
+
+    json:    one JSON array of objects
+    ndjson:  one JSON object per line
+    csv:     header line with the column names, then one line per row
+"""
+
+FORMATS = ["json", "ndjson", "csv"]
+
+
+def write_rows(rows, columns: list, fmt: str, file=None):
+    """
+    Write rows to a file in a machine-readable format.  Rows are written one at a time, so a generator can be used.
+
+    :param rows: iterable of rows, each a sequence of values in the same order as the columns
+    :param columns: list of column names, used as keys/header
+    :param fmt: 'json', 'ndjson' or 'csv'
+    :param file: file object to write to (optional); defaults to standard output
+    :return: number of rows written
+    """
+
+    file = file or sys.stdout
+    count = 0
+
+    if fmt == "csv":
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+
+    elif fmt == "ndjson":
+        for row in rows:
+            file.write(json.dumps(dict(zip(columns, row))) + "\n")
+            count += 1
+
+    elif fmt == "json":
+        file.write("[")
+        for row in rows:
+            file.write(("," if count else "") + "\n  " + json.dumps(dict(zip(columns, row))))
+            count += 1
+        file.write("\n]\n" if count else "]\n")
+
+    else:
+        raise ValueError(f"Unsupported output format '{fmt}', expected one of: {', '.join(FORMATS)}")
+
+    return count
@@ -0,0 +1,223 @@
+import re
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+"""
+Recurrence rules of the habits.
+
+The interval of a habit is a recurrence rule, which splits the calendar into periods that the habit is due in:
+
+    Daily             every day
+    Weekly            every ISO week (Monday to Sunday)
+    Weekdays          Monday to Friday; a completion on the weekend counts for the Friday before
+    Monthly           every calendar month
+    Every N days      every N days, counted from 0001-01-01
+    N times per week  on N different days of every week (Monday to Sunday)
+
+Every period is identified by an integer key (see resources.streaks).  The keys of Daily and Weekly are the ones the
+database has always stored: the day ordinal, and ISO year * 100 + ISO week.  The keys of the other rules simply count
+the periods since 0001-01-01 (a Monday), so the next and previous period are one key apart.
+
+A rule is compiled once into a Recurrence object, which computes the key, first and last date, next and previous
+period with a few arithmetic operations, so streak and due checks are O(1) per habit.  recurrence() caches the
+compiled rules by their text, so checking thousands of habits only compiles each rule once.
+"""
+
+# Rules offered in the interval menu; the ones with N ask for a number
+RULE_CHOICES = ["Daily", "Weekly", "Weekdays", "Monthly", "Every N days", "N times per week"]
+
+RULE_HELP = "Daily, Weekly, Weekdays, Monthly, 'Every N days' or 'N times per week'"
+
+
+class Recurrence:
+    """
+    Periods of a recurrence rule.
+
+    rule:    canonical text of the rule, as stored in the interval of the habit
+    target:  number of completions on different days that complete a period
+    claim:   rollup kind (see resources.rollups) of the unit a habit can be completed in at most once; None if that unit
+             is the period itself and it has no rollup
+    length:  days per period if every period is equally long, otherwise None
+    """
+
+    target = 1
+    claim = None
+    length = None
+
+    def __init__(self, rule: str):
+        self.rule = rule
+
+    def __repr__(self):
+        return f"Recurrence({self.rule!r})"
+
+    def key(self, day: date):
+        """Key of the period the date falls into."""
+
+        return (day.toordinal() - 1) // self.length
+
+    def start(self, key: int):
+        """First date of a period."""
+
+        return date.fromordinal(key * self.length + 1)
+
+    def next(self, key: int):
+        """Key of the period after the specified one."""
+
+        return key + 1
+
+    def previous(self, key: int):
+        """Key of the period before the specified one."""
+
+        return key - 1
+
+    def end(self, key: int):
+        """Last date of a period."""
+
+        return self.start(self.next(key)) - timedelta(days=1)
+
+    def index(self, ordinal: int):
+        """
+        Number of the period a day ordinal falls into, such that consecutive periods always differ by exactly one, for
+        the analytics engine.  For rules with equally long periods it is (ordinal - 1) // length (the ordinal itself for
+        Daily), so it can be computed for a whole column at once; for the others it is the key.
+        """
+
+        if self.length:
+            return (ordinal - 1) // self.length
+        return self.key(date.fromordinal(ordinal))
+
+    def periods_in(self, days: int):
+        """Number of whole periods (at least one) in a number of days."""
+
+        return max(days // self.length, 1)
+
+
+class Daily(Recurrence):
+    claim = "day"
+    length = 1
+
+    def key(self, day: date):
+        return day.toordinal()
+
+    def start(self, key: int):
+        return date.fromordinal(key)
+
+    def index(self, ordinal: int):
+        return ordinal
+
+
+class Weekly(Recurrence):
+    claim = "week"
+    length = 7
+
+    def key(self, day: date):
+        iso_year, iso_week, _ = day.isocalendar()
+        return iso_year * 100 + iso_week
+
+    def start(self, key: int):
+        iso_year, iso_week = divmod(key, 100)
+        return datetime.strptime(f"{iso_year}-W{iso_week}-1", "%G-W%V-%u").date()
+
+    def next(self, key: int):
+        # Only the last week of a year, week 52 or 53, has to look at the calendar
+        if key % 100 < 52:
+            return key + 1
+        return self.key(self.start(key) + timedelta(weeks=1))
+
+    def previous(self, key: int):
+        # Week 1 follows week 52 or 53 of the previous ISO year
+        if key % 100 > 1:
+            return key - 1
+        return self.key(self.start(key) - timedelta(weeks=1))
+
+
+class EveryDays(Recurrence):
+    def __init__(self, rule: str, days: int):
+        super().__init__(rule)
+        self.length = days
+
+
+class TimesPerWeek(Recurrence):
+    claim = "day"
+    length = 7
+
+    def __init__(self, rule: str, times: int):
+        super().__init__(rule)
+        self.target = times
+
+
+class Weekdays(Recurrence):
+    def key(self, day: date):
+        week, weekday = divmod(day.toordinal() - 1, 7)
+        return week * 5 + min(weekday, 4)
+
+    def start(self, key: int):
+        week, weekday = divmod(key, 5)
+        return date.fromordinal(week * 7 + weekday + 1)
+
+    def periods_in(self, days: int):
+        return max(days * 5 // 7, 1)
+
+
+class Monthly(Recurrence):
+    claim = "month"
+
+    def key(self, day: date):
+        return day.year * 12 + day.month - 1
+
+    def start(self, key: int):
+        return date(key // 12, key % 12 + 1, 1)
+
+    def end(self, key: int):
+        year, month = key // 12, key % 12 + 1
+        return date(year, month, monthrange(year, month)[1])
+
+    def periods_in(self, days: int):
+        return max(days // 30, 1)
+
+
+def parse_rule(text: str):
+    """
+    Compile the text of a recurrence rule.  Case and extra spaces don't matter, and "every 1 day" or "1 time per week"
+    are the same as Daily and Weekly.
+
+    :param text: the rule, see the rules at the top of this module
+    :return: Recurrence object; its rule attribute is the canonical text of the rule
+    """
+
+    words = " ".join(str(text).lower().split())
+    simple = {"daily": Daily, "weekly": Weekly, "weekdays": Weekdays, "monthly": Monthly}
+    if words in simple:
+        return simple[words](words.capitalize())
+
+    match = re.fullmatch(r"every (\d+) days?", words)
+    if match:
+        days = int(match.group(1))
+        if days >= 1:
+            return Daily("Daily") if days == 1 else EveryDays(f"Every {days} days", days)
+
+    match = re.fullmatch(r"(\d+) times? (?:per|a) week", words)
+    if match:
+        times = int(match.group(1))
+        if 1 <= times <= 7:
+            return Weekly("Weekly") if times == 1 else TimesPerWeek(f"{times} times per week", times)
+
+    raise ValueError(f"Unknown interval '{text}', expected {RULE_HELP}")
+
+
+@lru_cache(maxsize=None)
+def recurrence(interval: str):
+    """
+    Get the compiled recurrence rule of an interval, cached by its text.
+
+    :param interval: interval of a habit
+    :return: Recurrence object, or None if the interval is not a recurrence rule, so the habit has no periods
+    """
+
+    try:
+        rule = parse_rule(interval)
+    except ValueError:
+        return None
+    # Only the canonical text is a rule, so every habit with the same rule has the same interval
+    return rule if rule.rule == interval else None
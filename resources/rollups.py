@@ -0,0 +1,103 @@
+from calendar import monthrange
+from collections import Counter
+from datetime import date, timedelta
+from resources.streaks import period_key
+
+"""
+Completion rollups for the analytics reports.
+
+Every completion is counted in four rollups of its habit, one row per period in the completion_rollups table:
+
+    day:      proleptic Gregorian ordinal of the date, the same as the Daily period key
+    week:     ISO year * 100 + ISO week, the same as the Weekly period key
+    month:    year * 100 + month, e.g. 202301 for January 2023
+    weekday:  0 (Monday) to 6 (Sunday)
+
+The rollups are updated together with the tracker table, so a report only reads the handful of rollup rows of the
+periods it shows instead of the completion history.
+"""
+
+KINDS = ["day", "week", "month", "weekday"]
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Adds the counts of a rollup row of a user to the stored counts
+UPSERT = ("INSERT INTO completion_rollups (user, habit_id, kind, period, completions) VALUES (?, ?, ?, ?, ?) "
+          "ON CONFLICT (user, kind, period, habit_id) "
+          "DO UPDATE SET completions = completions + excluded.completions")
+
+# Upper bounds of the streak lengths grouped together in the streak distribution
+STREAK_BUCKETS = [(0, 0), (1, 2), (3, 6), (7, 13), (14, 29), (30, None)]
+
+
+def rollup_keys(completed_date):
+    """
+    Get the rollup periods a completion is counted in.
+
+    :param completed_date: date object, or a string in the format YYYY-MM-DD
+    :return: list of (kind, period) tuples, one for every kind in KINDS
+    """
+
+    if isinstance(completed_date, str):
+        completed_date = date.fromisoformat(completed_date[:10])
+
+    return [("day", completed_date.toordinal()),
+            ("week", period_key(completed_date, "Weekly")),
+            ("month", completed_date.year * 100 + completed_date.month),
+            ("weekday", completed_date.weekday())]
+
+
+def count_rollups(completions):
+    """
+    Count completions into rollup rows.
+
+    :param completions: iterable of (habit, completed_date, number of completions on that date) tuples; the habit is
+                        identified by its id or name
+    :return: Counter of (habit, kind, period) -> number of completions
+    """
+
+    counts = Counter()
+    for habit, completed_date, completions_on_date in completions:
+        for kind, period in rollup_keys(completed_date):
+            counts[habit, kind, period] += completions_on_date
+    return counts
+
+
+def last_periods(by: str, count: int, today: date = None):
+    """
+    Get the last weeks or months up to today, oldest first.
+
+    :param by: week or month
+    :param count: number of periods
+    :param today: last date to include (optional); defaults to today
+    :return: list of (period key, first date, last date) tuples; the last date of the current period is today
+    """
+
+    today = today or date.today()
+    periods = []
+
+    if by == "week":
+        start = today - timedelta(days=today.weekday())
+        for weeks_ago in range(count):
+            first = start - timedelta(weeks=weeks_ago)
+            periods.append((period_key(first, "Weekly"), first, min(first + timedelta(days=6), today)))
+
+    elif by == "month":
+        year, month = today.year, today.month
+        for _ in range(count):
+            last = min(date(year, month, monthrange(year, month)[1]), today)
+            periods.append((year * 100 + month, date(year, month, 1), last))
+            year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+
+    else:
+        raise ValueError(f"Unknown period '{by}', expected week or month")
+
+    return periods[::-1]
+
+
+def period_label(key: int, by: str):
+    """Readable label of a week (2023-W01) or month (2023-01) key."""
+
+    if by == "week":
+        return f"{key // 100}-W{key % 100:02d}"
+    return f"{key // 100}-{key % 100:02d}"
+
@@ -0,0 +1,44 @@
+from typing import NamedTuple
+
+"""
+Typed rows returned by the DBConn queries.  The rows are created straight from the tuples sqlite3 returns (by the row
+factory below for completions), so the values keep their database types (streak counts are integers) until they are
+formatted for output.  Named tuples have no per-instance dictionary, so they take no more memory than the plain tuples
+sqlite3 returns.
+"""
+
+
+class HabitRow(NamedTuple):
+    """A row of the habits table."""
+
+    name: str
+    description: str
+    interval: str
+    created_date: str
+    streak_count: int
+    max_streak: int
+
+
+class CompletionRow(NamedTuple):
+    """A completion in the tracker table."""
+
+    completed_date: str
+    completed_time: str
+    completed_week: str
+    habit_name: str
+
+
+# User the rows belong to when no user is selected, and the owner of all rows of databases from before users were added
+DEFAULT_USER = "default"
+
+# Columns of the habits table to select for a HabitRow, in the order of the named tuple fields
+HABIT_FIELDS = ", ".join(HabitRow._fields)
+
+
+def completion_row(cursor, row: tuple):
+    """
+    sqlite3 row factory for CompletionRow; the query must select resources.database.COMPLETION_COLUMNS, the habit name
+    comes from the habits table.
+    """
+
+    return CompletionRow(*row)
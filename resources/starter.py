@@ -1,20 +1,34 @@
 from datetime import datetime, timedelta
+from random import Random
 from resources.database import DBConn
 from resources.habit import Habit
+from resources.rows import DEFAULT_USER
 
+# Name, description and interval of the starter habits
+STARTER_HABITS = [("Drink Water", "One Liter", "Daily"), ("Read", "One Chapter", "Daily"),
+                  ("Exercise", "Thirty Minutes", "Daily"), ("Meditate", "Twenty Minutes", "Daily"),
+                  ("Walk in Nature", "One Hour", "Weekly")]
 
-def starter_habits(db_name: str = None):
-    """Set up the first 5 starter habits for the user"""
 
-    # Open connection to database
-    if db_name is not None:
-        db = DBConn(db_name)
+def starter_habits(db_name: str = None, user: str = DEFAULT_USER, storage=None):
+    """
+    Set up the first 5 starter habits for the user.
+
+    :param db_name: name of the database file (optional); main.db by default
+    :param user: user to set up the habits for
+    :param storage: storage to set up the habits in instead of a database file, e.g. a MemoryStorage (optional); the
+                    habits are set up for the user selected on it
+    """
+
+    # Open connection to database, unless a storage was given
+    if storage is not None:
+        db = storage
+    elif db_name is not None:
+        db = DBConn(db_name, user=user)
     else:
-        db = DBConn()
+        db = DBConn(user=user)
 
-    habits = ["Drink Water", "Read", "Exercise", "Meditate", "Walk in Nature"]
-    descriptions = ["One Liter", "One Chapter", "Thirty Minutes", "Twenty Minutes", "One Hour"]
-    intervals = ["Daily", "Daily", "Daily", "Daily", "Weekly"]
+    habits, descriptions, intervals = zip(*STARTER_HABITS)
 
     print("Setting up starter habits...\n")
 
@@ -27,20 +41,66 @@ def starter_habits(db_name: str = None):
         # Add 4 weeks of history
         if intervals[i] == "Daily":
             print(f"Adding history for {habits[i]} starter task...")
-            for j in range(1, 29):
-                date = datetime.today() - timedelta(days=j)
-                completed_date = date.strftime("%Y-%m-%d")
-                completed_time = date.strftime("%H:%M")
-                completed_week = str(date.isocalendar().week)
-                db.add_history(habits[i], completed_date, completed_time, completed_week)
+            dates = [datetime.today() - timedelta(days=j) for j in range(1, 29)]
 
         if intervals[i] == "Weekly":
             print(f"Adding history for {habits[i]} starter task...")
-            for k in range(1, 5):
-                date = datetime.today() - timedelta(weeks=k)
-                completed_date = date.strftime("%Y-%m-%d")
-                completed_time = date.strftime("%H:%M")
-                completed_week = str(date.isocalendar().week)
-                db.add_history(habits[i], completed_date, completed_time, completed_week)
-
-    db.conn.commit()
\ No newline at end of file
+            dates = [datetime.today() - timedelta(weeks=k) for k in range(1, 5)]
+
+        db.bulk_add_history((habits[i], date.strftime("%Y-%m-%d"), date.strftime("%H:%M"),
+                             str(date.isocalendar().week)) for date in dates)
+
+    if storage is None:
+        db.close()
+
+
+def synthetic_habits(habits: int, years: float, db_name: str = None, user: str = DEFAULT_USER, storage=None,
+                     completion_rate: float = 0.8, seed: int = 0):
+    """
+    Set up a synthetic data set of any size for benchmarks: the starter habits repeated until there are enough of them
+    (so 4 Daily habits to every Weekly one), each with the specified number of years of history up to yesterday.  Every
+    day (Daily) or week (Weekly) a habit is completed with the completion rate as probability, which gives streaks and
+    breaks of all lengths.  The same seed gives the same data set, relative to today.
+
+    :param habits: number of habits
+    :param years: years of history of every habit
+    :param db_name: name of the database file (optional); main.db by default
+    :param user: user to set up the habits for
+    :param storage: storage to set up the habits in instead of a database file, e.g. a MemoryStorage (optional)
+    :param completion_rate: share of the days/weeks the habits were completed in
+    :param seed: seed of the random completions
+    :return: number of completions added
+    """
+
+    if storage is not None:
+        db = storage
+    else:
+        db = DBConn(db_name or "main.db", user=user)
+
+    random = Random(seed)
+    today = datetime.today()
+    days = round(years * 365)
+    created_date = (today - timedelta(days=days + 1)).strftime("%Y-%m-%d %H:%M")
+
+    names = []
+    for i in range(habits):
+        name, description, interval = STARTER_HABITS[i % len(STARTER_HABITS)]
+        name = f"{name} {i}"
+        db.add_record([name, description, interval, created_date, 0, 0])
+        names.append((name, interval))
+
+    def completions():
+        for name, interval in names:
+            step = 1 if interval == "Daily" else 7
+            # Oldest first, ending yesterday (Daily) or a week ago (Weekly) like the starter habits
+            for back in range(days // step * step, 0, -step):
+                if random.random() < completion_rate:
+                    day = today - timedelta(days=back)
+                    yield (name, day.strftime("%Y-%m-%d"), f"{random.randrange(6, 23):02d}:{random.randrange(60):02d}",
+                           str(day.isocalendar().week))
+
+    inserted = db.bulk_add_history(completions())
+
+    if storage is None:
+        db.close()
+    return inserted
@@ -0,0 +1,105 @@
+from datetime import datetime
+from typing import Protocol, runtime_checkable
+
+"""
+Storage interface of the habit tracker.
+
+The commands only talk to their storage through the methods of the Storage protocol below: the habits (add, read,
+update and delete), appending completions, reading the history by habit and date range, and the streak checkpoints.
+Two engines implement it:
+
+    DBConn         - resources.database, the SQLite database file the tracker normally uses
+    MemoryStorage  - resources.memory, plain dictionaries and sorted lists, for tests and ephemeral sessions
+
+Both keep the habits of many users apart and behave the same for every method of the protocol.  The reports that
+are answered with SQL (the completion rates, weekdays and streak distribution from the rollup tables and the columnar
+analytics) and the database maintenance (archiving old completions and compacting the file) are only available on
+DBConn.
+"""
+
+
+@runtime_checkable
+class Storage(Protocol):
+    """
+    Methods every storage engine provides.  See DBConn for the full description of the parameters and return values.
+    """
+
+    @property
+    def user(self):
+        """Name of the selected user; all methods act on the habits of this user only."""
+
+    @property
+    def closed(self):
+        """True once the storage has been closed."""
+
+    def close(self):
+        """Close the storage.  Safe to call more than once."""
+
+    def get_users(self):
+        """Sorted names of all users with habits or completions."""
+
+    def delete_user(self):
+        """Delete all habits, completions and streaks of the selected user."""
+
+    # Habits
+    def add_record(self, habit_details: list):
+        """Add a habit from its 6 details; returns a success/fail message."""
+
+    def get_all(self, table_name: str = "habits", habit_name: str = None):
+        """All HabitRow (habits) or CompletionRow (tracker), optionally of a single habit."""
+
+    def get_habit_names(self):
+        """List of (name,) tuples, sorted by name."""
+
+    def get_interval(self, habit_name: str):
+        """Interval of a habit."""
+
+    def get_interval_habits(self, interval: str):
+        """HabitRow of the habits with the interval."""
+
+    def get_longest_streak(self, habit_name: str = None):
+        """HabitRow with the longest streak, or of the habit; None if there is none."""
+
+    def update_record(self, habit_name: str, attr_to_update: str, update_value: str):
+        """Change the name, description or interval of a habit; returns a message, ValueError if the name is taken."""
+
+    def delete_record(self, habit_name: str):
+        """Delete a habit together with its history, streak and rollups."""
+
+    # Completions
+    def add_history(self, habit_name: str, completed_date: str, completed_time: str, completed_week: str,
+                    once_per_period: bool = False):
+        """Append a completion and advance the streak; returns the number of completions added."""
+
+    def bulk_add_history(self, rows):
+        """Add an iterable of (habit_name, completed_date, completed_time, completed_week) all at once or not at all."""
+
+    def complete_task(self, habit_name: str, date: datetime = None):
+        """Complete a habit at most once per period; returns a success/error message."""
+
+    # History
+    def iter_history(self, habit_name: str = None, since: str = None, until: str = None):
+        """Generator of CompletionRow in date order."""
+
+    def get_history_page(self, habit_name: str = None, since: str = None, until: str = None, after: tuple = None,
+                         limit: int = 50):
+        """One page of CompletionRow and the key of the next page (None for the last page)."""
+
+    def get_history(self, habit_name: str):
+        """History object with the completed dates, weeks and periods of a habit."""
+
+    # Streaks
+    def get_streak_state(self, habit_name: str):
+        """Streak checkpoint (last period, run length, longest run) of a habit, or None."""
+
+    def check_streaks(self, interval: str = None, date: datetime = None):
+        """Reset broken streaks; returns habit name -> (completed in current period, streak was reset)."""
+
+    def get_pending(self, date: datetime = None):
+        """Habits not completed in the current period of their interval yet; broken streaks are reset."""
+
+    def recompute_streaks(self, habit_name: str = None, verify: bool = False):
+        """Rebuild the streaks from the history; returns the names of the habits whose streak was wrong."""
+
+    def update_streak(self, habit_name: str, reset_streak: bool = False):
+        """Increment the streak of a habit, or reset it to zero."""
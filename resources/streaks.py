@@ -0,0 +1,196 @@
+from datetime import date, datetime
+from resources.recurrence import parse_rule, recurrence
+from resources.rows import DEFAULT_USER
+
+"""
+Streak engine for the habit tracker.
+
+Every completion falls into a period of the recurrence rule of its habit (see resources.recurrence), e.g. a day for
+Daily habits and an ISO week for Weekly habits.  Periods are identified by integer keys, so consecutive periods can be
+found with plain arithmetic:
+
+    Daily:   the proleptic Gregorian ordinal of the date (date.toordinal)
+    Weekly:  ISO year * 100 + ISO week, e.g. 202301 for the first week of 2023
+    other:   number of periods since 0001-01-01
+
+A period counts for the streak once the habit was completed in it, or for rules like "3 times per week" once it was
+completed on that many different days.  Only that completion gets the period key in the tracker table.
+
+The streak of a habit is kept as a checkpoint (last_period, run_length, max_run).  Appending a completion only needs
+the checkpoint, so it is O(1); replaying the full completion log gives the same checkpoint and is used to verify or
+rebuild them.
+"""
+
+
+def _rule(interval: str):
+    """Compiled rule of an interval; fails for intervals that are not a recurrence rule."""
+
+    return recurrence(interval) or parse_rule(interval)
+
+
+def period_key(day, interval: str):
+    """
+    Get the integer key of the period a date falls into.
+
+    :param day: date or datetime object, or a string in the format YYYY-MM-DD
+    :param interval: interval of the habit, a recurrence rule
+    :return: period key as an integer
+    """
+
+    if isinstance(day, str):
+        day = date.fromisoformat(day[:10])
+    elif isinstance(day, datetime):
+        day = day.date()
+
+    return _rule(interval).key(day)
+
+
+def previous_period(key: int, interval: str):
+    """
+    Get the key of the period right before the specified one, taking year boundaries into account.
+
+    :param key: period key
+    :param interval: interval of the habit, a recurrence rule
+    :return: period key as an integer
+    """
+
+    return _rule(interval).previous(key)
+
+
+def counted_periods(dates, interval: str):
+    """
+    Find the completions that count for the streak: every completion of rules that are due once per period, and for
+    rules like "3 times per week" the completion on the last of the days needed in its period.
+
+    :param dates: completed dates of a habit in ascending order, as date objects or strings in the format YYYY-MM-DD
+    :param interval: interval of the habit, a recurrence rule
+    :return: generator of the period key of every completion, or None if the completion doesn't count
+    """
+
+    rule = _rule(interval)
+    period, days = None, set()
+    for day in dates:
+        if isinstance(day, str):
+            day = date.fromisoformat(day[:10])
+        key = rule.key(day)
+        if rule.target == 1:
+            yield key
+            continue
+
+        if key != period:
+            period, days = key, set()
+        counted = len(days)
+        days.add(day)
+        yield key if counted < rule.target <= len(days) else None
+
+
+def advance(checkpoint: tuple, period: int, interval: str):
+    """
+    Add a completion to a streak checkpoint.
+
+    :param checkpoint: tuple of (last_period, run_length, max_run); last_period is None if never completed
+    :param period: period key of the completion, must not be before last_period
+    :param interval: interval of the habit, a recurrence rule
+    :return: the new checkpoint tuple
+    """
+
+    last_period, run_length, max_run = checkpoint
+
+    if last_period is not None and period < last_period:
+        raise ValueError("Completions must be added in order; recompute the streak instead.")
+
+    if period == last_period:
+        # Already completed in this period, the streak doesn't change
+        return checkpoint
+    if last_period is not None and previous_period(period, interval) == last_period:
+        run_length += 1
+    else:
+        run_length = 1
+
+    return period, run_length, max(max_run, run_length)
+
+
+def replay(periods, interval: str):
+    """
+    Compute a streak checkpoint from scratch by replaying the completion log of a habit.
+
+    :param periods: iterable of period keys in ascending order
+    :param interval: interval of the habit, a recurrence rule
+    :return: checkpoint tuple of (last_period, run_length, max_run)
+    """
+
+    checkpoint = (None, 0, 0)
+    for period in periods:
+        checkpoint = advance(checkpoint, period, interval)
+    return checkpoint
+
+
+def current_streak(checkpoint: tuple, interval: str, today=None):
+    """
+    Get the streak that is currently running.  The streak is kept as long as the habit was completed in the current
+    or the previous period.
+
+    :param checkpoint: tuple of (last_period, run_length, max_run)
+    :param interval: interval of the habit, a recurrence rule
+    :param today: date to check against (optional); defaults to today
+    :return: length of the current streak
+    """
+
+    last_period, run_length, _ = checkpoint
+    if last_period is None:
+        return 0
+
+    current = period_key(today or date.today(), interval)
+    if last_period >= previous_period(current, interval):
+        return run_length
+    return 0
+
+
+def count_run(checkpoint: tuple, runs: int, period: int, interval: str):
+    """
+    Add a completion to a streak checkpoint and count the runs (streaks of one or more periods) so far.  Completions
+    before the last period are skipped, so a checkpoint can be continued with a history that overlaps it.
+
+    :param checkpoint: tuple of (last_period, run_length, max_run); last_period is None if never completed
+    :param runs: number of runs up to the checkpoint
+    :param period: period key of the completion
+    :param interval: interval of the habit, a recurrence rule
+    :return: tuple of (the new checkpoint tuple, number of runs)
+    """
+
+    if checkpoint[0] is not None and period <= checkpoint[0]:
+        return checkpoint, runs
+
+    checkpoint = advance(checkpoint, period, interval)
+    return checkpoint, runs + (checkpoint[1] == 1)
+
+
+def replay_log(cursor, habit_name: str = None, user: str = DEFAULT_USER):
+    """
+    Replay the completion log in the tracker table for all habits (or a single habit), in a single streaming query.
+    The replay starts from the checkpoint of the archived history of the habit, if it has one.
+
+    :param cursor: sqlite3 cursor
+    :param habit_name: name of the habit (optional)
+    :param user: user the habits belong to
+    :return: dictionary of habit name -> (interval, checkpoint tuple) for every habit of the user in the habits table
+    """
+
+    cursor.execute("SELECT h.name, h.interval, c.last_period, COALESCE(c.run_length, 0), COALESCE(c.max_run, 0), "
+                   "t.period_key FROM habits h "
+                   "LEFT JOIN history_checkpoints c ON c.habit_id = h.habit_id AND c.interval = h.interval "
+                   "LEFT JOIN tracker t ON t.habit_id = h.habit_id "
+                   "WHERE h.user = :user AND (:habit_name IS NULL OR h.name = :habit_name) "
+                   "ORDER BY h.name, t.period_key", {'habit_name': habit_name, 'user': user})
+
+    states = {}
+    for name, interval, *archived, period in cursor:
+        if name not in states:
+            states[name] = (interval, tuple(archived))
+        last_period = states[name][1][0]
+        # Completions that were added to the archived periods later don't change the archived streak
+        if period is None or recurrence(interval) is None or last_period is not None and period < last_period:
+            continue
+        states[name] = (interval, advance(states[name][1], period, interval))
+
+    return states
@@ -1,42 +1,113 @@
-from rich.table import Table
+import sys
+from itertools import islice
 
-""" 
-Functions to create tables using the Rich library.  Used to output a table in the terminal.
+"""
+Functions to create tables to output in the terminal.  Small tables shown in a terminal are Rich tables; long tables
+and tables written to a pipe or a file are plain text tables, which are written one row at a time.
 
     title:  String
     columns: List of strings for the column headers
-    rows: This should be a list of tuples, which is the output from the sqlite3 query
+    rows: This should be a list of tuples, which is the output from the sqlite3 query.  Values are converted to strings
+          here, so the rows can keep their database types until they are shown.  Any other iterable, e.g. a generator
+          over a query, is written as a plain text table without being loaded into memory.
 """
 
+# Tables with more rows than this are plain text even in a terminal: Rich lays out the whole table before the first
+# line is shown, which takes seconds and hundreds of MB for long tables
+PLAIN_ROWS = 1_000
 
-def create_table(title: str = "Habits", columns: list = None, rows: list = None):
-    table = Table(title=title)
-    if columns is None:
-        columns = ["Habit Name", "Description", "Interval", "Created Date", "Streak Count", "Max Streak",
-                   "\N{heavy check mark}"]
-    if rows is None:
-        rows = ["None"]
+# Number of rows the column widths of a plain text table are measured from
+SAMPLE_ROWS = 200
+
+HABIT_COLUMNS = ["Habit Name", "Description", "Interval", "Created Date", "Streak Count", "Max Streak",
+                 "\N{heavy check mark}"]
+HISTORY_COLUMNS = ["Completed Date", "Completed Time", "Week", "Habit Name"]
+
+
+class PlainTable:
+    """
+    Table written as plain text columns, one row at a time.  The column widths are measured from the header and the
+    first SAMPLE_ROWS rows, so the rows never have to be in memory at once; a longer value further down is written in
+    full and only shifts the rest of its own line.
+    """
+
+    def __init__(self, title: str, columns: list, rows):
+        self.title = title
+        self.columns = columns
+        self.rows = rows
+
+    def write(self, file=None):
+        """
+        Write the table.
+
+        :param file: file object to write to (optional); defaults to standard output
+        :return: number of rows written
+        """
+
+        file = file or sys.stdout
+        rows = iter(self.rows)
+        sample = [self._cells(row) for row in islice(rows, SAMPLE_ROWS)]
+        widths = [max([len(column)] + [len(row[i]) for row in sample]) for i, column in enumerate(self.columns)]
+        line = "  ".join(f"{{:<{width}}}" for width in widths)
+
+        if self.title:
+            file.write(self.title + "\n")
+        file.write(line.format(*self.columns).rstrip() + "\n")
+        file.write("  ".join("-" * width for width in widths) + "\n")
+        for row in sample:
+            file.write(line.format(*row).rstrip() + "\n")
+        count = len(sample)
+        for row in rows:
+            file.write(line.format(*self._cells(row)).rstrip() + "\n")
+            count += 1
+        return count
+
+    def _cells(self, row):
+        """Values of a row as strings, with empty cells for missing values."""
+
+        cells = [str(item) for item in row]
+        if len(cells) < len(self.columns):
+            cells += [""] * (len(self.columns) - len(cells))
+        return cells
+
+
+def is_plain(rows, file=None):
+    """Whether rows are shown as a plain text table: not in a terminal, too many rows for Rich, or a generator."""
+
+    if not (file or sys.stdout).isatty():
+        return True
+    return not hasattr(rows, "__len__") or len(rows) > PLAIN_ROWS
 
+
+def _table(title: str, columns: list, rows):
+    if is_plain(rows):
+        return PlainTable(title, columns, rows)
+
+    from rich.table import Table
+
+    table = Table(title=title)
     # Adding the columns and rows to the table
     for column in columns:
         table.add_column(column)
     for row in rows:
-        table.add_row(*row, style='bright_green')
+        table.add_row(*(str(item) for item in row), style='bright_green')
 
     return table
 
 
-def create_history_table(title: str = "Task History", columns: list = None, rows: list = None):
-    table = Table(title=title)
+def create_table(title: str = "Habits", columns: list = None, rows: list = None):
     if columns is None:
-        columns = ["Completed Date", "Completed Time", "Week", "Habit Name"]
+        columns = HABIT_COLUMNS
     if rows is None:
         rows = ["None"]
 
-    # Adding the columns and rows to the table
-    for column in columns:
-        table.add_column(column)
-    for row in rows:
-        table.add_row(*row, style='bright_green')
+    return _table(title, columns, rows)
 
-    return table
+
+def create_history_table(title: str = "Task History", columns: list = None, rows: list = None):
+    if columns is None:
+        columns = HISTORY_COLUMNS
+    if rows is None:
+        rows = ["None"]
+
+    return _table(title, columns, rows)
@@ -1,15 +1,47 @@
-from starter import starter_habits
-from database import DBConn
-from datetime import datetime
+import tracker
+from click.testing import CliRunner
+from resources import analytics, daemon
+from resources.database import PROFILES, ConnectionManager, DBConn, connections
+from resources.history import History
+from resources.history_io import FORMATS, read_history, write_history
+from resources.memory import MemoryStorage
+from resources.migrations import MIGRATIONS, get_version, migrate
+from resources.recurrence import RULE_CHOICES, parse_rule, recurrence
+from resources.rollups import count_rollups
+from resources.rows import CompletionRow, HabitRow
+from resources.starter import starter_habits, synthetic_habits
+from resources.storage import Storage
+from resources.streaks import current_streak, period_key, replay
+from resources.table import PLAIN_ROWS, PlainTable, create_history_table, create_table, is_plain
+from datetime import date, datetime, timedelta
+from multiprocessing import Pool
+from random import Random
+import gzip
+import io
+import json
 import os
+import sqlite3
+import subprocess
+import sys
+import time
+import pytest
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def storage(request):
+    """Every storage engine, empty: a SQLite database in memory and the in-memory engine."""
+
+    db = DBConn(name=":memory:") if request.param == "sqlite" else MemoryStorage()
+    yield db
+    db.close()
 
 
 class TestHabits:
 
     def setup_class(self):
-        # Create the test database and populate with starter habit information and history
-        self.db = DBConn(name="test.db")
-        starter_habits(db_name="test.db")
+        # Populate the in-memory storage with starter habit information and history
+        self.db = MemoryStorage()
+        starter_habits(storage=self.db)
 
     def test_add_record(self):
         self.db.add_record(["Test Habit", "Test Desc", "Daily", datetime.now().strftime("%Y-%m-%d %H:%M"),
@@ -52,5 +84,1446 @@ class TestHabits:
         self.db.update_streak("Drink Water", reset_streak=True)
 
     def teardown_class(self):
-        self.db.conn.close()  # Produces sqlite3 Error, but if I don't include this line then db doesn't delete
-        os.remove("test.db")
+        self.db.close()
+
+
+class TestSyntheticHabits:
+
+    def test_synthetic_habits(self):
+        db, same = MemoryStorage(), MemoryStorage()
+        completions = synthetic_habits(10, 1, storage=db, seed=7)
+
+        assert completions == len(db.get_all(table_name="tracker"))
+        assert [len(db.get_interval_habits(interval)) for interval in ("Daily", "Weekly")] == [8, 2]
+        # Roughly 80% of the days/weeks of a year are completed
+        assert 0.7 * (8 * 365 + 2 * 52) < completions < 0.9 * (8 * 365 + 2 * 52)
+        assert db.recompute_streaks(verify=True) == []
+
+        assert synthetic_habits(10, 1, storage=same, seed=7) == completions
+        assert list(same.iter_history()) == list(db.iter_history())
+
+
+class TestStreaks:
+
+    @staticmethod
+    def _populate(db, count):
+        # Create daily habits with a streak of 3; the even ones were last completed today, the odd ones yesterday
+        for i in range(count):
+            db.add_record([f"Habit {i}", "--", "Daily", datetime.now().strftime("%Y-%m-%d %H:%M"), 0, 0])
+            for days in range(3):
+                date = datetime.now() - timedelta(days=days + i % 2)
+                db.add_history(f"Habit {i}", date.strftime("%Y-%m-%d"), date.strftime("%H:%M"),
+                               str(date.isocalendar().week))
+        db.conn.commit()
+
+    @staticmethod
+    def _count_statements(db):
+        statements = []
+        db.conn.set_trace_callback(statements.append)
+        db.check_streaks(date=datetime.now() + timedelta(days=1))
+        db.conn.set_trace_callback(None)
+        return len(statements)
+
+    def test_check_streaks_resets_broken_streaks(self):
+        db = DBConn(name=":memory:")
+        self._populate(db, 4)
+        assert db.check_streaks()["Habit 0"] == (True, False)
+        assert db.get_longest_streak("Habit 1")[4] == 3
+
+        # Tomorrow the streak of the habits that were not completed today is broken
+        status = db.check_streaks(date=datetime.now() + timedelta(days=1))
+
+        assert status["Habit 0"] == (False, False)
+        assert status["Habit 1"] == (False, True)
+        assert db.get_longest_streak("Habit 0")[4] == 3
+        assert db.get_longest_streak("Habit 1")[4] == 0
+        assert db.get_longest_streak("Habit 1")[5] == 3
+
+    def test_check_streaks_query_count_is_constant(self):
+        small = DBConn(name=":memory:")
+        self._populate(small, 5)
+        large = DBConn(name=":memory:")
+        self._populate(large, 500)
+
+        assert self._count_statements(small) == self._count_statements(large)
+
+    def test_streak_follows_completion_log(self):
+        db = DBConn(name=":memory:")
+        db.add_record(["Walk", "--", "Weekly", "2022-01-01 00:00", 0, 0])
+        # Weeks 51 and 52 of 2022 and week 1 of 2023 are consecutive, week 3 starts a new run
+        for completed_date in ["2022-12-21", "2022-12-28", "2022-12-29", "2023-01-04", "2023-01-18"]:
+            db.add_history("Walk", completed_date, "12:00", "0")
+        db.conn.commit()
+
+        assert db.get_streak_state("Walk") == (202303, 1, 3)
+
+    def test_out_of_order_completion_is_replayed(self):
+        db = DBConn(name=":memory:")
+        db.add_record(["Read", "--", "Daily", "2022-01-01 00:00", 0, 0])
+        db.add_history("Read", "2022-01-01", "12:00", "52")
+        db.add_history("Read", "2022-01-03", "12:00", "1")
+        db.add_history("Read", "2022-01-02", "12:00", "52")
+        db.conn.commit()
+
+        assert db.get_streak_state("Read")[1:] == (3, 3)
+
+    def test_rename_keeps_history_and_streak(self):
+        db = DBConn(name=":memory:")
+        self._populate(db, 1)
+        db.update_record("Habit 0", "name", "Renamed")
+
+        assert len(db.get_history("Renamed").dates) == 3
+        assert db.get_streak_state("Renamed")[1] == 3
+        assert db.recompute_streaks(verify=True) == []
+
+    def test_verify_detects_and_repairs_drift(self):
+        db = DBConn(name=":memory:")
+        self._populate(db, 2)
+        db.update_streak("Habit 0")
+
+        assert db.recompute_streaks(verify=True) == ["Habit 0"]
+        assert db.recompute_streaks() == ["Habit 0"]
+        assert db.recompute_streaks(verify=True) == []
+
+
+class TestRecurrence:
+
+    # Year boundaries (2020 has an ISO week 53), a leap day and the DST changes in Europe and the US
+    DATES = [date(2020, 12, 28), date(2020, 12, 31), date(2021, 1, 1), date(2021, 1, 3), date(2021, 1, 4),
+             date(2024, 2, 28), date(2024, 2, 29), date(2024, 3, 1), date(2023, 3, 12), date(2023, 3, 26),
+             date(2023, 10, 29), date(2023, 11, 5)]
+    RULES = ["Daily", "Weekly", "Weekdays", "Monthly", "Every 3 days", "Every 14 days", "3 times per week"]
+
+    def test_parse_rule(self):
+        assert parse_rule("  every 3   DAYS ").rule == "Every 3 days"
+        assert parse_rule("every 1 day").rule == "Daily"
+        assert parse_rule("1 time per week").rule == "Weekly"
+        assert parse_rule("2 times a week").rule == "2 times per week"
+        assert parse_rule("2 times per week").target == 2
+        for text in ("Fortnightly", "Every 0 days", "8 times per week", ""):
+            with pytest.raises(ValueError):
+                parse_rule(text)
+        # Only the canonical text of a rule is a recurrence rule
+        assert recurrence("every 3 days") is None
+        assert recurrence("Every 3 days") is recurrence("Every 3 days")
+        assert all(recurrence(choice) for choice in RULE_CHOICES if "N" not in choice)
+
+    @pytest.mark.parametrize("rule", RULES)
+    @pytest.mark.parametrize("day", DATES, ids=str)
+    def test_period_invariants(self, rule, day):
+        rule = recurrence(rule)
+        key = rule.key(day)
+        start, end = rule.start(key), rule.end(key)
+        assert start <= day <= end
+        assert rule.key(start) == rule.key(end) == key
+        assert rule.next(key) == rule.key(end + timedelta(days=1))
+        assert rule.previous(key) == rule.key(start - timedelta(days=1))
+        assert rule.next(rule.previous(key)) == key
+        assert rule.index(rule.start(rule.next(key)).toordinal()) == rule.index(start.toordinal()) + 1
+
+    def test_iso_week_53(self):
+        weekly = recurrence("Weekly")
+        assert weekly.key(date(2021, 1, 3)) == 202053
+        assert weekly.next(202053) == 202101
+        assert weekly.previous(202101) == 202053
+        assert weekly.previous(202201) == 202152
+        assert recurrence("Weekdays").key(date(2021, 1, 3)) == recurrence("Weekdays").key(date(2021, 1, 1))
+        assert recurrence("Monthly").end(recurrence("Monthly").key(date(2024, 2, 1))) == date(2024, 2, 29)
+
+    @pytest.mark.parametrize("zone", ["Europe/Berlin", "America/New_York"])
+    def test_local_days_around_dst(self, zone, monkeypatch):
+        monkeypatch.setenv("TZ", zone)
+        time.tzset()
+        try:
+            for day in self.DATES[-4:]:
+                # The first and last minute of the local day, whether it has 23, 24 or 25 hours
+                first = time.mktime((day.year, day.month, day.day, 0, 0, 0, 0, 0, -1))
+                last = time.mktime((day.year, day.month, day.day, 23, 59, 0, 0, 0, -1))
+                for rule in self.RULES:
+                    assert period_key(datetime.fromtimestamp(first), rule) == recurrence(rule).key(day)
+                    assert period_key(datetime.fromtimestamp(last), rule) == recurrence(rule).key(day)
+                    assert period_key(datetime.fromtimestamp(last + 60), rule) == \
+                        recurrence(rule).key(day + timedelta(days=1))
+        finally:
+            monkeypatch.undo()
+            time.tzset()
+
+
+def open_database(path: str):
+    """Worker of the concurrent upgrade test: opens the database, which creates and upgrades it if needed."""
+
+    with DBConn(name=path) as db:
+        return get_version(db.conn)
+
+
+class TestMigrations:
+
+    def test_concurrent_upgrade_of_new_database(self, tmp_path):
+        # Every process sees an empty file and starts upgrading it at the same time
+        for attempt in range(5):
+            path = str(tmp_path / f"new_{attempt}.db")
+            with Pool(8) as pool:
+                assert pool.map(open_database, [path] * 8) == [len(MIGRATIONS)] * 8
+
+            with DBConn(name=path) as db:
+                db.add_record(["Read", "--", "Daily", "2022-01-01 00:00", 0, 0])
+                assert "inserted" in db.complete_task("Read", datetime(2023, 1, 2))
+
+    def test_upgrade_existing_database(self, tmp_path):
+        # Create a database file with the original, unversioned schema
+        path = str(tmp_path / "old.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE habits (name TEXT PRIMARY KEY, description TEXT, interval TEXT, "
+                     "created_date TEXT, streak_count INTEGER, max_streak INTEGER)")
+        conn.execute("CREATE TABLE tracker (completed_date TEXT, completed_time TEXT, completed_week TEXT, "
+                     "habit_name TEXT, FOREIGN KEY (habit_name) REFERENCES habits(name))")
+        conn.execute("INSERT INTO habits VALUES ('Read', '--', 'Daily', '2022-01-01 00:00', 0, 0)")
+        conn.execute("INSERT INTO tracker VALUES ('2022-01-01', '12:00', '52', 'Read')")
+        conn.commit()
+        conn.close()
+
+        db = DBConn(name=path)
+        indexes = {row[0] for row in db.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+        assert get_version(db.conn) == len(MIGRATIONS)
+        assert {"idx_tracker_habit_date", "idx_tracker_habit_period"} <= indexes
+        assert db.get_history("Read") == ["2022-01-01", "52"]
+
+    def test_period_keys_for_old_rows(self, tmp_path):
+        # Weekly completions stored with bare week numbers, across a year boundary
+        path = str(tmp_path / "old.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE habits (name TEXT PRIMARY KEY, description TEXT, interval TEXT, "
+                     "created_date TEXT, streak_count INTEGER, max_streak INTEGER)")
+        conn.execute("CREATE TABLE tracker (completed_date TEXT, completed_time TEXT, completed_week TEXT, "
+                     "habit_name TEXT, FOREIGN KEY (habit_name) REFERENCES habits(name))")
+        conn.execute("INSERT INTO habits VALUES ('Walk', '--', 'Weekly', '2022-01-01 00:00', 0, 0)")
+        conn.execute("INSERT INTO tracker VALUES ('2022-12-28', '12:00', '52', 'Walk')")
+        conn.execute("INSERT INTO tracker VALUES ('2023-01-04', '12:00', '1', 'Walk')")
+        conn.commit()
+        conn.close()
+
+        db = DBConn(name=path)
+        history = db.get_history("Walk")
+
+        assert history.periods == {202252, 202301}
+        assert history.has_period(202301) and not history.has_period(202201)
+        assert db.get_streak_state("Walk") == (202301, 2, 2)
+
+    def test_interval_change_rekeys_history(self):
+        db = DBConn(name=":memory:")
+        db.add_record(["Walk", "--", "Weekly", "2022-01-01 00:00", 0, 0])
+        db.add_history("Walk", "2023-01-02", "12:00", "1")
+        db.add_history("Walk", "2023-01-03", "12:00", "1")
+        db.conn.commit()
+        assert db.get_streak_state("Walk")[1] == 1
+
+        db.update_record("Walk", "interval", "Daily")
+        assert db.get_history("Walk").periods == {date(2023, 1, 2).toordinal(), date(2023, 1, 3).toordinal()}
+        assert db.get_streak_state("Walk")[1] == 2
+
+    def test_migrate_is_idempotent(self):
+        db = DBConn(name=":memory:")
+        assert migrate(db.conn) == len(MIGRATIONS)
+
+    def test_history_lookup_uses_index(self):
+        db = DBConn(name=":memory:")
+        plan = db.cursor.execute("EXPLAIN QUERY PLAN SELECT completed_date FROM tracker WHERE habit_id = 1 "
+                                 "AND completed_date = '2022-01-01'").fetchall()
+        assert "SEARCH tracker USING COVERING INDEX idx_tracker_habit_date" in str(plan)
+
+    def test_upgrade_from_version_0_keeps_streaks_and_rollups(self, tmp_path):
+        # The streaks, period keys and rollups computed by the migrations are pinned here, so they don't change when
+        # the streak engine or the rollups change
+        path = str(tmp_path / "v0.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE habits (name TEXT PRIMARY KEY, description TEXT, interval TEXT, "
+                     "created_date TEXT, streak_count INTEGER, max_streak INTEGER)")
+        conn.execute("CREATE TABLE tracker (completed_date TEXT, completed_time TEXT, completed_week TEXT, "
+                     "habit_name TEXT, FOREIGN KEY (habit_name) REFERENCES habits(name))")
+        conn.executemany("INSERT INTO habits VALUES (?, '--', ?, '2020-01-01 00:00', 0, 0)",
+                         [("Read", "Daily"), ("Walk", "Weekly")])
+        conn.executemany("INSERT INTO tracker VALUES (?, '12:00', ?, ?)",
+                         [("2022-12-30", "52", "Read"), ("2022-12-31", "52", "Read"), ("2023-01-01", "52", "Read"),
+                          ("2023-01-03", "1", "Read"), ("2020-12-31", "53", "Walk"), ("2021-01-05", "1", "Walk"),
+                          ("2021-01-12", "2", "Walk")])
+        conn.commit()
+        conn.close()
+
+        with DBConn(name=path) as db:
+            assert db.get_streak_state("Read") == (date(2023, 1, 3).toordinal(), 1, 3)
+            # Week 53 of 2020 is followed by week 1 of 2021
+            assert db.get_streak_state("Walk") == (202102, 3, 3)
+            assert [(habit.name, habit.streak_count, habit.max_streak) for habit in db.get_all()] == [
+                ("Read", 0, 3), ("Walk", 0, 3)]
+            assert db.cursor.execute("SELECT period_key FROM tracker ORDER BY rowid").fetchall() == [
+                (date(2022, 12, day).toordinal(),) for day in (30, 31)] + [
+                (date(2023, 1, day).toordinal(),) for day in (1, 3)] + [(202053,), (202101,), (202102,)]
+            assert db.cursor.execute("SELECT h.name, r.kind, r.period, r.completions FROM completion_rollups r "
+                                     "JOIN habits h USING (habit_id) WHERE kind IN ('week', 'month') "
+                                     "ORDER BY h.name, r.kind, r.period").fetchall() == [
+                ("Read", "month", 202212, 2), ("Read", "month", 202301, 2),
+                ("Read", "week", 202252, 3), ("Read", "week", 202301, 1),
+                ("Walk", "month", 202012, 1), ("Walk", "month", 202101, 2),
+                ("Walk", "week", 202053, 1), ("Walk", "week", 202101, 1), ("Walk", "week", 202102, 1)]
+            assert db.recompute_streaks(verify=True) == []
+
+    def test_upgrade_adds_due_index(self, tmp_path):
+        path = str(tmp_path / "v8.db")
+        with DBConn(name=path) as db:
+            db.add_record(["Read", "--", "Daily", "2022-01-01 00:00", 0, 0])
+            db.add_history("Read", "2023-01-02", "08:00", "1")
+            db.conn.commit()
+            # Back to the schema of version 8
+            db.cursor.execute("DROP INDEX idx_habits_due")
+            db.cursor.execute("ALTER TABLE habits DROP COLUMN last_period")
+            db.cursor.execute("PRAGMA user_version = 8")
+            db.conn.commit()
+
+        with DBConn(name=path) as db:
+            assert get_version(db.conn) == len(MIGRATIONS)
+            assert db.cursor.execute("SELECT last_period FROM habits").fetchall() == [(date(2023, 1, 2).toordinal(),)]
+
+            statements = []
+            db.conn.set_trace_callback(statements.append)
+            assert [habit.name for habit in db.get_pending(datetime(2023, 1, 3))] == ["Read"]
+            assert db.get_pending(datetime(2023, 1, 2)) == []
+            db.conn.set_trace_callback(None)
+            plan = str(db.cursor.execute(f"EXPLAIN QUERY PLAN {statements[-1]}").fetchall())
+            assert "USING INDEX idx_habits_due (user=? AND interval=? AND last_period<?)" in plan
+            assert "SCAN habits" not in plan
+
+    def test_upgrade_adds_users(self, tmp_path):
+        # A version 5 database: existing rows move to the default user, and other users can reuse the habit names
+        path = str(tmp_path / "old.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE habits (name TEXT PRIMARY KEY, description TEXT, interval TEXT, "
+                     "created_date TEXT, streak_count INTEGER, max_streak INTEGER)")
+        conn.execute("CREATE TABLE tracker (completed_date TEXT, completed_time TEXT, completed_week TEXT, "
+                     "habit_name TEXT, FOREIGN KEY (habit_name) REFERENCES habits(name))")
+        conn.execute("INSERT INTO habits VALUES ('Read', '--', 'Daily', '2022-01-01 00:00', 0, 0)")
+        conn.execute("INSERT INTO tracker VALUES ('2023-01-02', '12:00', '1', 'Read')")
+        conn.commit()
+        for migration in MIGRATIONS[:5]:
+            migration(conn.cursor())
+        conn.execute("PRAGMA user_version = 5")
+        conn.commit()
+        conn.close()
+
+        db = DBConn(name=path)
+        assert get_version(db.conn) == len(MIGRATIONS)
+        assert db.get_users() == ["default"]
+        assert db.get_streak_state("Read") == (date(2023, 1, 2).toordinal(), 1, 1)
+        assert db.get_weekday_counts() == {"Read": [1, 0, 0, 0, 0, 0, 0]}
+
+        db.user = "alice"
+        assert db.add_record(["Read", "--", "Daily", "2022-01-01 00:00", 0, 0]) == "Habit 'Read' added successfully."
+        assert db.get_history("Read") == []
+
+
+    def test_upgrade_adds_habit_ids(self, tmp_path):
+        # A version 6 database with the history of a deleted habit, which is dropped by the upgrade
+        path = str(tmp_path / "old.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE habits (name TEXT PRIMARY KEY, description TEXT, interval TEXT, "
+                     "created_date TEXT, streak_count INTEGER, max_streak INTEGER)")
+        conn.execute("CREATE TABLE tracker (completed_date TEXT, completed_time TEXT, completed_week TEXT, "
+                     "habit_name TEXT, FOREIGN KEY (habit_name) REFERENCES habits(name))")
+        conn.executemany("INSERT INTO habits VALUES (?, '--', 'Daily', '2022-01-01 00:00', 0, 0)",
+                         [("Walk",), ("Read",)])
+        conn.executemany("INSERT INTO tracker VALUES (?, '12:00', '1', ?)",
+                         [("2023-01-02", "Read"), ("2023-01-03", "Read"), ("2023-01-02", "Deleted")])
+        conn.commit()
+        for migration in MIGRATIONS[:6]:
+            migration(conn.cursor())
+        conn.execute("PRAGMA user_version = 6")
+        conn.commit()
+        conn.close()
+
+        db = DBConn(name=path)
+        assert get_version(db.conn) == len(MIGRATIONS)
+        assert [row.name for row in db.get_all()] == ["Walk", "Read"]
+        assert [row.habit_name for row in db.iter_history()] == ["Read", "Read"]
+        assert db.get_streak_state("Read") == (date(2023, 1, 3).toordinal(), 2, 2)
+        assert db.get_weekday_counts() == {"Walk": [0] * 7, "Read": [1, 1, 0, 0, 0, 0, 0]}
+        assert db.cursor.execute("PRAGMA foreign_key_check").fetchall() == []
+
+        # Deleting a habit deletes its history, streak and rollups with it
+        db.delete_record("Read")
+        for table in ("tracker", "streak_state", "completion_rollups"):
+            assert db.cursor.execute(f"SELECT count(*) FROM {table} WHERE habit_id = 2").fetchone()[0] == 0
+
+
+class TestHistory:
+
+    def setup_class(self):
+        self.history = History([("2022-12-30", "52"), ("2023-01-02", "1"), ("2023-01-05", "1")])
+
+    def test_drop_in_for_list(self):
+        assert list(self.history) == ["2022-12-30", "52", "2023-01-02", "1", "2023-01-05", "1"]
+        assert "2023-01-02" in self.history
+        assert "52" in self.history
+        assert "2023-01-03" not in self.history
+
+    def test_separate_date_and_week_indexes(self):
+        assert self.history.has_date("2023-01-05")
+        assert not self.history.has_date("1")
+        assert self.history.has_week(52)
+        assert not self.history.has_week("2023-01-05")
+
+    def test_completed_between(self):
+        assert self.history.completed_between("2022-12-31", "2023-01-02")
+        assert not self.history.completed_between("2022-12-31", "2023-01-01")
+        assert not self.history.completed_between("2023-01-06", "2023-12-31")
+
+
+class TestConnectionManager:
+
+    def test_shared_connection(self, tmp_path):
+        path = str(tmp_path / "shared.db")
+        with ConnectionManager() as manager:
+            db = manager.get(path)
+            assert manager.get(path) is db
+            assert manager.get(str(tmp_path / "other.db")) is not db
+
+        # Leaving the block closes every connection deterministically
+        assert db.closed
+
+    def test_reopen_after_close(self, tmp_path):
+        path = str(tmp_path / "shared.db")
+        manager = ConnectionManager()
+        db = manager.get(path)
+        manager.close()
+        assert manager.get(path) is not db
+        assert not manager.get(path).closed
+        manager.close()
+
+    def test_close_is_idempotent(self):
+        with DBConn(name=":memory:") as db:
+            db.close()
+        assert db.closed
+
+
+class TestProfiles:
+
+    def test_default_profile_uses_wal(self, tmp_path):
+        with DBConn(name=str(tmp_path / "wal.db")) as db:
+            assert db.cursor.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert db.cursor.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+            assert db.cursor.execute("PRAGMA busy_timeout").fetchone()[0] == PROFILES["default"]["busy_timeout"]
+
+    def test_safe_profile_with_override(self, tmp_path):
+        with DBConn(name=str(tmp_path / "safe.db"), profile="safe", cache_size=-4000) as db:
+            assert db.cursor.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+            assert db.cursor.execute("PRAGMA synchronous").fetchone()[0] == 2  # FULL
+            assert db.cursor.execute("PRAGMA cache_size").fetchone()[0] == -4000
+
+    def test_unknown_profile(self):
+        with pytest.raises(ValueError):
+            DBConn(name=":memory:", profile="turbo")
+
+
+class TestBulkHistory:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, storage):
+        self.db = storage
+        self.db.add_record(["Read", "One Chapter", "Daily", "2022-01-01 08:00", 0, 0])
+        self.rows = [("Read", f"2022-01-{day:02d}", "08:00", str(datetime(2022, 1, day).isocalendar()[1]))
+                     for day in range(1, 29)]
+
+    def test_bulk_add_history_from_generator(self):
+        assert self.db.bulk_add_history(row for row in self.rows) == 28
+        assert len(self.db.get_history("Read").dates) == 28
+
+    def test_bulk_add_history_is_atomic(self):
+        def rows():
+            yield from self.rows
+            raise ValueError("broken input")
+
+        with pytest.raises(ValueError):
+            self.db.bulk_add_history(rows())
+        assert list(self.db.iter_history()) == []
+
+    def test_bulk_add_history_of_unknown_habit(self):
+        with pytest.raises(ValueError, match="does not exist"):
+            self.db.bulk_add_history(self.rows + [("Swim", "2022-01-01", "08:00", "52")])
+        assert list(self.db.iter_history()) == []
+        assert self.db.get_streak_state("Read") == (None, 0, 0)
+
+    @pytest.mark.parametrize("fmt", FORMATS)
+    def test_export_import_round_trip(self, fmt):
+        self.db.bulk_add_history(self.rows)
+        file = io.StringIO()
+        assert write_history(file, self.db.iter_history("Read"), fmt) == 28
+
+        file.seek(0)
+        assert list(read_history(file, fmt)) == self.rows
+
+    def test_import_fills_in_optional_fields(self):
+        file = io.StringIO('{"habit_name": "Read", "completed_date": "2023-01-01"}\n')
+        assert list(read_history(file, "jsonl")) == [("Read", "2023-01-01", "00:00", "52")]
+
+    def test_import_rejects_invalid_records(self):
+        file = io.StringIO("completed_date,habit_name\nyesterday,Read\n")
+        with pytest.raises(ValueError):
+            list(read_history(file, "csv"))
+
+
+def complete_on_days(path: str, habit_names: list, days: list):
+    """Worker of the concurrency stress test: completes the habits on all days, with its own connection."""
+
+    with DBConn(name=path) as db:
+        return [db.complete_task(habit_name, day) for day in days for habit_name in habit_names]
+
+
+class TestCompleteTask:
+
+    def setup_method(self):
+        self.db = DBConn(name=":memory:")
+        self.db.add_record(["Read", "One Chapter", "Daily", "2022-01-01 08:00", 0, 0])
+        self.db.add_record(["Walk", "Around the block", "Weekly", "2022-01-01 08:00", 0, 0])
+
+    def test_complete_once_per_period(self):
+        assert "1 row(s)" in self.db.complete_task("Read", datetime(2023, 1, 2, 8, 0))
+        assert "already completed" in self.db.complete_task("Read", datetime(2023, 1, 2, 20, 0))
+        assert "1 row(s)" in self.db.complete_task("Walk", datetime(2023, 1, 2, 8, 0))
+        assert "already completed" in self.db.complete_task("Walk", datetime(2023, 1, 8, 8, 0))
+
+        assert len(self.db.get_all(table_name="tracker")) == 2
+        assert self.db.get_weekday_counts() == {"Read": [1, 0, 0, 0, 0, 0, 0], "Walk": [1, 0, 0, 0, 0, 0, 0]}
+        assert not self.db.conn.in_transaction
+
+    def test_imported_history_counts_as_completed(self):
+        self.db.add_history("Read", "2023-01-02", "07:00", "1")
+        self.db.conn.commit()
+
+        assert "already completed" in self.db.complete_task("Read", datetime(2023, 1, 2, 8, 0))
+
+    def test_parallel_completers(self, tmp_path):
+        path = str(tmp_path / "stress.db")
+        with DBConn(name=path) as db:
+            db.add_record(["Read", "One Chapter", "Daily", "2022-01-01 08:00", 0, 0])
+            db.add_record(["Walk", "Around the block", "Weekly", "2022-01-01 08:00", 0, 0])
+
+        # Every worker completes both habits on every day of three weeks, each in its own random order of days
+        days = [datetime(2023, 1, 2, 8, 0) + timedelta(days=day) for day in range(21)]
+        orders = [Random(worker).sample(days, len(days)) for worker in range(8)]
+        with Pool(8) as pool:
+            messages = [message for results in pool.starmap(complete_on_days, [(path, ["Read", "Walk"], order)
+                                                                               for order in orders])
+                        for message in results]
+
+        assert all(isinstance(message, str) for message in messages)
+        assert sum("inserted" in message for message in messages) == 21 + 3
+
+        with DBConn(name=path) as db:
+            assert len(db.get_all(table_name="tracker")) == 21 + 3
+            assert db.get_longest_streak("Read").max_streak == 21
+            assert db.get_longest_streak("Walk").max_streak == 3
+            assert sum(db.get_weekday_counts()["Read"]) == 21
+            assert db.recompute_streaks(verify=True) == []
+
+
+
+class TestStorage:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, storage):
+        self.db = storage
+        self.db.add_record(["Read", "One Chapter", "Daily", "2022-01-01 08:00", 0, 0])
+        self.db.add_record(["Walk", "Around the block", "Weekly", "2022-01-01 08:00", 0, 0])
+
+    def test_implements_protocol(self):
+        assert isinstance(self.db, Storage)
+
+    def test_complete_task_and_streaks(self):
+        days = [datetime.now() - timedelta(days=day) for day in (3, 2, 1)]
+        for day in days:
+            assert "1 row(s)" in self.db.complete_task("Read", day)
+        assert "already completed" in self.db.complete_task("Read", days[-1])
+        # An older completion replays the streak
+        older = days[0] - timedelta(days=1)
+        self.db.add_history("Read", older.strftime("%Y-%m-%d"), "08:00", str(older.isocalendar().week))
+
+        assert self.db.get_streak_state("Read") == (period_key(days[-1], "Daily"), 4, 4)
+        assert self.db.get_longest_streak() == HabitRow("Read", "One Chapter", "Daily", "2022-01-01 08:00", 4, 4)
+        assert self.db.check_streaks() == {"Read": (False, False), "Walk": (False, False)}
+        assert self.db.check_streaks(date=datetime.now() + timedelta(days=1)) == {"Read": (False, True),
+                                                                                  "Walk": (False, False)}
+        assert self.db.get_longest_streak("Read").streak_count == 0
+        assert self.db.recompute_streaks(verify=True) == ["Read"]
+        assert self.db.recompute_streaks() == ["Read"]
+        assert self.db.recompute_streaks(verify=True) == []
+
+    def test_pending(self):
+        now = datetime.now()
+        self.db.add_record(["Juggle", "--", "Sometimes", "2022-01-01 08:00", 0, 0])
+        for days in (2, 1):
+            self.db.complete_task("Read", now - timedelta(days=days))
+        self.db.complete_task("Walk", now)
+
+        # Read is due today and keeps its streak until the end of the day; Juggle has no periods, so it is always due
+        assert [(habit.name, habit.streak_count) for habit in self.db.get_pending()] == [("Read", 2), ("Juggle", 0)]
+        status = self.db.check_streaks()
+        assert {name for name, (completed, _) in status.items() if not completed} == {"Read"}
+
+        self.db.complete_task("Read", now)
+        assert [habit.name for habit in self.db.get_pending()] == ["Juggle"]
+        # The day after tomorrow the streak of Read is broken; Walk is due again if a new week has started by then
+        pending = {habit.name: habit.streak_count for habit in self.db.get_pending(now + timedelta(days=2))}
+        assert pending["Read"] == 0 and pending["Juggle"] == 0
+        assert self.db.get_longest_streak("Read").streak_count == 0
+
+    def test_rename_and_interval_change_keep_history(self):
+        self.db.bulk_add_history([("Walk", "2023-01-02", "08:00", "1"), ("Walk", "2023-01-03", "08:00", "1")])
+        self.db.update_record("Walk", "name", "Hike")
+        assert self.db.get_habit_names() == [("Hike",), ("Read",)]
+        assert [row.name for row in self.db.get_all()] == ["Read", "Hike"]
+        assert [row.habit_name for row in self.db.iter_history()] == ["Hike", "Hike"]
+        assert self.db.get_streak_state("Hike") == (202301, 1, 1)
+
+        assert "Updated 1" in self.db.update_record("Hike", "interval", "Daily")
+        assert self.db.get_streak_state("Hike") == (date(2023, 1, 3).toordinal(), 2, 2)
+        assert self.db.get_history("Hike").periods == {date(2023, 1, 2).toordinal(), date(2023, 1, 3).toordinal()}
+        assert "No records" in self.db.update_record("Swim", "description", "Laps")
+
+    def test_rename_to_existing_name_fails(self):
+        self.db.complete_task("Walk", datetime(2023, 1, 2, 8, 0))
+        with pytest.raises(ValueError, match="already exists"):
+            self.db.update_record("Walk", "name", "Read")
+
+        assert [row.name for row in self.db.get_all()] == ["Read", "Walk"]
+        assert [row.habit_name for row in self.db.iter_history()] == ["Walk"]
+        assert self.db.get_streak_state("Walk") == (202301, 1, 1)
+        assert "Updated 1" in self.db.update_record("Walk", "name", "Hike")
+
+    def test_verify_changes_nothing(self):
+        self.db.bulk_add_history([("Read", "2023-01-02", "08:00", "1"), ("Read", "2023-01-03", "08:00", "1")])
+        # Stored streak and period keys that don't match the history
+        self.db.update_streak("Read")
+        if isinstance(self.db, MemoryStorage):
+            self.db._data.periods["Read"] = {date(2023, 1, 2).toordinal()}
+        else:
+            self.db.cursor.execute("UPDATE tracker SET period_key = NULL WHERE completed_date = '2023-01-03'")
+            self.db.conn.commit()
+
+        def state():
+            if isinstance(self.db, MemoryStorage):
+                periods = set(self.db._data.periods["Read"])
+            else:
+                periods = self.db.cursor.execute("SELECT completed_date, period_key FROM tracker").fetchall()
+            return self.db.get_all(), self.db.get_streak_state("Read"), periods
+
+        before = state()
+        assert self.db.recompute_streaks(verify=True) == ["Read"]
+        assert state() == before
+
+    def test_delete_removes_history(self):
+        self.db.complete_task("Read", datetime(2023, 1, 2, 8, 0))
+        self.db.complete_task("Walk", datetime(2023, 1, 2, 8, 0))
+        self.db.delete_record("Read")
+        assert self.db.get_all(habit_name="Read") == [] and self.db.get_streak_state("Read") is None
+        assert [row.habit_name for row in self.db.iter_history()] == ["Walk"]
+
+        # A new habit with the same name starts from scratch
+        self.db.add_record(["Read", "Two Chapters", "Daily", "2023-01-02 09:00", 0, 0])
+        assert self.db.get_history("Read") == []
+        assert self.db.get_longest_streak("Read").max_streak == 0
+        assert "1 row(s)" in self.db.complete_task("Read", datetime(2023, 1, 2, 20, 0))
+
+    def test_completing_unknown_habit_fails(self):
+        assert isinstance(self.db.complete_task("Swim"), ValueError)
+        assert list(self.db.iter_history()) == []
+
+    def test_users_are_separate(self):
+        self.db.complete_task("Read", datetime(2023, 1, 2, 8, 0))
+        self.db.user = "alice"
+        assert self.db.get_all() == [] and list(self.db.iter_history()) == []
+        self.db.add_record(["Stretch", "--", "Daily", "2023-01-01 08:00", 0, 0])
+        assert self.db.get_users() == ["alice", "default"]
+
+        self.db.delete_user()
+        assert self.db.get_users() == ["default"]
+
+    def test_cli_memory_storage(self):
+        runner = CliRunner(mix_stderr=False)
+        with runner.isolated_filesystem():
+            result = runner.invoke(tracker.cli, ["--storage", "memory", "show-today", "--format", "csv"])
+            assert result.exit_code == 0 and "Drink Water" in result.stdout
+            result = runner.invoke(tracker.cli, ["--storage", "memory", "analyze-habits", "--report", "rates"])
+            assert result.exit_code == 1 and "sqlite storage" in result.stderr
+            assert not os.path.exists("main.db")
+        connections.close()
+
+
+class TestRecurrenceStorage:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, storage):
+        self.db = storage
+        for name, interval in (("Swim", "3 times per week"), ("Stretch", "Weekdays"), ("Rent", "Monthly"),
+                               ("Water", "Every 3 days")):
+            self.db.add_record([name, "--", interval, "2022-01-01 08:00", 0, 0])
+
+    def key(self, interval, day):
+        return recurrence(interval).key(date.fromisoformat(day))
+
+    def test_times_per_week(self):
+        week = self.key("3 times per week", "2023-01-02")
+        assert "1 row(s)" in self.db.complete_task("Swim", datetime(2023, 1, 2, 8))
+        # Once per day, so a second completion on Monday doesn't count as a second day
+        assert "already completed" in self.db.complete_task("Swim", datetime(2023, 1, 2, 20))
+        assert "1 row(s)" in self.db.complete_task("Swim", datetime(2023, 1, 3, 8))
+        assert self.db.get_streak_state("Swim")[1] == 0
+        assert "1 row(s)" in self.db.complete_task("Swim", datetime(2023, 1, 4, 8))
+        assert "1 row(s)" in self.db.complete_task("Swim", datetime(2023, 1, 5, 8))
+        assert self.db.get_streak_state("Swim") == (week, 1, 1)
+        assert self.db.get_history("Swim").periods == {week}
+
+        for day in (9, 11, 13):
+            self.db.complete_task("Swim", datetime(2023, 1, day, 8))
+        assert self.db.get_streak_state("Swim") == (week + 1, 2, 2)
+        assert self.db.check_streaks(date=datetime(2023, 1, 15))["Swim"] == (True, False)
+        assert self.db.check_streaks(date=datetime(2023, 1, 18))["Swim"] == (False, False)
+        assert self.db.recompute_streaks(verify=True) == []
+
+    def test_times_per_week_from_import(self):
+        # Out of order, and the week of the 9th has only two different days
+        self.db.bulk_add_history([("Swim", day, "08:00", "0") for day in ("2023-01-13", "2023-01-04", "2023-01-02",
+                                                                           "2023-01-09", "2023-01-03", "2023-01-09")])
+        assert self.db.get_streak_state("Swim") == (self.key("3 times per week", "2023-01-02"), 1, 1)
+        self.db.add_history("Swim", "2023-01-11", "08:00", "0")
+        assert self.db.get_streak_state("Swim") == (self.key("3 times per week", "2023-01-09"), 2, 2)
+        assert self.db.recompute_streaks(verify=True) == []
+
+    def test_weekdays(self):
+        self.db.bulk_add_history([("Stretch", "2023-01-06", "08:00", "1"), ("Stretch", "2023-01-09", "08:00", "2")])
+        # The weekend belongs to the Friday before
+        assert "already completed" in self.db.complete_task("Stretch", datetime(2023, 1, 8, 8))
+        assert self.db.get_streak_state("Stretch") == (self.key("Weekdays", "2023-01-09"), 2, 2)
+        assert self.db.check_streaks(date=datetime(2023, 1, 9))["Stretch"] == (True, False)
+        assert self.db.check_streaks(date=datetime(2023, 1, 10))["Stretch"] == (False, False)
+
+    def test_monthly(self):
+        self.db.add_history("Rent", "2023-01-31", "08:00", "5")
+        self.db.add_history("Rent", "2023-02-01", "08:00", "5")
+        assert "already completed" in self.db.complete_task("Rent", datetime(2023, 2, 28, 8))
+        assert self.db.get_streak_state("Rent") == (self.key("Monthly", "2023-02-01"), 2, 2)
+        assert self.db.check_streaks(date=datetime(2023, 2, 28))["Rent"] == (True, False)
+        assert self.db.check_streaks(date=datetime(2023, 3, 31))["Rent"] == (False, False)
+
+    def test_broken_streak_is_reset(self):
+        # Completed on two different days of last week, but not this week
+        today = date.today()
+        monday = today - timedelta(days=today.weekday(), weeks=1)
+        self.db.bulk_add_history([("Swim", str(monday + timedelta(days=day)), "08:00", "0") for day in range(3)])
+        assert self.db.get_longest_streak("Swim").streak_count == 1
+        assert self.db.check_streaks()["Swim"] == (False, False)
+        assert self.db.check_streaks(date=datetime.now() + timedelta(weeks=1))["Swim"] == (False, True)
+        assert self.db.get_longest_streak("Swim").streak_count == 0
+
+    def test_every_n_days(self):
+        first = recurrence("Every 3 days").start(self.key("Every 3 days", "2023-01-02"))
+        for days in (2, 3, 9):
+            self.db.add_history("Water", str(first + timedelta(days=days)), "08:00", "0")
+        assert self.db.get_streak_state("Water") == (self.key("Every 3 days", str(first + timedelta(days=9))), 1, 2)
+
+    def test_interval_change_to_times_per_week(self):
+        self.db.bulk_add_history([("Stretch", day, "08:00", "0") for day in ("2023-01-02", "2023-01-03",
+                                                                              "2023-01-10")])
+        self.db.update_record("Stretch", "interval", "2 times per week")
+        assert self.db.get_streak_state("Stretch") == (self.key("2 times per week", "2023-01-02"), 1, 1)
+        assert self.db.recompute_streaks(verify=True) == []
+
+
+class TestHistoryPages:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, storage):
+        self.db = storage
+        for name in ("Read", "Walk", "Swim"):
+            self.db.add_record([name, "--", "Daily", "2022-01-01 08:00", 0, 0])
+        # Several completions on the same dates, so pages have to split ties
+        self.rows = [(name, f"2022-01-{day:02d}", "08:00", str(datetime(2022, 1, day).isocalendar()[1]))
+                     for day in range(1, 11) for name in ("Read", "Walk", "Swim")]
+        self.db.bulk_add_history(self.rows)
+
+    def read_pages(self, size, **filters):
+        pages, after = [], None
+        while True:
+            rows, after = self.db.get_history_page(after=after, limit=size, **filters)
+            pages.append(rows)
+            if after is None:
+                return pages
+
+    @pytest.mark.parametrize("size", [1, 4, 7, 30, 100])
+    def test_pages_cover_history_once(self, size):
+        pages = self.read_pages(size)
+
+        assert [row for page in pages for row in page] == list(self.db.iter_history())
+        assert all(len(page) == size for page in pages[:-1])
+
+    def test_pages_filtered_by_habit_and_dates(self):
+        pages = self.read_pages(2, habit_name="Walk", since="2022-01-03", until="2022-01-07")
+
+        assert [row[0] for page in pages for row in page] == [f"2022-01-{day:02d}" for day in range(3, 8)]
+        history = self.db.iter_history("Walk", since="2022-01-03", until="2022-01-07")
+        assert list(history) == pages[0] + pages[1] + pages[2]
+
+    def test_empty_history(self):
+        assert self.db.get_history_page(since="2023-01-01") == ([], None)
+
+
+class TestRows:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, storage):
+        self.db = storage
+        self.db.add_record(["Read", "One Chapter", "Daily", "2022-01-01 08:00", 0, 0])
+        self.db.add_history("Read", "2022-01-01", "08:00", "52")
+
+    def test_habit_rows_keep_types(self):
+        habit = self.db.get_all()[0]
+
+        assert isinstance(habit, HabitRow)
+        assert habit.name == "Read"
+        assert habit.streak_count == 0 and habit.max_streak == 1
+        assert self.db.get_interval_habits("Daily") == [habit]
+        assert self.db.get_longest_streak() == habit
+
+    def test_completion_rows(self):
+        completion = self.db.get_all(table_name="tracker")[0]
+
+        assert completion == CompletionRow("2022-01-01", "08:00", "52", "Read")
+        assert list(self.db.iter_history()) == [completion]
+        assert self.db.get_history_page()[0] == [completion]
+
+    def test_longest_streak_without_habits(self):
+        self.db.delete_record("Read")
+
+        assert self.db.get_longest_streak() is None
+        assert self.db.get_longest_streak("Read") is None
+
+
+class TestTable:
+
+    class Terminal(io.StringIO):
+        def isatty(self):
+            return True
+
+    def test_plain_table_streams_rows(self):
+        rows = ((date(2023, 1, day), "08:00", 1, "Read" if day < 3 else "Walk in Nature") for day in range(1, 5))
+        file = io.StringIO()
+        assert PlainTable("Task History", ["Date", "Time", "Week", "Habit Name"], rows).write(file) == 4
+
+        lines = file.getvalue().splitlines()
+        assert lines[:3] == ["Task History", "Date        Time   Week  Habit Name",
+                             "----------  -----  ----  --------------"]
+        assert lines[3] == "2023-01-01  08:00  1     Read"
+        assert lines[-1] == "2023-01-04  08:00  1     Walk in Nature"
+
+    def test_widths_from_sample(self, monkeypatch):
+        monkeypatch.setattr("resources.table.SAMPLE_ROWS", 2)
+        file = io.StringIO()
+        PlainTable(None, ["Name", "Streak"], [("Read", 1), ("Walk", 2), ("Drink Water", 3)]).write(file)
+
+        # The longer name after the sample is written in full, only its own line is shifted
+        assert file.getvalue().splitlines() == ["Name  Streak", "----  ------", "Read  1", "Walk  2",
+                                                "Drink Water  3"]
+
+    def test_renderer_choice(self, monkeypatch):
+        rows = [("Read", "--", "Daily", "2023-01-01 08:00", 1, 1, "x")]
+        assert is_plain(rows, io.StringIO())
+        assert not is_plain(rows, self.Terminal())
+        assert is_plain(rows * (PLAIN_ROWS + 1), self.Terminal())
+        assert is_plain(iter(rows), self.Terminal())
+
+        monkeypatch.setattr(sys, "stdout", self.Terminal())
+        assert type(create_table(rows=rows)).__name__ == "Table"
+        assert isinstance(create_history_table(rows=iter([])), PlainTable)
+
+
+class TestRollups:
+
+    def setup_method(self):
+        self.db = DBConn(name=":memory:")
+        self.db.add_record(["Read", "--", "Daily", "2022-01-01 00:00", 0, 0])
+        self.db.add_record(["Walk", "--", "Weekly", "2022-01-01 00:00", 0, 0])
+
+    def stored_rollups(self):
+        return {(habit_name, kind, period): completions for habit_name, kind, period, completions
+                in self.db.cursor.execute("SELECT h.name, r.kind, r.period, r.completions FROM completion_rollups r "
+                                          "JOIN habits h USING (habit_id)")}
+
+    def expected_rollups(self):
+        return dict(count_rollups(self.db.cursor.execute("SELECT h.name, t.completed_date, count(*) FROM tracker t "
+                                                         "JOIN habits h USING (habit_id) "
+                                                         "GROUP BY h.name, t.completed_date").fetchall()))
+
+    def test_rollups_follow_history(self):
+        self.db.add_history("Read", "2023-01-02", "08:00", "1")
+        self.db.add_history("Read", "2023-01-02", "20:00", "1")
+        self.db.bulk_add_history([("Read", "2022-12-30", "08:00", "52"), ("Walk", "2023-01-01", "08:00", "52"),
+                                  ("Walk", "2023-01-01", "09:00", "52")])
+
+        assert self.stored_rollups() == self.expected_rollups()
+        assert self.stored_rollups()["Read", "day", date(2023, 1, 2).toordinal()] == 2
+        assert self.stored_rollups()["Read", "week", 202301] == 2
+
+    def test_rename_keeps_rollups(self):
+        self.db.add_history("Read", "2023-01-02", "08:00", "1")
+        self.db.update_record("Read", "name", "Study")
+
+        assert self.stored_rollups() == self.expected_rollups()
+        assert {habit_name for habit_name, _, _ in self.stored_rollups()} == {"Study"}
+
+    def test_migration_backfills_rollups(self, tmp_path):
+        path = str(tmp_path / "old.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE habits (name TEXT PRIMARY KEY, description TEXT, interval TEXT, "
+                     "created_date TEXT, streak_count INTEGER, max_streak INTEGER)")
+        conn.execute("INSERT INTO habits VALUES ('Read', '--', 'Daily', '2022-01-01 00:00', 0, 0)")
+        conn.execute("CREATE TABLE tracker (completed_date TEXT, completed_time TEXT, completed_week TEXT, "
+                     "habit_name TEXT)")
+        conn.executemany("INSERT INTO tracker VALUES (?, '12:00', '1', 'Read')", [("2023-01-02",), ("2023-01-03",)])
+        conn.commit()
+        conn.close()
+
+        self.db = DBConn(name=path)
+        assert self.stored_rollups() == self.expected_rollups()
+        # Two days and weekdays, one week and month
+        assert len(self.stored_rollups()) == 6
+
+    def test_completion_rates(self):
+        # Wednesday, so the current week has three days so far
+        today = date(2023, 1, 18)
+        for day in ("2023-01-09", "2023-01-10", "2023-01-16", "2023-01-18", "2023-01-18"):
+            self.db.add_history("Read", day, "08:00", "0")
+        self.db.add_history("Walk", "2023-01-15", "08:00", "2")
+
+        rates = self.db.get_completion_rates("week", 2, today)
+        assert rates == [("Read", "Daily", "2023-W02", 2, 29), ("Read", "Daily", "2023-W03", 3, 67),
+                         ("Walk", "Weekly", "2023-W02", 1, 100), ("Walk", "Weekly", "2023-W03", 0, 0)]
+
+        # January 2023 has five Mondays, the last two are after the 18th
+        rates = self.db.get_completion_rates("month", 1, today)
+        assert rates == [("Read", "Daily", "2023-01", 5, 22), ("Walk", "Weekly", "2023-01", 1, 33)]
+
+    def test_rates_of_period_without_weeks(self):
+        # No week of February 2021 has started by the 1st, which is a Monday...
+        assert self.db.get_completion_rates("month", 1, date(2021, 2, 1))[1][4] == 0
+        # ...but on Sunday the 1st of March 2020 no Monday of March has passed yet
+        assert self.db.get_completion_rates("month", 1, date(2020, 3, 1))[1][4] is None
+
+    def test_rates_of_other_rules(self):
+        self.db.add_record(["Gym", "--", "2 times per week", "2022-01-01 00:00", 0, 0])
+        self.db.add_record(["Rent", "--", "Monthly", "2022-01-01 00:00", 0, 0])
+        for day in ("2023-01-09", "2023-01-09", "2023-01-16", "2023-01-17"):
+            self.db.add_history("Gym", day, "08:00", "0")
+        self.db.add_history("Rent", "2023-01-05", "08:00", "1")
+
+        rates = [rate for rate in self.db.get_completion_rates("week", 2, date(2023, 1, 18)) if rate[0] != "Read"]
+        assert rates[2:] == [("Gym", "2 times per week", "2023-W02", 2, 0),
+                             ("Gym", "2 times per week", "2023-W03", 2, 100),
+                             ("Rent", "Monthly", "2023-W02", 0, None), ("Rent", "Monthly", "2023-W03", 0, None)]
+        assert self.db.get_completion_rates("month", 1, date(2023, 1, 18))[3] == ("Rent", "Monthly", "2023-01", 1, 100)
+
+    def test_weekday_counts(self):
+        self.db.bulk_add_history([("Read", "2023-01-02", "08:00", "1"), ("Read", "2023-01-09", "08:00", "2"),
+                                  ("Read", "2023-01-04", "08:00", "1")])
+
+        assert self.db.get_weekday_counts() == {"Read": [2, 0, 1, 0, 0, 0, 0], "Walk": [0] * 7}
+
+    def test_streak_distribution(self):
+        self.db.bulk_add_history([("Read", str(date.today() - timedelta(days=day)), "08:00", "1") for day in range(4)])
+        self.db.check_streaks()
+
+        distribution = self.db.get_streak_distribution()
+        assert distribution[0] == (0, 0, 1, 1)
+        assert distribution[2] == (3, 6, 1, 1)
+        assert sum(current for _, _, current, _ in distribution) == 2
+
+
+# Run the analytics tests with NumPy (if installed) and with the array fallback
+ENGINES = [pytest.param(True, marks=pytest.mark.skipif(analytics.np is None, reason="numpy is not installed")), False]
+
+
+@pytest.mark.parametrize("use_numpy", ENGINES)
+class TestAnalytics:
+
+    def setup_method(self):
+        self.db = DBConn(name=":memory:")
+        self.today = date(2023, 1, 18)
+        self.db.add_record(["Read", "--", "Daily", "2022-01-01 00:00", 0, 0])
+        self.db.add_record(["Walk", "--", "Weekly", "2022-01-01 00:00", 0, 0])
+        self.db.add_record(["Swim", "--", "Daily", "2022-01-01 00:00", 0, 0])
+
+    def test_streaks_match_replay(self, use_numpy):
+        random = Random(7)
+        self.db.bulk_add_history((random.choice(["Read", "Walk"]),
+                                  str(self.today - timedelta(days=random.randrange(200))), "08:00", "0")
+                                 for _ in range(300))
+
+        streaks = analytics.compute_streaks(analytics.load_columns(self.db.cursor, use_numpy), self.today)
+        for name in ("Read", "Walk"):
+            interval = self.db.get_interval(name)
+            checkpoint = replay(sorted(period_key(day, interval) for day in self.db.get_history(name).dates), interval)
+            assert streaks[name][:2] == (current_streak(checkpoint, interval, self.today), checkpoint[2])
+        assert streaks["Swim"] == (0, 0, 0)
+
+    def test_weekly_streak_over_year_boundary(self, use_numpy):
+        self.db.bulk_add_history([("Walk", day, "08:00", "0") for day in ("2022-12-20", "2022-12-28", "2023-01-03",
+                                                                          "2023-01-04", "2023-01-16")])
+
+        streaks = analytics.compute_streaks(analytics.load_columns(self.db.cursor, use_numpy), self.today)
+        assert streaks["Walk"] == (1, 3, 2)
+
+    def test_rolling_adherence(self, use_numpy):
+        self.db.bulk_add_history([("Read", f"2023-01-{day:02d}", "08:00", "0") for day in (9, 10, 10, 16, 18)] +
+                                 [("Walk", "2023-01-10", "08:00", "0")])
+
+        dates, adherence = analytics.rolling_adherence(analytics.load_columns(self.db.cursor, use_numpy), window=7,
+                                                       samples=2, today=self.today)
+        assert dates == [date(2023, 1, 11), self.today]
+        # 2 of the 7 days up to the 11th, then 16th and 18th
+        assert adherence == {"Read": [29, 29], "Swim": [0, 0], "Walk": [100, 0]}
+
+    def test_other_rules(self, use_numpy):
+        self.db.add_record(["Gym", "--", "2 times per week", "2022-01-01 00:00", 0, 0])
+        self.db.add_record(["Stretch", "--", "Weekdays", "2022-01-01 00:00", 0, 0])
+        self.db.bulk_add_history([("Gym", day, "08:00", "0") for day in ("2023-01-02", "2023-01-03", "2023-01-09",
+                                                                          "2023-01-09", "2023-01-16", "2023-01-18")] +
+                                 [("Stretch", day, "08:00", "0") for day in ("2023-01-13", "2023-01-14", "2023-01-16",
+                                                                              "2023-01-17")])
+        columns = analytics.load_columns(self.db.cursor, use_numpy)
+
+        streaks = analytics.compute_streaks(columns, self.today)
+        assert streaks["Gym"] == (1, 1, 2)
+        assert streaks["Stretch"] == (3, 3, 1)
+        for name in ("Gym", "Stretch"):
+            assert streaks[name][1] == self.db.get_streak_state(name)[2]
+
+        # Two weeks in 14 days, one of them completed twice; ten weekdays
+        adherence = analytics.rolling_adherence(columns, window=14, samples=1, today=self.today)[1]
+        assert adherence["Gym"] == [50]
+        assert adherence["Stretch"] == [30]
+
+    def test_heatmap(self, use_numpy):
+        self.db.bulk_add_history([("Read", "2023-01-09", "08:00", "0"), ("Read", "2023-01-18", "08:00", "0"),
+                                  ("Walk", "2023-01-18", "08:00", "0"), ("Read", "2022-12-01", "08:00", "0")])
+        columns = analytics.load_columns(self.db.cursor, use_numpy)
+
+        mondays, counts = analytics.heatmap(columns, weeks=2, today=self.today)
+        assert mondays == [date(2023, 1, 9), date(2023, 1, 16)]
+        assert counts == [[1, 0, 0, 0, 0, 0, 0], [0, 0, 2, 0, 0, 0, 0]]
+        assert analytics.heatmap(columns, 2, "Walk", self.today)[1] == [[0] * 7, [0, 0, 1, 0, 0, 0, 0]]
+
+    def test_empty_history(self, use_numpy):
+        columns = analytics.load_columns(self.db.cursor, use_numpy)
+
+        assert analytics.compute_streaks(columns, self.today)["Read"] == (0, 0, 0)
+        assert analytics.heatmap(columns, 1, today=self.today)[1] == [[0] * 7]
+
+
+class TestMaintenance:
+
+    def setup_method(self):
+        self.today = date.today()
+        random = Random(11)
+        days = sorted({self.today - timedelta(days=random.randrange(400)) for _ in range(300)})
+        self.history = [(random.choice(["Read", "Walk"]), str(day), "08:00", "0") for day in days]
+
+    def create(self, path=":memory:"):
+        db = DBConn(name=path)
+        db.add_record(["Read", "--", "Daily", "2022-01-01 00:00", 0, 0])
+        db.add_record(["Walk", "--", "Weekly", "2022-01-01 00:00", 0, 0])
+        db.bulk_add_history(self.history)
+        return db
+
+    def streaks(self, db):
+        db.cursor.execute("SELECT h.name, s.last_period, s.run_length, s.max_run, h.streak_count, h.max_streak "
+                          "FROM habits h JOIN streak_state s USING (habit_id) ORDER BY h.name")
+        return db.cursor.fetchall(), analytics.compute_streaks(analytics.load_columns(db.cursor, False), self.today)
+
+    def test_archive_keeps_streaks(self, tmp_path):
+        archive = str(tmp_path / "main.archive.jsonl.gz")
+        with self.create() as db:
+            expected = self.streaks(db)
+            before = DBConn.archive_cutoff(str(self.today - timedelta(days=100)))
+
+            archived = db.archive_history(before, archive)
+            assert archived == sum(completed_date < before for _, completed_date, _, _ in self.history)
+            assert min(row.completed_date for row in db.get_all("tracker")) >= before
+
+            assert db.recompute_streaks(verify=True) == []
+            db.recompute_streaks()
+            assert self.streaks(db) == expected
+
+            # Archiving again continues from the checkpoints
+            assert db.archive_history(str(self.today - timedelta(days=30)), archive) > 0
+            assert db.recompute_streaks(verify=True) == []
+            assert self.streaks(db) == expected
+
+        with gzip.open(archive, "rt") as file:
+            rows = [json.loads(line) for line in file]
+        assert len(rows) == sum(completed_date < DBConn.archive_cutoff(str(self.today - timedelta(days=30)))
+                                for _, completed_date, _, _ in self.history)
+        assert set(rows[0]) == {"user", "habit_id", "completed_date", "completed_time", "completed_week", "habit_name"}
+
+    def test_archive_with_interval_change(self, tmp_path):
+        with self.create() as full, self.create() as db:
+            db.archive_history(str(self.today - timedelta(days=100)), str(tmp_path / "archive.jsonl.gz"))
+            for conn in (full, db):
+                conn.update_record("Read", "interval", "Weekly")
+                conn.update_record("Walk", "interval", "Daily")
+
+            assert self.streaks(db) == self.streaks(full)
+
+    def test_archive_keeps_streaks_of_times_per_week(self, tmp_path):
+        with self.create() as db:
+            db.update_record("Read", "interval", "2 times per week")
+            expected = self.streaks(db)
+            # A cutoff in the middle of a week archives from the Monday of that week, so no week is split
+            before = self.today - timedelta(days=100)
+            before += timedelta(days=2 - before.weekday())
+            db.archive_history(str(before), str(tmp_path / "archive.jsonl.gz"))
+
+            monday = str(before - timedelta(days=2))
+            assert min(row.completed_date for row in db.get_all("tracker")) >= monday
+            assert db.cursor.execute("SELECT sum(completions) FROM history_checkpoints WHERE interval = 'Daily'"
+                                     ).fetchone()[0] == sum(completed_date < monday for _, completed_date, _, _ in
+                                                            self.history)
+            assert db.recompute_streaks(verify=True) == []
+            assert self.streaks(db) == expected
+
+    def test_nothing_to_archive(self, tmp_path):
+        archive = tmp_path / "archive.jsonl.gz"
+        with self.create() as db:
+            assert db.archive_history("2000-01-01", str(archive)) == 0
+        assert not archive.exists()
+
+    def test_purge_orphans(self):
+        with self.create() as db:
+            db.cursor.execute("PRAGMA foreign_keys = OFF")
+            db.delete_record("Walk")
+            walks = sum(habit_name == "Walk" for habit_name, _, _, _ in self.history)
+            assert db.cursor.execute("SELECT count(*) FROM tracker").fetchone()[0] == len(self.history)
+
+            assert db.purge_orphans() > walks
+            assert db.cursor.execute("SELECT count(*) FROM tracker").fetchone()[0] == len(self.history) - walks
+            assert db.purge_orphans() == 0
+
+    def test_optimize_shrinks_file(self, tmp_path):
+        path = str(tmp_path / "main.db")
+        with self.create(path) as db:
+            db.archive_history(str(self.today), str(tmp_path / "archive.jsonl.gz"))
+            db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            size = db.file_size()
+            db.optimize()
+            assert db.file_size() < size
+            assert db.cursor.execute("SELECT count(*) FROM sqlite_stat1").fetchone()[0] > 0
+
+    def test_maintain_command(self):
+        runner = CliRunner(mix_stderr=False)
+        with runner.isolated_filesystem():
+            result = runner.invoke(tracker.cli, ["maintain", "--keep-days", "7"])
+            connections.close()
+            assert result.exit_code == 0, result.stderr
+            assert "Archived" in result.stdout and "Maintenance" in result.stdout
+            assert os.path.exists("main.archive.jsonl.gz")
+
+            result = runner.invoke(tracker.cli, ["verify-streaks"])
+            connections.close()
+            assert "All streaks match" in result.stdout
+
+            result = runner.invoke(tracker.cli, ["--storage", "memory", "maintain"])
+            assert result.exit_code == 1
+
+
+class TestHabitCache:
+
+    def setup_method(self, method):
+        self.path = f"cache_{method.__name__}.db"
+        self.db = DBConn(name=self.path)
+        self.db.add_record(["Read", "One Chapter", "Daily", "2022-01-01 08:00", 0, 0])
+        self.db.add_record(["Walk", "Around the block", "Weekly", "2022-01-01 08:00", 0, 0])
+
+    def teardown_method(self):
+        self.db.close()
+        os.remove(self.path)
+
+    def test_reads_hit_the_cache(self):
+        self.db.get_all()
+        self.db.get_interval("Read")
+        self.db.get_habit_names()
+        self.db.get_longest_streak()
+
+        info = self.db.habit_cache.cache_info()
+        assert (info.hits, info.misses, info.size) == (3, 1, 2)
+
+    def test_habit_names_are_sorted(self):
+        self.db.add_record(["Cook", "Dinner", "Daily", "2022-01-01 08:00", 0, 0])
+
+        assert self.db.get_habit_names() == [("Cook",), ("Read",), ("Walk",)]
+
+    def test_writes_invalidate(self):
+        self.db.get_all()
+
+        self.db.add_history("Read", "2022-01-01", "08:00", "52")
+        assert self.db.get_longest_streak("Read").max_streak == 1
+
+        self.db.update_record("Read", "description", "Two Chapters")
+        assert self.db.get_all(habit_name="Read")[0].description == "Two Chapters"
+
+        self.db.update_record("Read", "interval", "Weekly")
+        assert [habit.name for habit in self.db.get_interval_habits("Weekly")] == ["Read", "Walk"]
+
+        self.db.update_record("Read", "name", "Study")
+        assert self.db.get_interval("Study") == "Weekly"
+        assert self.db.get_all(habit_name="Read") == []
+
+        self.db.update_streak("Walk")
+        assert self.db.get_longest_streak("Walk").streak_count == 1
+
+        self.db.check_streaks(date=datetime(2022, 3, 1))
+        assert self.db.get_longest_streak("Walk").streak_count == 0
+
+        self.db.delete_record("Study")
+        assert self.db.get_habit_names() == [("Walk",)]
+
+    def test_other_connection_invalidates(self):
+        self.db.get_all()
+
+        other = DBConn(name=self.path)
+        other.update_record("Read", "description", "Two Chapters")
+        other.close()
+
+        assert self.db.get_all(habit_name="Read")[0].description == "Two Chapters"
+
+    def test_rollback_is_not_cached(self):
+        self.db.cursor.execute("UPDATE habits SET description = 'Uncommitted' WHERE name = 'Read'")
+        assert self.db.get_all(habit_name="Read")[0].description == "Uncommitted"
+        self.db.conn.rollback()
+
+        assert self.db.get_all(habit_name="Read")[0].description == "One Chapter"
+
+
+class TestUsers:
+
+    def setup_method(self):
+        self.db = DBConn(name=":memory:", user="alice")
+        self.db.add_record(["Read", "One Chapter", "Daily", "2022-01-01 08:00", 0, 0])
+        self.db.user = "bob"
+        self.db.add_record(["Read", "Two Chapters", "Weekly", "2022-01-01 08:00", 0, 0])
+        self.db.add_record(["Walk", "Around the block", "Daily", "2022-01-01 08:00", 0, 0])
+
+    def test_habits_are_per_user(self):
+        assert self.db.get_habit_names() == [("Read",), ("Walk",)]
+
+        self.db.user = "alice"
+        assert self.db.get_habit_names() == [("Read",)]
+        assert self.db.get_interval("Read") == "Daily"
+        assert self.db.get_users() == ["alice", "bob"]
+
+    def test_completions_are_per_user(self):
+        self.db.user = "alice"
+        self.db.complete_task("Read", datetime(2023, 1, 2, 8, 0))
+        self.db.complete_task("Read", datetime(2023, 1, 3, 8, 0))
+
+        self.db.user = "bob"
+        assert "1 row(s)" in self.db.complete_task("Read", datetime(2023, 1, 2, 8, 0))
+        assert len(self.db.get_all(table_name="tracker")) == 1
+        assert self.db.get_streak_state("Read") == (202301, 1, 1)
+        assert self.db.get_weekday_counts()["Read"] == [1, 0, 0, 0, 0, 0, 0]
+
+        self.db.user = "alice"
+        assert self.db.get_streak_state("Read") == (date(2023, 1, 3).toordinal(), 2, 2)
+        assert self.db.get_longest_streak("Read").max_streak == 2
+        assert self.db.recompute_streaks(verify=True) == []
+
+    def test_changes_stay_with_the_user(self):
+        self.db.update_record("Read", "name", "Study")
+        self.db.delete_record("Walk")
+
+        self.db.user = "alice"
+        assert self.db.get_habit_names() == [("Read",)]
+
+        self.db.delete_user()
+        assert self.db.get_users() == ["bob"]
+
+    def test_cli_user_option(self):
+        runner = CliRunner(mix_stderr=False)
+        with runner.isolated_filesystem():
+            # The starter habits are only set up for the user that creates the database
+            runner.invoke(tracker.cli, ["show-today"])
+            runner.invoke(tracker.cli, ["--user", "alice", "add-habit", "--name", "Stretch"])
+            result = runner.invoke(tracker.cli, ["--user", "alice", "show-today", "--format", "csv"])
+            assert [line.split(",")[0] for line in result.stdout.splitlines()] == ["name", "Stretch"]
+
+            result = runner.invoke(tracker.cli, ["show-today", "--format", "csv"])
+            assert "Drink Water" in result.stdout and "Stretch" not in result.stdout
+
+            # Resetting a user keeps the habits of the other users
+            assert runner.invoke(tracker.cli, ["--user", "alice", "reset"]).exit_code == 0
+            assert os.path.exists("main.db")
+            with DBConn(name="main.db") as db:
+                assert db.get_users() == ["default"]
+        connections.close()
+
+
+class TestStartup:
+
+    def test_show_today_skips_interactive_imports(self, tmp_path):
+        tracker = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tracker.py")
+        result = subprocess.run([sys.executable, "-X", "importtime", tracker, "show-today"], cwd=tmp_path,
+                                capture_output=True, text=True, check=True)
+
+        assert "Habits" in result.stdout
+        assert "inquirer" not in result.stderr
+        assert "resources.menus" not in result.stderr
+        assert "resources.memory" not in result.stderr
+        # Piped output is a plain text table, which doesn't need Rich
+        assert "rich" not in result.stderr
+
+
+class TestScriptableCli:
+
+    def setup_method(self):
+        self.runner = CliRunner(mix_stderr=False)
+
+    def invoke(self, *args):
+        result = self.runner.invoke(tracker.cli, args)
+        connections.close()
+        return result
+
+    def test_complete_task_and_show_today_json(self):
+        with self.runner.isolated_filesystem():
+            result = self.invoke("complete-task", "--habit", "Read", "--at", "2023-01-31 18:30")
+            assert result.exit_code == 0
+
+            result = self.invoke("show-today", "--format", "json")
+            habits = {habit["name"]: habit for habit in json.loads(result.stdout)}
+            assert set(habits) == {"Drink Water", "Read", "Exercise", "Meditate", "Walk in Nature"}
+            assert habits["Drink Water"]["completed"] is False
+
+            result = self.invoke("show-history", "--habit", "Read", "--format", "ndjson")
+            completions = [json.loads(line) for line in result.stdout.splitlines()]
+            assert completions[0] == {"completed_date": "2023-01-31", "completed_time": "18:30",
+                                      "completed_week": "5", "habit_name": "Read"}
+
+    def test_show_history_streams_plain_table(self):
+        with self.runner.isolated_filesystem():
+            result = self.invoke("show-history", "--habit", "ALL", "--limit", "30")
+            lines = result.stdout.splitlines()
+            assert lines[:2] == ["Task History", "Completed Date  Completed Time  Week  Habit Name"]
+            # One table for all pages, without a header per page
+            assert len(lines) == 3 + 30 and lines.count(lines[1]) == 1
+
+    def test_show_today_pending_only(self):
+        with self.runner.isolated_filesystem():
+            assert self.invoke("complete-task", "--habit", "Read").exit_code == 0
+            result = self.invoke("show-today", "--pending-only", "--format", "json")
+            habits = json.loads(result.stdout)
+            assert [habit["name"] for habit in habits] == ["Drink Water", "Exercise", "Meditate", "Walk in Nature"]
+            assert not any(habit["completed"] for habit in habits)
+
+            result = self.invoke("show-today", "--pending-only")
+            assert result.exit_code == 0
+            assert "Meditate" in result.stdout and "Read" not in result.stdout
+
+    def test_unknown_habit_fails(self):
+        with self.runner.isolated_filesystem():
+            result = self.invoke("complete-task", "--habit", "Juggle")
+            assert result.exit_code == 1
+            assert "does not exist" in result.stderr
+
+    def test_add_and_delete_without_prompts(self):
+        with self.runner.isolated_filesystem():
+            assert self.invoke("add-habit", "--name", "Stretch", "--interval", "Weekly").exit_code == 0
+            result = self.invoke("analyze-habits", "--report", "weekly", "--format", "csv")
+            assert "Stretch,--,Weekly" in result.stdout
+
+            assert self.invoke("delete-habit", "--habit", "Stretch", "--yes").exit_code == 0
+            result = self.invoke("analyze-habits", "--report", "weekly", "--format", "csv")
+            assert "Stretch" not in result.stdout
+
+    def test_add_habit_with_rule(self):
+        with self.runner.isolated_filesystem():
+            assert self.invoke("add-habit", "--name", "Swim", "--interval", "3 TIMES per week").exit_code == 0
+            habits = json.loads(self.invoke("show-today", "--format", "json").stdout)
+            assert {habit["name"]: habit["interval"] for habit in habits}["Swim"] == "3 times per week"
+
+            result = self.invoke("add-habit", "--name", "Juggle", "--interval", "Fortnightly")
+            assert result.exit_code == 2
+            assert "not a valid interval" in result.stderr
+
+    def test_show_history_limit_and_dates(self):
+        with self.runner.isolated_filesystem():
+            result = self.invoke("show-history", "--habit", "Read", "--limit", "3", "--format", "csv")
+            assert len(result.stdout.splitlines()) == 4
+
+            # The starter history goes up to yesterday
+            yesterday = (date.today() - timedelta(days=1)).isoformat()
+            result = self.invoke("show-history", "--habit", "ALL", "--since", yesterday, "--format", "ndjson")
+            assert {json.loads(line)["completed_date"] for line in result.stdout.splitlines()} == {yesterday}
+
+
+class TestDaemon:
+
+    def setup_method(self):
+        self.runner = CliRunner(mix_stderr=False)
+        self.tracker = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tracker.py")
+
+    def invoke(self, *args):
+        result = self.runner.invoke(tracker.cli, args)
+        connections.close()
+        return result
+
+    def test_respond(self):
+        db = DBConn(name=":memory:")
+        db.add_record(["Read", "One Chapter", "Daily", "2022-01-01 08:00", 0, 0])
+
+        assert json.loads(daemon.respond(db, b'{"method": "get_habit_names"}')) == {"result": [["Read"]]}
+        response = json.loads(daemon.respond(db, b'{"method": "complete_task", '
+                                                 b'"args": {"habit_name": "Read", "date": "2023-01-31T18:30:00"}}'))
+        assert response == {"result": "1 row(s) inserted successfully."}
+        assert "Unknown method" in json.loads(daemon.respond(db, b'{"method": "delete_record"}'))["error"]
+        assert "error" in json.loads(daemon.respond(db, b'not json'))
+        assert json.loads(daemon.respond(db, b'{"method": "get_habit_names", "user": "bob"}')) == {"result": []}
+
+    def test_commands_use_the_daemon(self, monkeypatch):
+        with self.runner.isolated_filesystem():
+            server = subprocess.Popen([sys.executable, self.tracker, "serve"], stderr=subprocess.DEVNULL)
+            try:
+                for _ in range(100):
+                    client = daemon.connect()
+                    if client is not None:
+                        client.close()
+                        break
+                    time.sleep(0.1)
+
+                # The commands must not open the database themselves while the daemon is running
+                def no_connection(*args):
+                    raise AssertionError("opened the database instead of using the daemon")
+                monkeypatch.setattr(tracker, "get_connection", no_connection)
+
+                result = self.invoke("complete-task", "--habit", "Read", "--at", "2023-01-31 18:30")
+                assert result.exit_code == 0 and "1 row(s)" in result.stdout
+                assert "does not exist" in self.invoke("complete-task", "--habit", "Juggle").stderr
+
+                result = self.invoke("show-today", "--format", "json")
+                assert [habit["name"] for habit in json.loads(result.stdout)] == \
+                       ["Drink Water", "Read", "Exercise", "Meditate", "Walk in Nature"]
+
+                result = self.invoke("show-today", "--pending-only", "--format", "csv")
+                assert result.exit_code == 0 and "Walk in Nature" in result.stdout
+
+                result = self.invoke("show-history", "--habit", "Read", "--format", "ndjson")
+                assert json.loads(result.stdout.splitlines()[0])["completed_date"] == "2023-01-31"
+
+                assert self.invoke("serve", "--stop").exit_code == 0
+                server.wait(timeout=10)
+            finally:
+                server.kill()
+            assert not os.path.exists(daemon.SOCKET_PATH)
@@ -1,39 +1,157 @@
 import click
-import inquirer
+import sys
+from contextlib import closing, nullcontext, redirect_stdout
+from datetime import date, datetime, timedelta
+from itertools import islice
 from os import path, remove
-from rich import print
-from datetime import datetime, timedelta
-from resources.starter import starter_habits
-from resources.habit import Habit
-from resources.database import DBConn
-from resources.table import create_table, create_history_table
-from resources.menus import analyze_menu, create_delete_menu, create_habit_select_menu, interval_menu, modify_menu
+from time import perf_counter
+from shutil import get_terminal_size
+from resources.daemon import SOCKET_PATH, DaemonError, close_client, get_client, serve
+from resources.database import PROFILES, STORAGES, DBConn, connections, get_connection
+from resources.history_io import FORMATS, guess_format, read_history, write_history
+from resources.output import FORMATS as OUTPUT_FORMATS, write_rows
+from resources.recurrence import RULE_HELP, parse_rule
+from resources.rows import DEFAULT_USER
 
+# Only the modules needed to dispatch a command are imported here.  inquirer, rich and the menus are slow to import,
+# so every command imports what it needs when it runs; non-interactive commands never load inquirer at all.
 
-def add_habit():
-    """Prompts the user for input and adds the habit information provided to the database."""
 
-    # Use the click prompts to get input from user
-    name = click.prompt("Enter name of habit")
-    desc = click.prompt("Enter description of habit (optional)", default="--", show_default=False)
-    interval = inquirer.prompt(interval_menu)
+# Column names of the machine-readable output
+HABIT_COLUMNS = ["name", "description", "interval", "created_date", "streak_count", "max_streak", "completed"]
+HISTORY_COLUMNS = ["completed_date", "completed_time", "completed_week", "habit_name"]
+RATE_COLUMNS = ["name", "interval", "period", "completions", "rate"]
+
+# Reports of analyze-habits that need the SQLite database
+SQL_REPORTS = ("Completion Rates", "Best Weekday", "Streak Distribution", "Rolling Adherence", "Completion Heatmap",
+               "Streaks from History")
+
+# Minimum number of completions on a page of show-history
+HISTORY_PAGE_SIZE = 20
+
+# Queries timed by maintain before and after the database is compacted
+MAINTENANCE_QUERIES = {
+    "show-today": lambda db: db.check_streaks(),
+    "history page": lambda db: db.get_history_page(limit=HISTORY_PAGE_SIZE),
+    "completion rates": lambda db: db.get_completion_rates(),
+    "verify streaks": lambda db: db.recompute_streaks(verify=True),
+}
+
+# Accepted formats for the --at option of complete-task
+TIMESTAMP_FORMATS = ["%Y-%m-%d", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"]
+
+
+def print(*objects, **kwargs):
+    """
+    Print to the terminal with Rich, which is only imported once something is printed.  Plain text tables (see
+    resources.table) are written straight to standard output, one row at a time.
+    """
+
+    from resources.table import PlainTable
+    if len(objects) == 1 and isinstance(objects[0], PlainTable):
+        objects[0].write()
+        return
+
+    from rich import print as rich_print
+    rich_print(*objects, **kwargs)
+
+
+def get_database():
+    """
+    Retrieve the database for the commands the daemon serves (show-today, complete-task and show-history): the client
+    of the tracker daemon when one is running, so the command doesn't have to open the database itself, otherwise the
+    shared database connection.  Sessions with the memory storage never use the daemon.
+    """
+
+    if connections.storage == "memory":
+        return get_connection()
+    return get_client(user=connections.user) or get_connection()
+
+
+def require_habit(db, habit_name: str):
+    """
+    Make sure a habit given on the command line exists, otherwise exit with an error.
+
+    :param db: database connection
+    :param habit_name: name of the habit
+    """
+
+    if habit_name not in (name for name, in db.get_habit_names()):
+        raise click.ClickException(f"Habit '{habit_name}' does not exist.")
+
+
+def prompt_interval():
+    """
+    Prompts the user to select the interval of a habit, and for the number of days or times of the rules that need one.
+
+    :return: canonical text of the selected recurrence rule
+    """
+
+    import inquirer
+    from resources.menus import create_interval_menu
+
+    selection = inquirer.prompt(create_interval_menu())["selection"]
+    if "N" in selection.split():
+        number = click.prompt("Enter N", type=click.IntRange(min=1, max=7 if "week" in selection else None))
+        selection = selection.replace("N", str(number), 1)
+    return parse_rule(selection).rule
+
+
+def validate_interval(ctx, param, value):
+    """Click callback that turns an interval given on the command line into the canonical text of its rule."""
+
+    try:
+        return parse_rule(value).rule
+    except ValueError:
+        raise click.BadParameter(f"'{value}' is not a valid interval, expected {RULE_HELP}.")
+
+
+def add_habit(name: str = None, desc: str = "--", interval: str = "Daily"):
+    """
+    Prompts the user for input and adds the habit information provided to the database.
+
+    :param name: name of the habit (optional); if specified the habit is added without prompting the user
+    :param desc: description of the habit, used together with name
+    :param interval: interval of the habit, used together with name
+    """
+
+    from resources.habit import Habit
+
+    if name is None:
+        # Use the click prompts to get input from user
+        name = click.prompt("Enter name of habit")
+        desc = click.prompt("Enter description of habit (optional)", default="--", show_default=False)
+        interval = prompt_interval()
 
     # Instantiate the habit object
-    new_habit = Habit(name, desc, interval["selection"])
+    new_habit = Habit(name, desc, interval)
 
-    # Create a connection to the db and add the new habit
-    db = DBConn()
+    # Get the connection to the db and add the new habit
+    db = get_connection()
     message = db.add_record(new_habit.details)
 
     # Print the success/fail message to the user
     print(message)
 
 
-def complete_task():
-    """Prompts the user to select a task to complete, then updates the record in the database."""
+def complete_task(habit_name: str = None, at: datetime = None):
+    """
+    Prompts the user to select a task to complete, then updates the record in the database.
+
+    :param habit_name: name of the habit (optional); if specified the task is completed without prompting the user
+    :param at: date and time of the completion (optional); defaults to now
+    """
+
+    # Get the connection to the database and retrieve habit records to display to the user
+    db = get_database()
+
+    if habit_name is not None:
+        require_habit(db, habit_name)
+        return print(db.complete_task(habit_name=habit_name, date=at))
+
+    import inquirer
+    from resources.menus import create_habit_select_menu
 
-    # Create a connection to the database and retrieve habit records to display to the user
-    db = DBConn()
     habits = db.get_habit_names()
     if not habits:
         return print("No tasks to complete.  Maybe you should create some first :)")
@@ -52,11 +170,27 @@ def complete_task():
         print(db.complete_task(habit_name=habit_name))
 
 
-def delete_habit():
-    """Prompts the user to select an existing habit and then deletes the habit information from the database."""
+def delete_habit(habit_name: str = None, confirm: bool = True):
+    """
+    Prompts the user to select an existing habit and then deletes the habit information from the database.
+
+    :param habit_name: name of the habit (optional); if specified the habit is not selected from a menu
+    :param confirm: set to False to delete the habit without asking for confirmation
+    """
+
+    # Get the connection to the db and retrieve the habit records
+    db = get_connection()
+
+    if habit_name is not None:
+        require_habit(db, habit_name)
+        if not confirm or click.confirm(f"Are you sure you want to delete '{habit_name}'?"):
+            db.delete_record(habit_name)
+            print(f"Habit '{habit_name}' deleted.")
+        return
+
+    import inquirer
+    from resources.menus import create_delete_menu
 
-    # Create a connection to the db and retrieve the habit records
-    db = DBConn()
     habits = db.get_habit_names()
     if not habits:
         return print("No Habits to delete.  Maybe you should create some first :)")
@@ -77,16 +211,86 @@ def delete_habit():
                 print(f"Habit '{habit_name}' deleted.")
 
 
-def show_history():
-    """Shows the history of all previously completed tasks."""
+def page_history(db, habit_name: str = None, since: str = None, until: str = None, limit: int = None):
+    """
+    Prints the history a page at a time.  Only one page is loaded from the database and rendered at once, so the first
+    page shows up straight away however long the history is.  In a terminal the user is asked before every next page
+    (unless there is no user to ask, then all pages are printed one after the other); when piped into a file, the
+    history is streamed into one plain text table.
+
+    :param db: database connection
+    :param habit_name: name of the habit (optional); all habits by default
+    :param since: first completed date to show, in the format YYYY-MM-DD (optional)
+    :param until: last completed date to show, in the format YYYY-MM-DD (optional)
+    :param limit: maximum number of completions to show (optional); all by default
+    """
 
-    # Create connection to the database and allow user to select which habit to which they want to see the history
-    db = DBConn()
-    habits = db.get_habit_names()
-    if not habits:
-        return print("No tasks to complete.  Maybe you should create some first :)")
+    from resources.table import create_history_table
+
+    if not sys.stdout.isatty():
+        # Written to a pipe or a file, the history is streamed into one plain text table instead of paged
+        with closing(db.iter_history(habit_name, since, until)) as rows:
+            print(create_history_table(rows=islice(rows, limit)))
+        return
+
+    # Fit a page on the screen, leaving room for the table title, header and borders
+    page_size = max(get_terminal_size().lines - 8, HISTORY_PAGE_SIZE)
+    interactive = sys.stdin.isatty() and sys.stdout.isatty()
+
+    after, shown = None, 0
+    while limit is None or shown < limit:
+        size = page_size if limit is None else min(page_size, limit - shown)
+        rows, after = db.get_history_page(habit_name, since, until, after, size)
+        if not rows and shown:
+            break
+
+        # Only the first page gets a title, so non-interactive output reads as one long table
+        title = "Task History" if not shown else None
+        print(create_history_table(title=title, rows=rows))
+        shown += len(rows)
+
+        if after is None or (limit is not None and shown >= limit):
+            break
+        if interactive:
+            click.echo("-- Press any key for the next page, q to quit --", nl=False)
+            key = click.getchar()
+            click.echo()
+            if key in ("q", "Q"):
+                break
+
+
+def show_history(habit_name: str = None, fmt: str = "table", since: str = None, until: str = None,
+                 limit: int = None):
+    """
+    Shows the history of all previously completed tasks.
+
+    :param habit_name: name of the habit, or ALL (optional); if specified the habit is not selected from a menu
+    :param fmt: output format; 'table' (default) or one of the machine-readable formats json, ndjson, csv
+    :param since: first completed date to show, in the format YYYY-MM-DD (optional)
+    :param until: last completed date to show, in the format YYYY-MM-DD (optional)
+    :param limit: maximum number of completions to show (optional); all by default
+    """
+
+    # Get the connection to the database and allow user to select which habit to which they want to see the history
+    db = get_database()
+
+    if habit_name is not None and habit_name != "ALL":
+        require_habit(db, habit_name)
+
+    if fmt != "table":
+        # Machine-readable output is streamed straight from the database, without prompts or Rich
+        with closing(db.iter_history(None if habit_name in (None, "ALL") else habit_name, since, until)) as rows:
+            write_rows(islice(rows, limit), HISTORY_COLUMNS, fmt)
+        return
+
+    if habit_name is None:
+        import inquirer
+        from resources.menus import create_habit_select_menu
+
+        habits = db.get_habit_names()
+        if not habits:
+            return print("No tasks to complete.  Maybe you should create some first :)")
 
-    else:
         choices = [item for sublist in habits for item in sublist]
         choices.append("CANCEL")
         choices = ["ALL"] + choices
@@ -97,34 +301,32 @@ def show_history():
 
         if habit_name == "CANCEL":
             return "Action Canceled."
-        elif habit_name == "ALL":
-            history = db.get_all(table_name="tracker")
-        else:
-            history = db.get_all(table_name="tracker", habit_name=habit_name)
 
-    # Arrange the information in a nice table to output to the user
-    table = create_history_table(rows=history)
-    print(table)
+    # Arrange the information in nice tables to output to the user, one page at a time
+    page_history(db, None if habit_name == "ALL" else habit_name, since, until, limit)
 
 
 def show_interval(interval: str):
     """Retrieves only habits with a specified interval and outputs to the terminal."""
 
-    # Create connection to the database and retrieve habits matching specified interval
-    db = DBConn()
+    from resources.table import create_table
+
+    # Get the connection to the database and retrieve habits matching specified interval
+    db = get_connection()
     habits = db.get_interval_habits(interval)
 
     if not habits:
         return "No habits to display"
 
     # Check the task streak
-    habits = check_task_streak(habits)
+    habits = check_task_streak(habits, interval=interval)
     # Create a nice table to output to the user
     table = create_table(rows=habits)
     return table
 
 
-def analyze_habits():
+def analyze_habits(report: str = None, habit_name: str = None, fmt: str = "table", by: str = "week",
+                   periods: int = 8, window: int = 30):
     """
     Show the Analyze Menu and allow the user to select further options for analysis.
 
@@ -132,49 +334,187 @@ def analyze_habits():
     Show Weekly - retrieve only the habits with Weekly set as the interval.
     Longest Streak Overall - retrieve the habit with the longest streak.
     Longest Streak (selected task) - prompt user to select a habit, then show the streak information for that habit.
+    Completion Rates - completions and completion rate of every habit for the last weeks or months.
+    Best Weekday - completions of every habit per day of the week.
+    Streak Distribution - number of habits per current/longest streak length.
+    Rolling Adherence - share of the days/weeks in a rolling window that every habit was completed, sampled weekly.
+    Completion Heatmap - completions per day of the last weeks, for all habits or a single habit.
+    Streaks from History - current/longest streak and number of runs of every habit, rebuilt from the full history.
+
+    :param report: daily, weekly, longest, rates, weekdays, streaks, adherence, heatmap or runs (optional); if specified
+                   the report is shown without the menu
+    :param habit_name: name of the habit for the longest and heatmap reports (optional); all habits by default
+    :param fmt: output format; 'table' (default) or one of the machine-readable formats json, ndjson, csv
+    :param by: week or month, period of the rates report
+    :param periods: number of weeks/months in the rates report, or weeks in the adherence and heatmap reports
+    :param window: length in days of the rolling window of the adherence report
     """
 
-    # Create a connection to the database
-    db = DBConn()
-    # Show Analyze menu to the user
-    answer = inquirer.prompt(analyze_menu)
+    # Get the connection to the database
+    db = get_connection()
+
+    if report is None:
+        import inquirer
+        from resources.menus import create_analyze_menu
+
+        # Show Analyze menu to the user
+        selection = inquirer.prompt(create_analyze_menu())["selection"]
+    elif report == "longest":
+        selection = "Longest Streak Overall" if habit_name is None else "Longest Streak (select habit)"
+    elif report == "rates":
+        selection = f"Completion Rates ({by}ly)"
+    elif report == "weekdays":
+        selection = "Best Weekday"
+    elif report == "streaks":
+        selection = "Streak Distribution"
+    elif report == "adherence":
+        selection = "Rolling Adherence"
+    elif report == "heatmap":
+        selection = "Completion Heatmap"
+    elif report == "runs":
+        selection = "Streaks from History"
+    else:
+        selection = f"Show {report.capitalize()}"
 
-    if answer["selection"] == "Show Daily":
-        table = show_interval("Daily")
-        print(table)
+    # These reports are answered with SQL, so they are only available with the sqlite storage
+    if selection.startswith(SQL_REPORTS) and not isinstance(db, DBConn):
+        raise click.ClickException(f"The '{selection}' report is only available with the sqlite storage.")
 
-    elif answer["selection"] == "Show Weekly":
-        table = show_interval("Weekly")
+    if selection in ("Show Daily", "Show Weekly"):
+        interval = selection.split()[1]
+        if fmt != "table":
+            tasks = db.get_interval_habits(interval)
+            tasks = check_task_streak(tasks, interval=interval, completed_as_bool=True) if tasks else []
+            return write_rows(tasks, HABIT_COLUMNS, fmt)
+
+        table = show_interval(interval)
         print(table)
 
-    elif answer["selection"] == "Longest Streak Overall":
+    elif selection == "Longest Streak Overall":
+        # Reset any streaks that were broken since they were last checked
+        db.check_streaks()
         longest = db.get_longest_streak()
-
-        print(f"Your longest streak is {longest[5]}, for habit: '{longest[0]}', which should be completed "
-              f"{longest[2].upper()}.")
-        print(f"You started this habit on {longest[3]} and the current streak is {longest[4]}.")
-
-    elif answer["selection"] == "Longest Streak (select habit)":
-        tasks = db.get_habit_names()
-        if not tasks:
+        if fmt != "table":
+            return write_rows([longest] if longest is not None else [], HABIT_COLUMNS[:6], fmt)
+        if longest is None:
             print("No habits to display.  Please create some first.")
             return
 
-        choices = [t for task in tasks for t in task]
-        choices.append("CANCEL")
+        print(f"Your longest streak is {longest.max_streak}, for habit: '{longest.name}', which should be completed "
+              f"{longest.interval.upper()}.")
+        print(f"You started this habit on {longest.created_date} and the current streak is {longest.streak_count}.")
+
+    elif selection == "Longest Streak (select habit)":
+        if habit_name is not None:
+            require_habit(db, habit_name)
+            habit_selection = habit_name
+        else:
+            import inquirer
+            from resources.menus import create_habit_select_menu
 
-        # Show user selection of habits to choose from
-        habit_select_menu = create_habit_select_menu(choices)
-        habit_selection = inquirer.prompt(habit_select_menu)
-        habit_selection = habit_selection["selection"]
+            tasks = db.get_habit_names()
+            if not tasks:
+                print("No habits to display.  Please create some first.")
+                return
 
-        if habit_selection == "CANCEL":
-            print("Action canceled.")
-            return
+            choices = [t for task in tasks for t in task]
+            choices.append("CANCEL")
+
+            # Show user selection of habits to choose from
+            habit_select_menu = create_habit_select_menu(choices)
+            habit_selection = inquirer.prompt(habit_select_menu)
+            habit_selection = habit_selection["selection"]
 
+            if habit_selection == "CANCEL":
+                print("Action canceled.")
+                return
+
+        db.check_streaks()
         longest = db.get_longest_streak(habit_selection)
-        print(f"'{longest[0]}' -- {longest[2].upper()}: The longest streak for this habit is {longest[5]}.")
-        print(f"You started this habit on {longest[3]} and the current streak is {longest[4]}.")
+        if fmt != "table":
+            return write_rows([longest], HABIT_COLUMNS[:6], fmt)
+
+        print(f"'{longest.name}' -- {longest.interval.upper()}: The longest streak for this habit is "
+              f"{longest.max_streak}.")
+        print(f"You started this habit on {longest.created_date} and the current streak is {longest.streak_count}.")
+
+    elif selection.startswith("Completion Rates"):
+        by = "month" if selection.endswith("(monthly)") else "week"
+        rates = db.get_completion_rates(by, periods)
+        if fmt != "table":
+            return write_rows(rates, RATE_COLUMNS, fmt)
+
+        from resources.table import create_table
+        rows = [(name, interval, label, completions, "--" if rate is None else f"{rate}%")
+                for name, interval, label, completions, rate in rates]
+        print(create_table(title=f"Completion Rates by {by.capitalize()}",
+                           columns=["Habit Name", "Interval", by.capitalize(), "Completions", "Rate"], rows=rows))
+
+    elif selection == "Best Weekday":
+        from resources.rollups import WEEKDAYS
+
+        rows = []
+        for name, counts in db.get_weekday_counts().items():
+            best = WEEKDAYS[counts.index(max(counts))] if any(counts) else None
+            rows.append((name, *counts, best))
+        if fmt != "table":
+            return write_rows(rows, ["name"] + [day.lower() for day in WEEKDAYS] + ["best_weekday"], fmt)
+
+        from resources.table import create_table
+        print(create_table(title="Completions per Weekday", columns=["Habit Name"] + [day[:3] for day in WEEKDAYS] +
+                           ["Best Day"], rows=[row[:-1] + (row[-1] or "--",) for row in rows]))
+
+    elif selection == "Streak Distribution":
+        # Reset any streaks that were broken since they were last checked
+        db.check_streaks()
+        distribution = db.get_streak_distribution()
+        if fmt != "table":
+            return write_rows(distribution, ["streak_from", "streak_to", "current_streaks", "longest_streaks"], fmt)
+
+        from resources.table import create_table
+        rows = [(f"{low}+" if high is None else f"{low}" if low == high else f"{low}-{high}", current, longest)
+                for low, high, current, longest in distribution]
+        print(create_table(title="Streak Distribution", columns=["Streak Length", "Current Streaks",
+                                                                  "Longest Streaks"], rows=rows))
+
+    elif selection == "Rolling Adherence":
+        from resources.analytics import load_columns, rolling_adherence
+
+        dates, adherence = rolling_adherence(load_columns(db.cursor, user=db.user), window, periods)
+        rows = [(name, str(day), rate) for name, rates in adherence.items() for day, rate in zip(dates, rates)]
+        if fmt != "table":
+            return write_rows(rows, ["name", "date", "adherence"], fmt)
+
+        from resources.table import create_table
+        print(create_table(title=f"Rolling {window}-Day Adherence", columns=["Habit Name", "Date", "Adherence"],
+                           rows=[(name, day, f"{rate}%") for name, day, rate in rows]))
+
+    elif selection == "Completion Heatmap":
+        from resources.analytics import heatmap, load_columns
+        from resources.rollups import WEEKDAYS
+
+        if habit_name is not None:
+            require_habit(db, habit_name)
+        mondays, counts = heatmap(load_columns(db.cursor, user=db.user), periods, habit_name)
+        rows = [(str(monday), *week) for monday, week in zip(mondays, counts)]
+        if fmt != "table":
+            return write_rows(rows, ["week_start"] + [day.lower() for day in WEEKDAYS], fmt)
+
+        from resources.table import create_table
+        print(create_table(title=f"Completions of {habit_name or 'all habits'}",
+                           columns=["Week of"] + [day[:3] for day in WEEKDAYS],
+                           rows=[(monday, *(count or "." for count in week)) for monday, *week in rows]))
+
+    elif selection == "Streaks from History":
+        from resources.analytics import compute_streaks, load_columns
+
+        rows = [(name, *streaks) for name, streaks in compute_streaks(load_columns(db.cursor, user=db.user)).items()]
+        if fmt != "table":
+            return write_rows(rows, ["name", "current_streak", "longest_streak", "runs"], fmt)
+
+        from resources.table import create_table
+        print(create_table(title="Streaks from History", columns=["Habit Name", "Current Streak", "Longest Streak",
+                                                                   "Runs"], rows=rows))
 
     else:
         return "Invalid Selection, try again."
@@ -183,8 +523,11 @@ def analyze_habits():
 def modify_habits():
     """Allows the user to modify different attributes of the currently tracked habits in the database."""
 
-    # Create connection to the database and show habits to user
-    db = DBConn()
+    import inquirer
+    from resources.menus import create_habit_select_menu, create_modify_menu
+
+    # Get the connection to the database and show habits to user
+    db = get_connection()
     tasks = db.get_habit_names()
     if not tasks:
         print("No habits to display.  Please create some first.")
@@ -202,12 +545,11 @@ def modify_habits():
         return "Action canceled."
 
     # Prompt user for type of modification
-    answer = inquirer.prompt(modify_menu)
+    answer = inquirer.prompt(create_modify_menu())
 
     if answer["selection"] == "Change Name":
         new_value = click.prompt("Enter new name for habit")
-        if click.confirm(f"Update name of habit '{habit_selection}' to '{new_value}'?  "
-                         f"WARNING: Streak will be lost, it will still be attached to the old name."):
+        if click.confirm(f"Update name of habit '{habit_selection}' to '{new_value}'?"):
             msg = db.update_record(habit_selection, "name", new_value)
             return msg
         else:
@@ -221,8 +563,7 @@ def modify_habits():
             return
 
     if answer["selection"] == "Change Interval":
-        new_value = inquirer.prompt(interval_menu)
-        new_value = new_value["selection"]
+        new_value = prompt_interval()
         if click.confirm(f"Update interval of habit '{habit_selection}' to '{new_value}'"):
             msg = db.update_record(habit_selection, "interval", new_value)
             return msg
@@ -233,91 +574,258 @@ def modify_habits():
         return "Action canceled."
 
 
-def check_task_streak(tasks: list = None):
+def check_task_streak(tasks: list = None, interval: str = None, completed_as_bool: bool = False):
     """
     Checks the streak for all the tasks (default) or a list of tasks (if specified) and updates accordingly.
 
-    :param tasks: a list of tasks to check (optional)
-    :return: list of tasks from the database
+    :param tasks: a list of HabitRow to check (optional)
+    :param interval: interval of the tasks to check (optional)
+    :param completed_as_bool: set to True to add the completion status as True/False instead of a check mark
+    :return: list of the habit rows with the completion status added as last column
     """
 
-    # Create connection to the database
-    db = DBConn()
+    # Get the connection to the database
+    db = get_database()
     if tasks is None:
         tasks = db.get_all()
     if not tasks:
         print("No habits to display.  Please create some first.")
         return
 
-    # Set date information, so we can check if task was completed recently and if streak is still going
-    today = str(datetime.today().date())
-    yesterday = str(datetime.today().date() - timedelta(days=1))
-    this_week = datetime.today().isocalendar()[1]
-    last_week = this_week - 1
+    # Check the streaks of all habits at once; broken streaks are reset in the database
+    status = db.check_streaks(interval=interval)
 
-    # Fetch streak and task completion information and add it to list to display in table
+    # Add task completion information to list to display in table
+    rows = []
     for row in tasks:
+        completed, streak_broken = status.get(row.name, (False, False))
+        if completed_as_bool:
+            task_completion_status = completed
+        elif completed:
+            task_completion_status = "\N{heavy check mark} "
+        else:
+            task_completion_status = "\N{heavy multiplication x} "
+
+        if streak_broken:
+            row = row._replace(streak_count=0)
+
+        rows.append((*row, task_completion_status))
+
+    return rows
+
+
+def show_today(fmt: str = "table", pending_only: bool = False):
+    """
+    Show all the currently tracked habits in a table format.
+
+    :param fmt: output format; 'table' (default) or one of the machine-readable formats json, ndjson, csv
+    :param pending_only: set to True to only show the habits that are not completed in their current period yet
+    """
+
+    if pending_only:
+        # Only the pending habits are read from the database, so none of them is completed
+        status = False if fmt != "table" else "\N{heavy multiplication x} "
+        tasks = [(*row, status) for row in get_database().get_pending()]
+    elif fmt != "table":
+        # Checking if streak is maintained, the last column tells if the task was completed this period
+        tasks = get_database().get_all()
+        tasks = check_task_streak(tasks, completed_as_bool=True) if tasks else []
+    else:
+        # Checking if streak is maintained
+        tasks = check_task_streak()
+
+    if fmt != "table":
+        write_rows(tasks, HABIT_COLUMNS, fmt)
+        return
+
+    from resources.table import create_table
 
-        # Row[0] represents the habit name
-        records = db.get_history(row[0])
-        # Check interval/periodicity - row[2] represents interval
-        if row[2] == "Daily":
-            if today in records:
-                task_completion_status = "\N{heavy check mark} "
-                completed_today = True
-            else:
-                task_completion_status = "\N{heavy multiplication x} "
-                completed_today = False
-
-            row.append(task_completion_status)
-
-            # Check if Streak is maintained if habit currently has a streak
-            # row[4] represents the Streak Count column
-            if not row[4] == "0" and not completed_today:  # If it has a streak and not completed today
-                if yesterday not in records:  # Check the records for yesterday's date and if not, reset streak
-                    row[4] = "0"
-                    db.update_streak(row[0], reset_streak=True)  # row[0] is habit name
-
-        elif row[2] == "Weekly":
-            if str(this_week) in records:
-                task_completion_status = "\N{heavy check mark} "
-                completed_this_week = True
-            else:
-                task_completion_status = "\N{heavy multiplication x} "
-                completed_this_week = False
-
-            row.append(task_completion_status)
-
-            # Check if Streak is maintained if habit currently has a streak
-            # row[4] represents the Streak Count column
-            if not row[4] == "0" and not completed_this_week:  # If it has a streak and not completed this week
-                if str(last_week) not in records:  # Check the records for last week's number and if not, reset streak
-                    row[4] = "0"
-                    db.update_streak(row[0], reset_streak=True)  # row[0] is habit name
-
-    return tasks
-
-
-def show_today():
-    """Show all the currently tracked habits in a table format."""
-
-    # Checking if streak is maintained
-    tasks = check_task_streak()
     # Create a nice table to output to the user
     table = create_table(rows=tasks)
     print(table)
 
 
+def verify_streaks(repair: bool = False):
+    """
+    Compares the stored streaks of all habits with the streaks computed from the full completion history.
+
+    :param repair: set to True to rewrite the streaks that don't match the history
+    """
+
+    db = get_connection()
+    mismatches = db.recompute_streaks(verify=not repair)
+
+    if not mismatches:
+        print("All streaks match the completion history.")
+    elif repair:
+        print(f"Repaired the streak of {len(mismatches)} habit(s): {', '.join(mismatches)}")
+    else:
+        print(f"The streak of {len(mismatches)} habit(s) doesn't match the completion history: "
+              f"{', '.join(mismatches)}.  Run again with --repair to fix.")
+
+
+def import_history(filename: str, fmt: str = None):
+    """
+    Imports completion history from a CSV or JSONL file, streaming it into the database in a single transaction.
+
+    :param filename: name of the file, or '-' to read from standard input
+    :param fmt: 'csv' or 'jsonl'; guessed from the file extension by default
+    """
+
+    fmt = fmt or guess_format(filename)
+    db = get_connection()
+
+    with (nullcontext(sys.stdin) if filename == "-" else open(filename, newline="")) as file:
+        try:
+            count = db.bulk_add_history(read_history(file, fmt))
+        except ValueError as e:
+            return print(f"ERROR: {e}  No history was imported.")
+
+    print(f"{count} completion(s) imported successfully.")
+
+
+def export_history(filename: str, fmt: str = None, habit_name: str = None):
+    """
+    Exports the completion history to a CSV or JSONL file, streaming it from the database one row at a time.
+
+    :param filename: name of the file, or '-' to write to standard output
+    :param fmt: 'csv' or 'jsonl'; guessed from the file extension by default
+    :param habit_name: only export the history of this habit (optional)
+    """
+
+    fmt = fmt or guess_format(filename)
+    db = get_connection()
+
+    with closing(db.iter_history(habit_name)) as rows:
+        if filename == "-":
+            write_history(sys.stdout, rows, fmt)
+        else:
+            with open(filename, "w", newline="") as file:
+                count = write_history(file, rows, fmt)
+            print(f"{count} completion(s) exported to '{filename}'.")
+
+
+def time_queries(db, runs: int = 3):
+    """
+    Time the queries of the maintain report.
+
+    :param db: database connection
+    :param runs: number of runs of every query; the best time is kept
+    :return: dictionary of query name -> best time in milliseconds
+    """
+
+    times = {}
+    for name, query in MAINTENANCE_QUERIES.items():
+        best = float("inf")
+        for _ in range(runs):
+            start = perf_counter()
+            query(db)
+            best = min(best, perf_counter() - start)
+        times[name] = best * 1000
+    return times
+
+
+def maintain(keep_days: int = 365, archive: bool = True):
+    """
+    Archives the completions older than a number of days, deletes the rows of habits that no longer exist, compacts
+    the database and refreshes its query statistics, then shows the database size and query times before and after.
+
+    :param keep_days: completions older than this many days are archived
+    :param archive: set to False to keep all completions in the database
+    """
+
+    db = get_connection()
+    if not isinstance(db, DBConn):
+        raise click.ClickException("The maintain command is only available with the sqlite storage.")
+
+    size, times = db.file_size(), time_queries(db)
+
+    if archive:
+        # Archived from the Monday of the week, so no week is split between the archive and the database
+        before = db.archive_cutoff((date.today() - timedelta(days=keep_days)).isoformat())
+        archive_file = path.splitext(db.name)[0] + ".archive.jsonl.gz"
+        archived = db.archive_history(before, archive_file)
+        print(f"Archived {archived} completion(s) from before {before} to '{archive_file}'.")
+    print(f"Purged {db.purge_orphans()} row(s) of deleted habits.")
+    db.optimize()
+
+    from resources.table import create_table
+    rows = [("database size", f"{size / 1024:.0f} KiB", f"{db.file_size() / 1024:.0f} KiB")]
+    rows += [(name, f"{times[name]:.2f} ms", f"{after:.2f} ms") for name, after in time_queries(db).items()]
+    print(create_table(title="Maintenance", columns=["", "Before", "After"], rows=rows))
+
+
+def run_daemon(stop: bool = False):
+    """
+    Runs the tracker daemon until it is stopped, or stops the daemon that is running.
+
+    :param stop: set to True to stop the running daemon
+    """
+
+    client = get_client(user=connections.user)
+    if stop:
+        if client is None:
+            return print("No tracker daemon is running.")
+        client.shutdown()
+        return print("Tracker daemon stopped.")
+    if client is not None:
+        raise click.ClickException("A tracker daemon is already running.")
+
+    click.echo(f"Tracker daemon listening on '{SOCKET_PATH}', press Ctrl+C to stop.", err=True)
+    try:
+        serve(get_connection())
+    except DaemonError as e:
+        raise click.ClickException(str(e))
+
+
 def reset():
-    """Reset the app by deleting the database.  ***WARNING:  ALL DATA WILL BE LOST*** """
+    """
+    Reset the app by deleting all habits and history of the selected user.  The database itself is deleted once no
+    other users have data in it.  ***WARNING:  ALL DATA OF THE USER WILL BE LOST***
+    """
+
+    db = get_connection()
+    if any(user != db.user for user in db.get_users()) or not isinstance(db, DBConn):
+        db.delete_user()
+        return print(f"Deleted all habits and history of user '{db.user}'.")
+
+    connections.close()
     remove("main.db")
 
 
 @click.group()
-def cli():
+@click.option("--profile", type=click.Choice(list(PROFILES)), default="default", show_default=True,
+              envvar="HABIT_TRACKER_PROFILE",
+              help="Database durability/performance profile: 'safe' fsyncs every commit, 'default' uses a WAL "
+                   "journal so several trackers can share the database, 'fast' skips fsyncs.")
+@click.option("--user", default=DEFAULT_USER, show_default=True, envvar="HABIT_TRACKER_USER",
+              help="User whose habits are tracked; many users can share one database.")
+@click.option("--storage", type=click.Choice(STORAGES), default="sqlite", show_default=True,
+              envvar="HABIT_TRACKER_STORAGE",
+              help="Where the habits are kept: 'sqlite' in the main.db file, 'memory' only for this session, starting "
+                   "from the starter habits.")
+@click.pass_context
+def cli(ctx, profile, user, storage):
     """This little command-line app can be used to help you track your habits.  You can add, complete, and modify your
     habits, as well as see the history and your longest streaks.  Try using the interactive argument to get started."""
-    pass
+
+    # All commands share one database connection, which is closed as soon as the command finishes
+    connections.profile = profile
+    connections.user = user
+    connections.storage = storage
+    ctx.call_on_close(connections.close)
+    ctx.call_on_close(close_client)
+
+    # Set up the starter habits the first time the app is used
+    # The setup messages go to stderr, so they don't end up in machine-readable output
+    if storage == "memory":
+        from resources.starter import starter_habits
+        with redirect_stdout(sys.stderr):
+            starter_habits(storage=get_connection())
+    elif ctx.invoked_subcommand != "reset" and not path.exists("main.db"):
+        from resources.starter import starter_habits
+        with redirect_stdout(sys.stderr):
+            starter_habits(user=user)
 
 
 @cli.command("interactive")
@@ -327,14 +835,10 @@ def interactive_menu():
     them as much as you wish without having to call the main application with an argument like a traditional CLI.
 
     Use the arrow keys to change the selection and press ENTER to confirm selection."""
-    main_menu = [
-        inquirer.List(
-            "selection",
-            message="What would you like to do?",
-            choices=["Add Habit", "Complete Task", "Delete Habit", "Analyze Habits",
-                     "Modify Habits", "Show Today", "Show History", "Exit App"],
-        ),
-    ]
+    import inquirer
+    from resources.menus import create_main_menu
+
+    main_menu = create_main_menu()
 
     while True:
         sleep_time = 1.5
@@ -369,39 +873,69 @@ def interactive_menu():
 
 
 @cli.command("add-habit")
-def add_habit_command():
+@click.option("--name", default=None, help="Name of the habit; skips the prompts.")
+@click.option("--description", default="--", help="Description of the habit, used with --name.")
+@click.option("--interval", default="Daily", show_default=True, callback=validate_interval,
+              help=f"Interval of the habit, used with --name: {RULE_HELP}.")
+def add_habit_command(name, description, interval):
     """Add a habit to your habit list."""
-    add_habit()
+    add_habit(name, description, interval)
 
 
 @cli.command("delete-habit")
-def delete_habit_command():
+@click.option("--habit", "habit_name", default=None, help="Name of the habit; skips the habit menu.")
+@click.option("--yes", is_flag=True, help="Don't ask for confirmation.")
+def delete_habit_command(habit_name, yes):
     """Delete a habit from your habit list."""
-    delete_habit()
+    delete_habit(habit_name, confirm=not yes)
 
 
 @cli.command("show-history")
-def show_history_command():
+@click.option("--habit", "habit_name", default=None, help="Name of the habit, or ALL; skips the habit menu.")
+@click.option("--format", "fmt", type=click.Choice(["table"] + OUTPUT_FORMATS), default="table", show_default=True,
+              help="Output format; the machine-readable formats show ALL habits unless --habit is given.")
+@click.option("--since", type=click.DateTime(["%Y-%m-%d"]), default=None, help="Only show completions from this date.")
+@click.option("--until", type=click.DateTime(["%Y-%m-%d"]), default=None, help="Only show completions up to this date.")
+@click.option("--limit", type=click.IntRange(min=0), default=None, help="Show at most this many completions.")
+def show_history_command(habit_name, fmt, since, until, limit):
     """Show the history of your habits."""
-    show_history()
+    show_history(habit_name, fmt, since and since.strftime("%Y-%m-%d"), until and until.strftime("%Y-%m-%d"), limit)
 
 
 @cli.command("show-today")
-def show_today_command():
+@click.option("--format", "fmt", type=click.Choice(["table"] + OUTPUT_FORMATS), default="table", show_default=True,
+              help="Output format.")
+@click.option("--pending-only", is_flag=True, help="Only show the habits that are not completed yet.")
+def show_today_command(fmt, pending_only):
     """Shows your current habits list."""
-    show_today()
+    show_today(fmt, pending_only)
 
 
 @cli.command("complete-task")
-def complete_task_command():
+@click.option("--habit", "habit_name", default=None, help="Name of the habit; skips the habit menu.")
+@click.option("--at", type=click.DateTime(TIMESTAMP_FORMATS), default=None,
+              help="Date and time of the completion, e.g. '2023-01-31 18:30'; defaults to now.")
+def complete_task_command(habit_name, at):
     """Complete a task for a selected habit."""
-    complete_task()
+    complete_task(habit_name, at)
 
 
 @cli.command("analyze-habits")
-def analyze_habits_command():
+@click.option("--report", type=click.Choice(["daily", "weekly", "longest", "rates", "weekdays", "streaks", "adherence",
+                                            "heatmap", "runs"]),
+              default=None, help="Report to show; skips the analyze menu.")
+@click.option("--habit", "habit_name", default=None, help="Name of the habit for the longest and heatmap reports.")
+@click.option("--by", type=click.Choice(["week", "month"]), default="week", show_default=True,
+              help="Period of the rates report.")
+@click.option("--periods", type=click.IntRange(min=1), default=8, show_default=True,
+              help="Number of weeks/months in the rates report, or weeks in the adherence and heatmap reports.")
+@click.option("--window", type=click.IntRange(min=1), default=30, show_default=True,
+              help="Length in days of the rolling window of the adherence report.")
+@click.option("--format", "fmt", type=click.Choice(["table"] + OUTPUT_FORMATS), default="table", show_default=True,
+              help="Output format, used with --report.")
+def analyze_habits_command(report, habit_name, by, periods, window, fmt):
     """Show all Daily, Weekly, or streak info for your habits."""
-    analyze_habits()
+    analyze_habits(report, habit_name, fmt, by, periods, window)
 
 
 @cli.command("modify-habits")
@@ -410,13 +944,53 @@ def modify_habits_command():
     modify_habits()
 
 
+@cli.command("verify-streaks")
+@click.option("--repair", is_flag=True, help="Rebuild the streaks that don't match the completion history.")
+def verify_streaks_command(repair):
+    """Check the streaks of your habits against the full completion history."""
+    verify_streaks(repair)
+
+
+@cli.command("import-history")
+@click.argument("filename", type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), default=None,
+              help="Format of the file; guessed from the extension by default.")
+def import_history_command(filename, fmt):
+    """Import completion history from a CSV or JSONL file ('-' reads from stdin)."""
+    import_history(filename, fmt)
+
+
+@cli.command("export-history")
+@click.argument("filename", type=click.Path(dir_okay=False, allow_dash=True))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), default=None,
+              help="Format of the file; guessed from the extension by default.")
+@click.option("--habit", "habit_name", default=None, help="Only export the history of this habit.")
+def export_history_command(filename, fmt, habit_name):
+    """Export completion history to a CSV or JSONL file ('-' writes to stdout)."""
+    export_history(filename, fmt, habit_name)
+
+
+@cli.command("maintain")
+@click.option("--keep-days", type=click.IntRange(min=1), default=365, show_default=True,
+              help="Archive the completions older than this many days.")
+@click.option("--no-archive", is_flag=True, help="Keep all completions; only compact the database.")
+def maintain_command(keep_days, no_archive):
+    """Archive old completions and compact the database."""
+    maintain(keep_days, archive=not no_archive)
+
+
+@cli.command("serve")
+@click.option("--stop", is_flag=True, help="Stop the running daemon.")
+def serve_command(stop):
+    """Run a daemon that serves show-today, complete-task and show-history to the other commands."""
+    run_daemon(stop)
+
+
 @cli.command("reset")
 def reset_command():
-    """Reset the app by deleting the database.  ***WARNING:  ALL DATA WILL BE LOST*** """
+    """Reset the app by deleting your habits and history.  ***WARNING:  ALL YOUR DATA WILL BE LOST*** """
     reset()
 
 
 if __name__ == '__main__':
-    if not path.exists("main.db"):
-        starter_habits()
     cli()